@@ -6,6 +6,9 @@ from src.config import settings
 from src.db import Base
 import src.models
 import src.dq_models   # noqa: F401  (importa modelos para autogenerate)
+import src.ingestion_models   # noqa: F401
+import src.backup_models   # noqa: F401
+import src.idempotency_models   # noqa: F401
 
 config = context.config
 fileConfig(config.config_file_name)
@@ -0,0 +1,23 @@
+"""agrega file_id a ingestion_offsets (detección de rotación)
+
+Revision ID: 02cd83f673eb
+Revises: 9b18a4e5e278
+Create Date: 2026-10-19 23:41:18.552907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "02cd83f673eb"
+down_revision = "9b18a4e5e278"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # identidad del archivo (dispositivo:inodo) al confirmar el offset; NULL en filas previas
+    op.add_column("ingestion_offsets", sa.Column("file_id", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("ingestion_offsets", "file_id")
@@ -0,0 +1,29 @@
+"""agrega set_version a backup_catalog
+
+Revision ID: 36017247e19b
+Revises: c778066661ab
+Create Date: 2026-10-19 17:05:48.221904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "36017247e19b"
+down_revision = "c778066661ab"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("backup_catalog", sa.Column("set_version", sa.String(), nullable=True))
+    op.create_index(
+        "idx_backup_catalog_set_created",
+        "backup_catalog",
+        [sa.text("created_at DESC")],
+        postgresql_where=sa.text("set_version IS NOT NULL"),
+    )
+
+
+def downgrade():
+    op.drop_index("idx_backup_catalog_set_created", table_name="backup_catalog")
+    op.drop_column("backup_catalog", "set_version")
@@ -0,0 +1,27 @@
+"""indices para paginación keyset de dq_rejections
+
+Revision ID: 3bfd0a5e10cc
+Revises: ac4c6b35ae14
+Create Date: 2026-10-19 12:41:07.118930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "3bfd0a5e10cc"
+down_revision = "ac4c6b35ae14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (run_id, id) reemplaza a (run_id): mismo prefijo y además sirve el ORDER BY id del keyset
+    op.drop_index("idx_dq_rejections_run_id", table_name="dq_rejections")
+    op.create_index("idx_dq_rejections_run_id_id", "dq_rejections", ["run_id", "id"])
+    op.create_index("idx_dq_rejections_table_reason_id", "dq_rejections", ["table_name", "reason", "id"])
+
+
+def downgrade():
+    op.drop_index("idx_dq_rejections_table_reason_id", table_name="dq_rejections")
+    op.drop_index("idx_dq_rejections_run_id_id", table_name="dq_rejections")
+    op.create_index("idx_dq_rejections_run_id", "dq_rejections", ["run_id"])
@@ -0,0 +1,30 @@
+"""agrega id a los índices de hired_employees (keyset datetime, id)
+
+Revision ID: 3d5449a8d50d
+Revises: b54939f6f80b
+Create Date: 2026-10-19 18:58:40.117302
+
+"""
+from alembic import op
+
+revision = "3d5449a8d50d"
+down_revision = "b54939f6f80b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # id como última columna: el keyset (datetime, id) de GET /hired-employees es un rango del índice
+    op.drop_index("idx_hired_datetime", table_name="hired_employees")
+    op.drop_index("idx_hired_dept_job_datetime", table_name="hired_employees")
+    op.create_index("idx_hired_datetime", "hired_employees", ["datetime", "id"], unique=False)
+    op.create_index(
+        "idx_hired_dept_job_datetime", "hired_employees", ["department_id", "job_id", "datetime", "id"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("idx_hired_dept_job_datetime", table_name="hired_employees")
+    op.drop_index("idx_hired_datetime", table_name="hired_employees")
+    op.create_index("idx_hired_datetime", "hired_employees", ["datetime"], unique=False)
+    op.create_index("idx_hired_dept_job_datetime", "hired_employees", ["department_id", "job_id", "datetime"], unique=False)
@@ -0,0 +1,29 @@
+"""checkpoints por archivo (ingesta multi-archivo)
+
+Revision ID: 9b18a4e5e278
+Revises: 3d5449a8d50d
+Create Date: 2026-10-19 20:14:02.386514
+
+"""
+from alembic import op
+
+revision = "9b18a4e5e278"
+down_revision = "3d5449a8d50d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # una corrida multi-archivo tiene un checkpoint por archivo con el mismo run_id
+    op.drop_constraint("ingestion_checkpoints_pkey", "ingestion_checkpoints", type_="primary")
+    op.create_primary_key("ingestion_checkpoints_pkey", "ingestion_checkpoints", ["run_id", "table_name", "source"])
+    # archivos ya procesados (skip_processed / watcher)
+    op.create_index(
+        "idx_ingestion_checkpoints_table_source", "ingestion_checkpoints", ["table_name", "source", "status"]
+    )
+
+
+def downgrade():
+    op.drop_index("idx_ingestion_checkpoints_table_source", table_name="ingestion_checkpoints")
+    op.drop_constraint("ingestion_checkpoints_pkey", "ingestion_checkpoints", type_="primary")
+    op.create_primary_key("ingestion_checkpoints_pkey", "ingestion_checkpoints", ["run_id", "table_name"])
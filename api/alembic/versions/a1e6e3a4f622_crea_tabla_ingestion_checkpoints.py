@@ -0,0 +1,41 @@
+"""crea tabla ingestion_checkpoints
+
+Revision ID: a1e6e3a4f622
+Revises: e9e683655b74
+Create Date: 2026-10-19 10:03:55.871240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "a1e6e3a4f622"
+down_revision = "e9e683655b74"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ingestion_checkpoints",
+        sa.Column("run_id", sa.String(), nullable=False),
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column("source", sa.String(), nullable=False),
+        sa.Column("mode", sa.String(), nullable=False),
+        sa.Column("byte_offset", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("line_number", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("batches", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("inserted", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("rejected", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("reasons", sa.JSON(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("started_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("run_id", "table_name"),
+    )
+    op.create_index("idx_ingestion_checkpoints_status", "ingestion_checkpoints", ["status"])
+
+
+def downgrade():
+    op.drop_index("idx_ingestion_checkpoints_status", table_name="ingestion_checkpoints")
+    op.drop_table("ingestion_checkpoints")
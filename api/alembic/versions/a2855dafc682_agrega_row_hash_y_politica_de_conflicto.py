@@ -0,0 +1,44 @@
+"""agrega row_hash a tablas de negocio y política de conflicto al checkpoint
+
+Revision ID: a2855dafc682
+Revises: 3bfd0a5e10cc
+Create Date: 2026-10-19 14:02:31.540117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "a2855dafc682"
+down_revision = "3bfd0a5e10cc"
+branch_labels = None
+depends_on = None
+
+# Misma expresión que src/validation.row_hash_sql (columnas no clave; datetime en UTC)
+ROW_HASH = {
+    "departments": "md5(json_build_array(department)::text)::uuid",
+    "jobs": "md5(json_build_array(job)::text)::uuid",
+    "hired_employees": (
+        "md5(json_build_array(name, "
+        "to_char(datetime AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US'), "
+        "department_id, job_id)::text)::uuid"
+    ),
+}
+
+
+def upgrade():
+    for table, expr in ROW_HASH.items():
+        op.add_column(table, sa.Column("row_hash", postgresql.UUID(as_uuid=False), nullable=True))
+        # backfill: sin esto la primera carga con update_if_changed reescribiría todo
+        op.execute(f"UPDATE {table} SET row_hash = {expr}")
+
+    op.add_column(
+        "ingestion_checkpoints",
+        sa.Column("conflict", sa.String(), server_default="ignore", nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("ingestion_checkpoints", "conflict")
+    for table in reversed(list(ROW_HASH)):
+        op.drop_column(table, "row_hash")
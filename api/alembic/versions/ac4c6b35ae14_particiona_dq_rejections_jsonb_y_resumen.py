@@ -0,0 +1,147 @@
+"""particiona dq_rejections por created_at, row_data a jsonb y tabla resumen
+
+Revision ID: ac4c6b35ae14
+Revises: a1e6e3a4f622
+Create Date: 2026-10-19 11:20:14.553102
+
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "ac4c6b35ae14"
+down_revision = "a1e6e3a4f622"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 2
+
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # 1) Liberar nombres de la tabla actual (se copia y se elimina al final)
+    op.execute("ALTER TABLE dq_rejections RENAME TO dq_rejections_legacy")
+    op.execute("ALTER TABLE dq_rejections_legacy RENAME CONSTRAINT dq_rejections_pkey TO dq_rejections_legacy_pkey")
+    op.execute(
+        "ALTER TABLE dq_rejections_legacy RENAME CONSTRAINT uq_dq_rejections_run_hash_reason "
+        "TO uq_dq_rejections_legacy_run_hash_reason"
+    )
+    op.execute("ALTER INDEX idx_dq_rejections_created_at RENAME TO idx_dq_rejections_legacy_created_at")
+    op.execute("ALTER INDEX idx_dq_rejections_run_id RENAME TO idx_dq_rejections_legacy_run_id")
+
+    # 2) Tabla particionada por rango mensual de created_at.
+    #    La clave de partición debe estar en PK y UNIQUE: la dedup (run_id,row_hash,reason)
+    #    pasa a ser por transacción (created_at = now() es constante dentro de ella).
+    op.execute(
+        """
+        CREATE TABLE dq_rejections (
+            id BIGSERIAL NOT NULL,
+            source VARCHAR NOT NULL,
+            table_name VARCHAR NOT NULL,
+            reason VARCHAR NOT NULL,
+            row_data JSONB NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            run_id VARCHAR NOT NULL,
+            row_hash VARCHAR NOT NULL,
+            CONSTRAINT dq_rejections_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT uq_dq_rejections_run_hash_reason UNIQUE (run_id, row_hash, reason, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("CREATE TABLE dq_rejections_default PARTITION OF dq_rejections DEFAULT")
+    op.create_index("idx_dq_rejections_created_at", "dq_rejections", ["created_at"])
+    op.create_index("idx_dq_rejections_run_id", "dq_rejections", ["run_id"])
+
+    # 3) Particiones mensuales desde el rechazo más antiguo hasta MONTHS_AHEAD meses adelante
+    oldest = conn.execute(sa.text("SELECT min(created_at) FROM dq_rejections_legacy")).scalar()
+    today = datetime.now(timezone.utc).date().replace(day=1)
+    start = oldest.date().replace(day=1) if oldest else today
+    end = _add_months(today, MONTHS_AHEAD + 1)
+    month = start
+    while month < end:
+        nxt = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE dq_rejections_p{month:%Y%m} PARTITION OF dq_rejections "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{nxt.isoformat()}')"
+        )
+        month = nxt
+
+    # 4) Copiar histórico y eliminar la tabla anterior
+    op.execute(
+        "INSERT INTO dq_rejections (id, source, table_name, reason, row_data, created_at, run_id, row_hash) "
+        "SELECT id, source, table_name, reason, row_data::jsonb, created_at, run_id, row_hash "
+        "FROM dq_rejections_legacy"
+    )
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('dq_rejections', 'id'), "
+        "COALESCE((SELECT max(id) FROM dq_rejections), 0) + 1, false)"
+    )
+    op.drop_table("dq_rejections_legacy")
+
+    # 5) Resumen por corrida: el desglose por motivo no escanea rechazos crudos
+    op.create_table(
+        "dq_rejection_summary",
+        sa.Column("run_id", sa.String(), nullable=False),
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column("reason", sa.String(), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("run_id", "table_name", "reason"),
+    )
+    op.create_index("idx_dq_rejection_summary_table_reason", "dq_rejection_summary", ["table_name", "reason"])
+    op.execute(
+        "INSERT INTO dq_rejection_summary (run_id, table_name, reason, count) "
+        "SELECT run_id, table_name, reason, COUNT(*) FROM dq_rejections GROUP BY run_id, table_name, reason"
+    )
+
+
+def downgrade():
+    op.drop_index("idx_dq_rejection_summary_table_reason", table_name="dq_rejection_summary")
+    op.drop_table("dq_rejection_summary")
+
+    op.execute("ALTER TABLE dq_rejections RENAME TO dq_rejections_partitioned")
+    op.execute("ALTER INDEX idx_dq_rejections_created_at RENAME TO idx_dq_rejections_partitioned_created_at")
+    op.execute("ALTER INDEX idx_dq_rejections_run_id RENAME TO idx_dq_rejections_partitioned_run_id")
+    op.execute(
+        "ALTER TABLE dq_rejections_partitioned RENAME CONSTRAINT dq_rejections_pkey TO dq_rejections_partitioned_pkey"
+    )
+    op.execute(
+        "ALTER TABLE dq_rejections_partitioned RENAME CONSTRAINT uq_dq_rejections_run_hash_reason "
+        "TO uq_dq_rejections_partitioned_run_hash_reason"
+    )
+
+    op.create_table(
+        "dq_rejections",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("source", sa.String(), nullable=False),
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column("reason", sa.String(), nullable=False),
+        sa.Column("row_data", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("run_id", sa.String(), nullable=False),
+        sa.Column("row_hash", sa.String(), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO dq_rejections (id, source, table_name, reason, row_data, created_at, run_id, row_hash) "
+        "SELECT DISTINCT ON (run_id, row_hash, reason) id, source, table_name, reason, row_data::json, created_at, run_id, row_hash "
+        "FROM dq_rejections_partitioned ORDER BY run_id, row_hash, reason, id"
+    )
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('dq_rejections', 'id'), "
+        "COALESCE((SELECT max(id) FROM dq_rejections), 0) + 1, false)"
+    )
+    op.create_index("idx_dq_rejections_created_at", "dq_rejections", ["created_at"])
+    op.create_index("idx_dq_rejections_run_id", "dq_rejections", ["run_id"])
+    op.create_unique_constraint(
+        "uq_dq_rejections_run_hash_reason",
+        "dq_rejections",
+        ["run_id", "row_hash", "reason"],
+    )
+    op.execute("DROP TABLE dq_rejections_partitioned")
@@ -0,0 +1,24 @@
+"""agrega updated y skipped a ingestion_checkpoints
+
+Revision ID: b95a6f5d6add
+Revises: a2855dafc682
+Create Date: 2026-10-19 15:10:44.302918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "b95a6f5d6add"
+down_revision = "a2855dafc682"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("ingestion_checkpoints", sa.Column("updated", sa.BigInteger(), server_default="0", nullable=False))
+    op.add_column("ingestion_checkpoints", sa.Column("skipped", sa.BigInteger(), server_default="0", nullable=False))
+
+
+def downgrade():
+    op.drop_column("ingestion_checkpoints", "skipped")
+    op.drop_column("ingestion_checkpoints", "updated")
@@ -0,0 +1,45 @@
+"""crea tabla backup_catalog
+
+Revision ID: c778066661ab
+Revises: b95a6f5d6add
+Create Date: 2026-10-19 16:22:09.648331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "c778066661ab"
+down_revision = "b95a6f5d6add"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "backup_catalog",
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column("version", sa.String(), nullable=False),
+        sa.Column("run_id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("row_count", sa.BigInteger(), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("checksum", sa.String(), nullable=True),
+        sa.Column("format", sa.String(), server_default="avro", nullable=False),
+        sa.Column("codec", sa.String(), server_default="null", nullable=False),
+        sa.Column("min_ts", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("max_ts", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("registered_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("table_name", "version"),
+    )
+    op.create_index(
+        "idx_backup_catalog_table_created",
+        "backup_catalog",
+        ["table_name", sa.text("created_at DESC")],
+    )
+    # Los backups previos se registran con POST /backups/sync (lee BACKUP_ROOT una sola vez)
+
+
+def downgrade():
+    op.drop_index("idx_backup_catalog_table_created", table_name="backup_catalog")
+    op.drop_table("backup_catalog")
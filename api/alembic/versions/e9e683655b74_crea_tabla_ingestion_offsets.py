@@ -0,0 +1,30 @@
+"""crea tabla ingestion_offsets
+
+Revision ID: e9e683655b74
+Revises: 826920471c16
+Create Date: 2026-10-19 09:12:31.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "e9e683655b74"
+down_revision = "826920471c16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ingestion_offsets",
+        sa.Column("source", sa.String(), primary_key=True),
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column("byte_offset", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("line_number", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("run_id", sa.String(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("ingestion_offsets")
@@ -0,0 +1,77 @@
+"""
+Benchmark: lectura de hired_employees con CsvFile (mmap + tuplas) vs la lectura
+anterior (Sniffer + csv.DictReader, un dict por fila), incluyendo la validación.
+
+Uso (desde api/):
+    python -m benchmarks.bench_csv_reader --rows 1000000
+"""
+import argparse
+import csv
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from src.csv_reader import CsvFile
+from src.validation import get_validator
+
+HEADERS = ["id", "name", "datetime", "department_id", "job_id"]
+
+
+def _write_csv(path: Path, n: int, seed: int = 5) -> None:
+    rnd = random.Random(seed)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        f.write(",".join(HEADERS) + "\n")
+        for i in range(1, n + 1):
+            f.write(
+                f"{i},Empleado {i},2021-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T"
+                f"{rnd.randint(0, 23):02d}:00:00Z,{rnd.randint(1, 12)},{rnd.randint(1, 183)}\n"
+            )
+
+
+# --- implementación anterior (línea base) ---
+def legacy_read(path: Path) -> int:
+    validator = get_validator("hired_employees")
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        dialect = csv.Sniffer().sniff(f.read(4096), delimiters=",;|\t")
+        f.seek(0)
+        parsed, _, _ = validator.validate_rows(csv.DictReader(f, dialect=dialect))
+    return len(parsed)
+
+
+def mmap_read(path: Path) -> int:
+    validator = get_validator("hired_employees", positional=True)
+    with CsvFile(path, HEADERS) as csv_file:
+        parsed, _, _ = validator.validate_rows(csv_file.rows())
+    return len(parsed)
+
+
+def _time(fn: Callable[[Path], int], path: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(path)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "hired_employees.csv"
+        _write_csv(path, args.rows)
+        assert legacy_read(path) == mmap_read(path) == args.rows
+
+        base = _time(legacy_read, path, args.repeat)
+        new = _time(mmap_read, path, args.repeat)
+        print(f"rows={args.rows} (mejor de {args.repeat})")
+        print(f"  DictReader {base:6.3f}s  CsvFile {new:6.3f}s  x{base / new:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: parsers de src/parsers.py vs las versiones anteriores (_parse_int /
+_parse_datetime con strip + slicing de la Z + fromisoformat, sin zona).
+
+Uso (desde api/):
+    python -m benchmarks.bench_parsers --rows 1000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+from typing import Any, Callable, List
+
+from src.parsers import memoized, parse_datetime, parse_int
+
+
+# --- implementación anterior (línea base) ---
+def legacy_parse_int(v: Any):
+    if v is None:
+        return None
+    s = str(v).strip()
+    if s == "":
+        return None
+    try:
+        return int(s)
+    except ValueError:
+        return None
+
+
+def legacy_parse_datetime(v: Any):
+    if v is None:
+        return None
+    s = str(v).strip()
+    if s == "":
+        return None
+    try:
+        if s.endswith("Z"):
+            s = s[:-1]
+        return datetime.fromisoformat(s)
+    except ValueError:
+        return None
+
+
+def _timestamps(n: int, distinct: int, seed: int = 11) -> List[str]:
+    rnd = random.Random(seed)
+    pool = [
+        f"2021-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T"
+        f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}Z"
+        for _ in range(distinct)
+    ]
+    return [pool[rnd.randrange(distinct)] for _ in range(n)]
+
+
+def _time(fn: Callable[[Any], Any], values: List[Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for v in values:
+            fn(v)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--memo-size", type=int, default=65536)
+    args = ap.parse_args()
+    n = args.rows
+
+    ints = [str(random.Random(3).randint(1, 10_000_000)) for _ in range(n)]
+    cases = {
+        "datetime (casi únicos)": _timestamps(n, n),
+        "datetime (1k distintos)": _timestamps(n, 1000),
+    }
+
+    print(f"rows={n} (mejor de {args.repeat})")
+    base = _time(legacy_parse_int, ints, args.repeat)
+    new = _time(parse_int, ints, args.repeat)
+    print(f"  int                      legacy {base:6.3f}s  nuevo {new:6.3f}s  x{base / new:.2f}")
+
+    for label, values in cases.items():
+        # mismo instante; la versión nueva además es aware (UTC)
+        assert all(legacy_parse_datetime(v) == parse_datetime(v).replace(tzinfo=None) for v in values[:1000])
+        base = _time(legacy_parse_datetime, values, args.repeat)
+        new = _time(parse_datetime, values, args.repeat)
+        memo = _time(memoized(parse_datetime, args.memo_size), values, 1)
+        print(
+            f"  {label:<24} legacy {base:6.3f}s  nuevo {new:6.3f}s  x{base / new:.2f}  "
+            f"con memo {memo:6.3f}s  x{base / memo:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
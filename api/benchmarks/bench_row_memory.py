@@ -0,0 +1,72 @@
+"""
+Benchmark de memoria: bytes por fila retenidos por la fase de parseo/validación de
+hired_employees (todo el archivo en memoria, como la ingesta de dimensiones).
+
+- antes: DictReader -> dict(row) crudo + tupla de 6 (que referencia el crudo) + un dict
+  nuevo por fila válida para el insert.
+- ahora: CsvFile (tuplas) -> ParsedRows (tupla de valores por fila, sin la fila original)
+  -> arrays por columna para el insert de cada lote.
+
+Uso (desde api/):
+    python -m benchmarks.bench_row_memory --rows 200000
+"""
+import argparse
+import csv
+import gc
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Tuple
+
+from benchmarks.bench_csv_reader import HEADERS, _write_csv
+from benchmarks.bench_validation import legacy_validate
+from src.csv_reader import CsvFile
+from src.validation import get_validator
+
+
+def legacy_pipeline(path: Path) -> Any:
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        parsed_rows, rejects, _ = legacy_validate(csv.DictReader(f))
+    valid_rows = [
+        {"id": i, "name": n, "datetime": dt, "department_id": d, "job_id": j}
+        for _, i, n, dt, d, j in parsed_rows
+    ]
+    return parsed_rows, rejects, valid_rows
+
+
+def compact_pipeline(path: Path) -> Any:
+    validator = get_validator("hired_employees", positional=True)
+    with CsvFile(path, HEADERS) as csv_file:
+        parsed, rejects, _ = validator.validate_rows(csv_file.rows())
+    return parsed, rejects
+
+
+def _measure(fn: Callable[[Path], Any], path: Path) -> Tuple[int, int]:
+    """(bytes retenidos por el resultado, pico) medidos con tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    result = fn(path)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    args = ap.parse_args()
+    n = args.rows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "hired_employees.csv"
+        _write_csv(path, n)
+
+        print(f"rows={n}")
+        for label, fn in (("antes (dicts)", legacy_pipeline), ("ahora (tuplas)", compact_pipeline)):
+            retained, peak = _measure(fn, path)
+            print(f"  {label:<16} retenido {retained / n:7.1f} B/fila   pico {peak / n:7.1f} B/fila")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: latencia de /transactions (hired_employees) con 1, 10 y 1000 filas por request.
+
+Compara el camino caliente (validación, lookups de FK, merge y commit) en dos variantes:
+- text:     text() en cada request y un lookup por tabla referenciada (como antes)
+- prepared: sentencias preparadas por conexión (src/prepared.py) y lookups de FK fusionados
+
+psycopg2 no tiene pipeline mode; la reducción de round-trips viene de fusionar los lookups
+(3 -> 2 statements por request, sin contar el commit) y de no re-parsear el SQL.
+
+Uso (desde api/, contra un Postgres local descartable; trabaja en el schema bench_tx):
+    python -m benchmarks.bench_transaction_latency --sizes 1 10 1000 --requests 500
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import src.models  # noqa: F401  (registra las tablas en Base.metadata)
+from src import prepared
+from src.config import settings
+from src.db import Base
+from src.validation import ReferenceResolver, get_validator
+
+SCHEMA = "bench_tx"
+TABLES = ["departments", "jobs", "hired_employees"]
+
+
+def setup(engine, departments: int, jobs: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        tables = [Base.metadata.tables[t] for t in TABLES]
+        Base.metadata.create_all(conn.execution_options(schema_translate_map={None: SCHEMA}), tables=tables)
+        conn.execute(
+            text("INSERT INTO departments (id, department) SELECT g, 'Department ' || g FROM generate_series(1, :n) g"),
+            {"n": departments},
+        )
+        conn.execute(text("INSERT INTO jobs (id, job) SELECT g, 'Job ' || g FROM generate_series(1, :n) g"), {"n": jobs})
+
+
+def make_rows(start_id: int, n: int, departments: int, jobs: int) -> List[Dict[str, str]]:
+    base = datetime(2021, 1, 1)
+    return [
+        {
+            "id": str(i),
+            "name": f"Empleado {i}",
+            "datetime": (base + timedelta(minutes=i)).isoformat() + "Z",
+            "department_id": str(1 + i % departments),
+            "job_id": str(1 + i % jobs),
+        }
+        for i in range(start_id, start_id + n)
+    ]
+
+
+def run_request(Session, rows: List[Dict[str, str]], mode: str) -> None:
+    validator = get_validator("hired_employees")
+    parsed, rejects, reasons = validator.validate_rows(rows)
+    with Session() as session:
+        if mode == "text":
+            # un round-trip por tabla referenciada, como antes de fusionar los lookups
+            resolver = ReferenceResolver()
+            for ref in validator.spec.references:
+                i = validator.spec.columns.index(ref.field)
+                resolver.existing(session, ref.table, {v[i] for v in parsed.values})
+            valid = validator.check_references(session, parsed, rows, rejects, reasons, resolver)
+        else:
+            valid = validator.check_references(session, parsed, rows, rejects, reasons)
+        validator.merge(session, valid, "ignore")
+        session.commit()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--database-url", default=settings.database_url)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 1000])
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--departments", type=int, default=12)
+    ap.add_argument("--jobs", type=int, default=183)
+    args = ap.parse_args()
+
+    engine = create_engine(
+        args.database_url, pool_size=1, connect_args={"options": f"-c search_path={SCHEMA}"}
+    )
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    setup(engine, args.departments, args.jobs)
+
+    next_id = 1
+    print(f"{'filas':>6} {'modo':<9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    try:
+        for size in args.sizes:
+            p50 = {}
+            for mode in ("text", "prepared"):
+                prepared.PREPARED_STATEMENTS = mode == "prepared"
+                times = []
+                for n in range(args.warmup + args.requests):
+                    # ids nuevos en cada request: mide inserts reales, no conflictos
+                    rows = make_rows(next_id, size, args.departments, args.jobs)
+                    next_id += size
+                    t0 = time.perf_counter()
+                    run_request(Session, rows, mode)
+                    if n >= args.warmup:
+                        times.append((time.perf_counter() - t0) * 1000)
+                q = statistics.quantiles(times, n=100)
+                p50[mode] = statistics.median(times)
+                print(f"{size:>6} {mode:<9} {p50[mode]:>9.3f} {q[94]:>9.3f} {q[98]:>9.3f}")
+            print(f"{'':>6} speedup p50 x{p50['text'] / p50['prepared']:.2f}")
+    finally:
+        engine.dispose()
+        with create_engine(args.database_url).begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark: validador compilado (src/validation.py) vs el loop escrito a mano que
+tenían ingest_hired_employees / process_transaction (fase de tipos + obligatoriedad).
+
+Uso (desde api/):
+    python -m benchmarks.bench_validation --rows 1000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from src.validation import get_validator
+
+
+# --- implementación anterior (copiada tal cual, como línea base) ---
+def _legacy_parse_int(v: Any):
+    if v is None:
+        return None
+    s = str(v).strip()
+    if s == "":
+        return None
+    try:
+        return int(s)
+    except ValueError:
+        return None
+
+
+def _legacy_parse_datetime(v: Any):
+    if v is None:
+        return None
+    s = str(v).strip()
+    if s == "":
+        return None
+    try:
+        if s.endswith("Z"):
+            s = s[:-1]
+        return datetime.fromisoformat(s)
+    except ValueError:
+        return None
+
+
+def _bump(reasons: Dict[str, int], key: str) -> None:
+    reasons[key] = reasons.get(key, 0) + 1
+
+
+def legacy_validate(rows: List[Dict[str, Any]]):
+    reasons: Dict[str, int] = {}
+    rejects = []
+    parsed_rows = []
+    for r in rows:
+        raw = dict(r)
+        emp_id = _legacy_parse_int(raw.get("id"))
+        name = (raw.get("name") or "").strip()
+        dt = _legacy_parse_datetime(raw.get("datetime"))
+        dept_id = _legacy_parse_int(raw.get("department_id"))
+        job_id = _legacy_parse_int(raw.get("job_id"))
+
+        if emp_id is None:
+            rejects.append(("invalid_id", raw)); _bump(reasons, "invalid_id"); continue
+        if not name:
+            rejects.append(("empty_name", raw)); _bump(reasons, "empty_name"); continue
+        if dt is None:
+            rejects.append(("invalid_datetime", raw)); _bump(reasons, "invalid_datetime"); continue
+        if dept_id is None:
+            rejects.append(("missing_department_id", raw)); _bump(reasons, "missing_department_id"); continue
+        if job_id is None:
+            rejects.append(("missing_job_id", raw)); _bump(reasons, "missing_job_id"); continue
+
+        parsed_rows.append((raw, emp_id, name, dt, dept_id, job_id))
+    return parsed_rows, rejects, reasons
+
+
+def make_rows(n: int, invalid_ratio: float, seed: int = 7) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        row = {
+            "id": str(i + 1),
+            "name": f"Employee {i}",
+            "datetime": f"2021-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00Z",
+            "department_id": str(rnd.randint(1, 12)),
+            "job_id": str(rnd.randint(1, 183)),
+        }
+        if rnd.random() < invalid_ratio:
+            row[rnd.choice(["name", "datetime", "department_id", "job_id"])] = ""
+        rows.append(row)
+    return rows
+
+
+def _time(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--invalid-ratio", type=float, default=0.05)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    rows = make_rows(args.rows, args.invalid_ratio)
+    first = get_validator("hired_employees", False)
+    every = get_validator("hired_employees", True)
+
+    # misma clasificación que la implementación anterior
+    _, legacy_rejects, legacy_reasons = legacy_validate(rows)
+    _, new_rejects, new_reasons = first.validate_rows(rows)
+    assert legacy_reasons == new_reasons and len(legacy_rejects) == len(new_rejects)
+
+    results = {
+        "legacy_loop": _time(legacy_validate, rows, args.repeat),
+        "compiled_first_reason": _time(first.validate_rows, rows, args.repeat),
+        "compiled_all_reasons": _time(every.validate_rows, rows, args.repeat),
+    }
+    base = results["legacy_loop"]
+    print(f"rows={args.rows} invalid_ratio={args.invalid_ratio} (mejor de {args.repeat})")
+    for name, secs in results.items():
+        print(f"  {name:<24} {secs:8.3f}s  {args.rows / secs:>12,.0f} filas/s  x{base / secs:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Regresión de planes para sql/metrics.sql (Métrica A y B).
+
+Carga volúmenes sintéticos de hired_employees en un schema aparte (mismo DDL e índices
+que src/models.py), corre EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) de cada métrica y
+registra forma del plan, buffers y tiempo. Falla (exit 1) ante cualquier Seq Scan sobre
+hired_employees (aunque no haya baseline; --allow-seq-scan lo tolera salvo que el baseline
+no lo tuviera) o si el tiempo empeora más allá del umbral respecto del baseline.
+Los índices candidatos (p.ej. covering con INCLUDE) se evalúan igual, contra el plan actual.
+
+Uso (desde api/, contra un Postgres local descartable):
+    python -m benchmarks.plan_regression --rows 1000000 10000000
+    python -m benchmarks.plan_regression --rows 1000000 --update-baseline
+    python -m benchmarks.plan_regression --rows 1000000 \\
+        --candidate "CREATE INDEX idx_cand ON hired_employees (datetime) INCLUDE (department_id, job_id)"
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection
+
+import src.models  # noqa: F401  (registra las tablas en Base.metadata)
+from src.config import settings
+from src.db import Base
+
+SCHEMA = "plan_regression"
+METRICS_SQL = Path(__file__).resolve().parents[2] / "sql" / "metrics.sql"
+BASELINE = Path(__file__).resolve().parent / "plan_baseline.json"
+TABLES = ["departments", "jobs", "hired_employees"]
+
+
+def load_metrics(path: Path = METRICS_SQL) -> Dict[str, str]:
+    """{"metric_a": sql, "metric_b": sql} a partir de los encabezados '-- MÉTRICA X' del archivo."""
+    content = path.read_text(encoding="utf-8-sig")
+    metrics = {}
+    for match in re.finditer(r"^-- MÉTRICA (\w)\s*$", content, flags=re.MULTILINE):
+        body = content[match.end():]
+        # el statement empieza en la primera línea que no es comentario y termina en el primer ';'
+        lines = [ln for ln in body.split(";", 1)[0].splitlines() if not ln.lstrip().startswith("--")]
+        metrics[f"metric_{match.group(1).lower()}"] = "\n".join(lines).strip()
+    if not metrics:
+        raise SystemExit(f"no se encontraron métricas en {path}")
+    return metrics
+
+
+def create_schema(conn: Connection) -> None:
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    tables = [Base.metadata.tables[t] for t in TABLES]
+    Base.metadata.create_all(
+        conn.execution_options(schema_translate_map={None: SCHEMA}), tables=tables
+    )
+
+
+def load_volume(conn: Connection, rows: int, departments: int, jobs: int, start: str, years: int) -> None:
+    # generación del lado del servidor: sin transferir filas desde Python
+    conn.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+    conn.execute(
+        text("INSERT INTO departments (id, department) SELECT g, 'Department ' || g FROM generate_series(1, :n) g"),
+        {"n": departments},
+    )
+    conn.execute(text("INSERT INTO jobs (id, job) SELECT g, 'Job ' || g FROM generate_series(1, :n) g"), {"n": jobs})
+    conn.execute(
+        text(
+            "INSERT INTO hired_employees (id, name, datetime, department_id, job_id) "
+            "SELECT g, 'Employee ' || g, "
+            "CAST(:start AS timestamptz) + random() * (CAST(:years AS int) * interval '365 days'), "
+            "1 + floor(random() * :departments)::int, 1 + floor(random() * :jobs)::int "
+            "FROM generate_series(1, :rows) g"
+        ),
+        {"rows": rows, "departments": departments, "jobs": jobs, "start": start, "years": years},
+    )
+
+
+def vacuum_analyze(engine) -> None:
+    # VACUUM fuera de transacción: deja el visibility map listo para index-only scans
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in TABLES:
+            conn.execute(text(f"VACUUM ANALYZE {SCHEMA}.{table}"))
+
+
+def _walk(node: Dict[str, Any], depth: int = 0) -> List[Dict[str, Any]]:
+    out = [{
+        "depth": depth,
+        "node": node["Node Type"],
+        "relation": node.get("Relation Name"),
+        "index": node.get("Index Name"),
+    }]
+    for child in node.get("Plans", []):
+        out.extend(_walk(child, depth + 1))
+    return out
+
+
+def explain(conn: Connection, sql: str, repeat: int) -> Dict[str, Any]:
+    runs = []
+    for _ in range(repeat):
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar_one()
+        runs.append(plan[0] if isinstance(plan, list) else json.loads(plan)[0])
+    last = runs[-1]["Plan"]
+    nodes = _walk(last)
+    return {
+        "execution_ms": statistics.median(r["Execution Time"] for r in runs),
+        "planning_ms": statistics.median(r["Planning Time"] for r in runs),
+        "shared_hit": last.get("Shared Hit Blocks", 0),
+        "shared_read": last.get("Shared Read Blocks", 0),
+        "temp_written": last.get("Temp Written Blocks", 0),
+        "shape": [f"{'  ' * n['depth']}{n['node']}" + (f" on {n['relation']}" if n["relation"] else "")
+                  + (f" using {n['index']}" if n["index"] else "") for n in nodes],
+        "hired_scans": sorted({
+            f"{n['node']}" + (f" using {n['index']}" if n["index"] else "")
+            for n in nodes if n["relation"] == "hired_employees"
+        }),
+    }
+
+
+def measure(conn: Connection, metrics: Dict[str, str], repeat: int) -> Dict[str, Any]:
+    return {name: explain(conn, sql, repeat) for name, sql in metrics.items()}
+
+
+def compare(
+    current: Dict[str, Any], baseline: Optional[Dict[str, Any]], threshold: float, allow_seq_scan: bool = False
+) -> List[str]:
+    failures = []
+    for name, result in current.items():
+        seq = any(s.startswith("Seq Scan") for s in result["hired_scans"])
+        base = (baseline or {}).get(name)
+        if seq and (not allow_seq_scan or (base and not any(s.startswith("Seq Scan") for s in base["hired_scans"]))):
+            failures.append(f"{name}: Seq Scan sobre hired_employees ({', '.join(result['hired_scans'])})")
+        if base:
+            limit = base["execution_ms"] * (1 + threshold)
+            if result["execution_ms"] > limit:
+                failures.append(
+                    f"{name}: {result['execution_ms']:.1f} ms > {limit:.1f} ms "
+                    f"(baseline {base['execution_ms']:.1f} ms + {threshold:.0%})"
+                )
+            if result["hired_scans"] != base["hired_scans"]:
+                print(f"  [aviso] {name}: cambió el acceso a hired_employees {base['hired_scans']} -> {result['hired_scans']}")
+    return failures
+
+
+def _report(title: str, results: Dict[str, Any], reference: Optional[Dict[str, Any]] = None) -> None:
+    print(title)
+    for name, r in results.items():
+        delta = ""
+        if reference and name in reference:
+            delta = f"  x{reference[name]['execution_ms'] / max(r['execution_ms'], 1e-9):.2f}"
+        print(
+            f"  {name:<10} {r['execution_ms']:10.1f} ms  hit={r['shared_hit']:<9} read={r['shared_read']:<9} "
+            f"temp={r['temp_written']:<7} {', '.join(r['hired_scans'])}{delta}"
+        )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--database-url", default=settings.database_url)
+    ap.add_argument("--rows", type=int, nargs="+", default=[1_000_000])
+    ap.add_argument("--departments", type=int, default=12)
+    ap.add_argument("--jobs", type=int, default=183)
+    ap.add_argument("--start", default="2019-01-01")
+    ap.add_argument("--years", type=int, default=4)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--threshold", type=float, default=0.25, help="regresión tolerada sobre el baseline")
+    ap.add_argument(
+        "--allow-seq-scan",
+        action="store_true",
+        help="tolera Seq Scan sobre hired_employees salvo que el baseline use índice",
+    )
+    ap.add_argument("--candidate", action="append", default=[], help="DDL de índice candidato (repetible)")
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--out", type=Path, help="reporte JSON completo")
+    args = ap.parse_args()
+
+    metrics = load_metrics()
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    engine = create_engine(args.database_url, connect_args={"options": f"-c search_path={SCHEMA}"})
+
+    report: Dict[str, Any] = {}
+    failures: List[str] = []
+    with engine.begin() as conn:
+        create_schema(conn)
+
+    for rows in args.rows:
+        key = str(rows)
+        with engine.begin() as conn:
+            load_volume(conn, rows, args.departments, args.jobs, args.start, args.years)
+        vacuum_analyze(engine)
+
+        with engine.connect() as conn:
+            current = measure(conn, metrics, args.repeat)
+        _report(f"rows={rows:,} (mediana de {args.repeat})", current, baseline.get(key))
+        failures += [f"rows={rows}: {f}" for f in compare(current, baseline.get(key), args.threshold, args.allow_seq_scan)]
+        report[key] = {"current": current, "candidates": {}}
+
+        for ddl in args.candidate:
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+            vacuum_analyze(engine)
+            with engine.connect() as conn:
+                result = measure(conn, metrics, args.repeat)
+            _report(f"  candidato: {ddl}", result, current)
+            report[key]["candidates"][ddl] = result
+            # cada candidato se evalúa solo contra el esquema actual
+            name = re.search(r"INDEX\s+(?:IF NOT EXISTS\s+)?(\w+)", ddl, flags=re.IGNORECASE)
+            if name:
+                with engine.begin() as conn:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {SCHEMA}.{name.group(1)}"))
+
+        if args.update_baseline:
+            baseline[key] = current
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(baseline, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"baseline actualizado: {args.baseline}")
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if failures and not args.update_baseline:
+        print("REGRESIONES:")
+        for f in failures:
+            print(f"  - {f}")
+        sys.exit(1)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
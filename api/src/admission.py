@@ -0,0 +1,266 @@
+﻿import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+# Clases de prioridad: menor valor = se atiende primero
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+
+def _parse_limits(raw: str, defaults: Dict[str, int]) -> Dict[str, int]:
+    # los grupos no mencionados conservan su default (toda ruta admitida tiene un límite)
+    limits = dict(defaults)
+    for item in raw.split(","):
+        if item.strip():
+            name, value = item.split("=")
+            limits[name.strip()] = int(value)
+    return limits
+
+
+# Concurrencia máxima total: debe quedar por debajo del pool de conexiones (5 + 10 overflow)
+ADMISSION_GLOBAL_LIMIT = int(os.getenv("ADMISSION_GLOBAL_LIMIT", "12"))
+# Concurrencia máxima por grupo de rutas
+ADMISSION_ROUTE_LIMITS = _parse_limits(
+    os.getenv("ADMISSION_ROUTE_LIMITS", ""),
+    {"transactions": 12, "ingest": 2, "backup": 1, "restore": 1, "reads": 4},
+)
+# Requests en espera por grupo; con la cola llena se responde 429 sin esperar
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Espera máxima en cola antes de responder 429
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+
+class Rejected(Exception):
+    """Sin capacidad: el llamador responde 429 con Retry-After."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "granted", "wake")
+
+    def __init__(self, priority: int, wake: Callable[[], None]) -> None:
+        self.priority = priority
+        self.granted = False
+        self.wake = wake
+
+
+class Limiter:
+    """
+    Semáforo con cola acotada y prioridades: un slot que se libera se entrega directamente al
+    waiter de mayor prioridad (FIFO dentro de la clase), así los bulk esperan mientras haya
+    interactivos en cola. Los waiters pueden ser hilos (acquire) o corutinas (acquire_async): una
+    corutina en cola no ocupa un hilo del threadpool. Lleva las métricas del grupo (en curso,
+    en cola, admitidos, rechazos, espera y servicio promedio).
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int = ADMISSION_MAX_QUEUE) -> None:
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queues: Dict[int, Deque[_Waiter]] = {p: deque() for p in PRIORITY_NAMES}
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_waiting = 0
+        self._wait_ewma = 0.0      # segundos en cola (EWMA)
+        self._service_ewma = 0.0   # segundos ocupando el slot (EWMA)
+        self._lock = threading.Lock()
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    def retry_after(self) -> int:
+        # tiempo estimado hasta vaciar la cola actual con la concurrencia disponible
+        queued = self._queued() + 1
+        service = self._service_ewma or 1.0
+        return max(1, math.ceil(service * queued / max(self.limit, 1)))
+
+    def _grant(self) -> None:
+        # con el lock tomado: slots libres a los primeros de la cola, por prioridad
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            while queue and self.in_flight < self.limit:
+                waiter = queue.popleft()
+                waiter.granted = True
+                self.in_flight += 1
+                self.admitted += 1
+                waiter.wake()
+
+    def _enter(self, priority: int, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """None si entra ya; si no, el waiter encolado (wake avisa el slot). Rejected con la cola llena."""
+        with self._lock:
+            # un recién llegado no se adelanta a nadie en cola de su clase o de una mayor
+            ahead = any(self.queues[p] for p in self.queues if p <= priority)
+            if self.in_flight < self.limit and not ahead:
+                self.in_flight += 1
+                self.admitted += 1
+                self._wait_ewma = 0.8 * self._wait_ewma
+                return None
+            if self._queued() >= self.max_queue:
+                self.rejected += 1
+                raise Rejected(f"{self.name}: cola llena", self.retry_after())
+            waiter = _Waiter(priority, wake)
+            self.queues[priority].append(waiter)
+            self.max_waiting = max(self.max_waiting, self._queued())
+            return waiter
+
+    def _settle(self, waiter: _Waiter, start: float) -> float:
+        # tras despertar o vencer el timeout: o ya tiene el slot, o sale de la cola con Rejected
+        with self._lock:
+            if not waiter.granted:
+                self.queues[waiter.priority].remove(waiter)
+                self.timed_out += 1
+                raise Rejected(f"{self.name}: tiempo de espera agotado", self.retry_after())
+            waited = time.monotonic() - start
+            self._wait_ewma = 0.8 * self._wait_ewma + 0.2 * waited
+            return waited
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        # corutina cancelada (cliente desconectado): suelta el slot si ya se lo habían dado
+        with self._lock:
+            if waiter.granted:
+                self.in_flight -= 1
+                self._grant()
+            else:
+                self.queues[waiter.priority].remove(waiter)
+
+    def acquire(self, priority: int, timeout: float = ADMISSION_QUEUE_TIMEOUT) -> float:
+        """Bloquea el hilo. Devuelve el tiempo de espera; Rejected si la cola está llena o vence el timeout."""
+        start = time.monotonic()
+        event = threading.Event()
+        waiter = self._enter(priority, event.set)
+        if waiter is None:
+            return 0.0
+        event.wait(timeout)
+        return self._settle(waiter, start)
+
+    async def acquire_async(self, priority: int, timeout: float = ADMISSION_QUEUE_TIMEOUT) -> float:
+        """Como acquire, pero espera en el event loop sin ocupar un hilo."""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            # puede llamarse desde un hilo (release de un endpoint sync)
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enter(priority, wake)
+        if waiter is None:
+            return 0.0
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return self._settle(waiter, start)
+
+    def release(self, service_seconds: Optional[float] = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if service_seconds is not None:
+                self._service_ewma = (
+                    service_seconds if not self._service_ewma else 0.8 * self._service_ewma + 0.2 * service_seconds
+                )
+            self._grant()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queue_depth": self._queued(),
+                "waiting": {PRIORITY_NAMES[p]: len(q) for p, q in self.queues.items()},
+                "max_queue": self.max_queue,
+                "max_queue_depth_seen": self.max_waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_wait_ms": round(self._wait_ewma * 1000, 2),
+                "avg_service_ms": round(self._service_ewma * 1000, 2),
+            }
+
+
+class AdmissionController:
+    """Límite por grupo de rutas + límite global compartido, ambos con prioridad."""
+
+    def __init__(self, global_limit: int, route_limits: Dict[str, int]) -> None:
+        self.global_limiter = Limiter("global", global_limit)
+        self.routes = {name: Limiter(name, limit) for name, limit in route_limits.items()}
+
+    @contextmanager
+    def admit(self, route: str, priority: int, timeout: Optional[float] = None) -> Iterator[None]:
+        timeout = ADMISSION_QUEUE_TIMEOUT if timeout is None else timeout
+        route_limiter = self.routes[route]
+        deadline = time.monotonic() + timeout
+        # primero el grupo (no ocupa un slot global mientras espera su propio límite)
+        route_limiter.acquire(priority, timeout)
+        try:
+            self.global_limiter.acquire(priority, max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            route_limiter.release()
+            raise
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.global_limiter.release(elapsed)
+            route_limiter.release(elapsed)
+
+    async def enter_async(self, route: str, priority: int, timeout: Optional[float] = None) -> Callable[[], None]:
+        """
+        Toma los slots (grupo + global) esperando en el event loop y devuelve un release
+        idempotente: para respuestas en streaming, que sueltan el slot al terminar de enviarse.
+        """
+        timeout = ADMISSION_QUEUE_TIMEOUT if timeout is None else timeout
+        route_limiter = self.routes[route]
+        deadline = time.monotonic() + timeout
+        await route_limiter.acquire_async(priority, timeout)
+        try:
+            await self.global_limiter.acquire_async(priority, max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            route_limiter.release()
+            raise
+        start = time.monotonic()
+        released = threading.Event()
+
+        def release() -> None:
+            if released.is_set():
+                return
+            released.set()
+            elapsed = time.monotonic() - start
+            self.global_limiter.release(elapsed)
+            route_limiter.release(elapsed)
+
+        return release
+
+    @asynccontextmanager
+    async def admit_async(self, route: str, priority: int, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Como admit, esperando en el event loop (dependencias async de FastAPI)."""
+        release = await self.enter_async(route, priority, timeout)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "global": self.global_limiter.stats(),
+            "routes": {name: limiter.stats() for name, limiter in self.routes.items()},
+        }
+
+
+controller = AdmissionController(ADMISSION_GLOBAL_LIMIT, ADMISSION_ROUTE_LIMITS)
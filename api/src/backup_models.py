@@ -0,0 +1,33 @@
+﻿from sqlalchemy import BigInteger, Column, DateTime, Index, String, func
+
+from src.db import Base
+
+
+class BackupCatalog(Base):
+    """Índice de backups (uno por versión); evita recorrer BACKUP_ROOT y leer cada metadata.json."""
+
+    __tablename__ = "backup_catalog"
+
+    table_name = Column(String, primary_key=True)
+    version = Column(String, primary_key=True)       # <stamp>_<run_id>, mismo nombre que el directorio
+    run_id = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    row_count = Column(BigInteger, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    checksum = Column(String, nullable=True)         # sha256 del data.avro
+    format = Column(String, nullable=False, server_default="avro")
+    codec = Column(String, nullable=False, server_default="null")
+    min_ts = Column(DateTime(timezone=True), nullable=True)   # rango temporal de los datos (si la tabla tiene datetime)
+    max_ts = Column(DateTime(timezone=True), nullable=True)
+    path = Column(String, nullable=False)            # directorio relativo a BACKUP_ROOT
+    set_version = Column(String, nullable=True)      # versión del set (backup_all) al que pertenece
+    registered_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+# listado por tabla ordenado por fecha y resolución latest / as-of
+Index("idx_backup_catalog_table_created", BackupCatalog.table_name, BackupCatalog.created_at.desc())
+Index(
+    "idx_backup_catalog_set_created",
+    BackupCatalog.created_at.desc(),
+    postgresql_where=BackupCatalog.set_version.isnot(None),
+)
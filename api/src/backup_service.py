@@ -1,21 +1,127 @@
-﻿import json
+﻿import hashlib
+import io
+import json
 import os
+import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+import zlib
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from sqlalchemy import text
-from fastavro import writer, reader, parse_schema
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from fastavro import block_reader, writer, reader, parse_schema
 
-from src.db import SessionLocal
+from src.db import SessionLocal, get_read_engine
+from src.ingestion import BATCH_SIZE, chunked
+from src.profiling import profiled
+from src.read_service import DIMENSION_TABLES, invalidate_dimension_cache
+from src.validation import SPECS, ReferenceResolver, get_validator, row_hash_sql
+
+try:  # opcional: export Parquet para consumidores analíticos
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
 
 BACKUP_ROOT = Path(os.getenv("BACKUP_ROOT", "/app/backups"))
+# Codec AVRO de los bloques (null | deflate | ...); queda en metadata y en el catálogo
+BACKUP_CODEC = os.getenv("BACKUP_CODEC", "null")
+STAMP_FORMAT = "%Y%m%dT%H%M%SZ"
+# Versiones que genera backup_table/backup_all (<stamp>_<uuid>); cualquier otra cosa se rechaza
+# antes de armar rutas bajo BACKUP_ROOT ("../" no debe salir del directorio de backups)
+VERSION_PATTERN = re.compile(r"[0-9]{8}T[0-9]{6}Z_[0-9a-f-]{36}")
+# Tamaño (bytes) de los tramos del archivo con checksum propio (crc32): ubica la corrupción
+BACKUP_CHECKSUM_BLOCK = int(os.getenv("BACKUP_CHECKSUM_BLOCK", str(1 << 20)))
+# Copia Parquet (requiere pyarrow) junto al AVRO; el endpoint puede pedirla por request
+BACKUP_PARQUET = os.getenv("BACKUP_PARQUET", "0").lower() in ("1", "true", "yes")
+BACKUP_PARQUET_COMPRESSION = os.getenv("BACKUP_PARQUET_COMPRESSION", "zstd")
 
 SUPPORTED_TABLES = {"departments", "jobs", "hired_employees"}
+# Orden de dependencia (padres primero) para backups/restores de set
+RESTORE_ORDER = ["departments", "jobs", "hired_employees"]
+# Conexiones paralelas de backup_all (una por tabla como máximo)
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", "3"))
+# Filas por ida al cursor del servidor al exportar (y máximo por row group Parquet)
+BACKUP_FETCH_ROWS = int(os.getenv("BACKUP_FETCH_ROWS", "50000"))
+
+class RestoreError(Exception):
+    """Restore abortado sin cambios en las tablas vivas (conteo, integridad referencial o registros inválidos)."""
+
+class _Checksummer:
+    """sha256 de todo el contenido + crc32 por tramo fijo de block_size bytes, en streaming."""
+
+    def __init__(self, block_size: int) -> None:
+        self.block_size = block_size
+        self.sha = hashlib.sha256()
+        self.blocks: List[str] = []
+        self.size = 0
+        self._crc = 0
+        self._fill = 0
+
+    def update(self, data: bytes) -> None:
+        self.sha.update(data)
+        self.size += len(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.block_size - self._fill)
+            self._crc = zlib.crc32(view[:take], self._crc)
+            self._fill += take
+            view = view[take:]
+            if self._fill == self.block_size:
+                self.blocks.append(f"{self._crc:08x}")
+                self._crc, self._fill = 0, 0
+
+    def finish(self) -> Tuple[str, List[str]]:
+        if self._fill:
+            self.blocks.append(f"{self._crc:08x}")
+            self._crc, self._fill = 0, 0
+        return self.sha.hexdigest(), self.blocks
+
+class _HashingWriter:
+    """File-like para fastavro.writer: calcula los checksums mientras se escribe."""
+
+    def __init__(self, fo: Any, checksummer: _Checksummer) -> None:
+        self.fo = fo
+        self.checksummer = checksummer
+
+    def write(self, data: bytes) -> int:
+        self.checksummer.update(data)
+        return self.fo.write(data)
+
+    def flush(self) -> None:
+        self.fo.flush()
+
+    def seekable(self) -> bool:
+        return False
+
+class _HashingReader:
+    """File-like para fastavro.block_reader: calcula los checksums mientras se lee."""
+
+    def __init__(self, fo: Any, checksummer: _Checksummer) -> None:
+        self.fo = fo
+        self.checksummer = checksummer
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.fo.read(n)
+        self.checksummer.update(data)
+        return data
+
+    def tell(self) -> int:
+        return self.checksummer.size
+
+    def seekable(self) -> bool:
+        return False
 
 def _utc_stamp() -> str:
-    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return datetime.now(timezone.utc).strftime(STAMP_FORMAT)
+
+def _valid_version(version: Optional[str]) -> bool:
+    return version is not None and VERSION_PATTERN.fullmatch(version) is not None
 
 def _schema_for(table: str) -> Dict[str, Any]:
     # AVRO pragmático: tipos estables y portables
@@ -37,97 +143,829 @@ def _schema_for(table: str) -> Dict[str, Any]:
 
     return parse_schema({"type": "record", "name": f"{table}_record", "fields": fields})
 
-def _fetch_rows(table: str) -> List[Dict[str, Any]]:
-    with SessionLocal() as session:
-        if table == "departments":
-            rows = session.execute(text("SELECT id, department FROM departments ORDER BY id")).mappings().all()
-            return [dict(r) for r in rows]
+# Columnas exportadas por tabla (mismo orden que _schema_for / _parquet_schema)
+_BACKUP_COLUMNS = {
+    "departments": ("id", "department"),
+    "jobs": ("id", "job"),
+    "hired_employees": ("id", "name", "datetime", "department_id", "job_id"),
+}
 
-        if table == "jobs":
-            rows = session.execute(text("SELECT id, job FROM jobs ORDER BY id")).mappings().all()
-            return [dict(r) for r in rows]
+def _iter_rows(session: Session, table: str, order_by: str = "id") -> Iterator[Dict[str, Any]]:
+    """
+    Filas de la tabla en streaming: cursor del lado del servidor (yield_per), de a
+    BACKUP_FETCH_ROWS filas; la tabla nunca se materializa completa en memoria.
+    """
+    if table not in _BACKUP_COLUMNS:
+        raise ValueError("tabla no soportada")
+    result = session.execute(
+        text(f"SELECT {', '.join(_BACKUP_COLUMNS[table])} FROM {table} ORDER BY {order_by}"),
+        execution_options={"yield_per": BACKUP_FETCH_ROWS},
+    )
+    for r in result.mappings():
+        yield dict(r)
 
+def _avro_records(table: str, rows: Iterator[Dict[str, Any]], counter: List[int]) -> Iterator[Dict[str, Any]]:
+    # datetime -> string ISO (ver _schema_for); counter[0] acumula el row_count mientras se escribe
+    for r in rows:
         if table == "hired_employees":
-            rows = session.execute(
-                text("SELECT id, name, datetime, department_id, job_id FROM hired_employees ORDER BY id")
-            ).mappings().all()
-            out = []
-            for r in rows:
-                d = dict(r)
-                d["datetime"] = d["datetime"].isoformat()
-                out.append(d)
-            return out
+            r["datetime"] = r["datetime"].isoformat()
+        counter[0] += 1
+        yield r
 
+def _parquet_schema(table: str) -> "pa.Schema":
+    if table == "departments":
+        return pa.schema([("id", pa.int32()), ("department", pa.string())])
+    if table == "jobs":
+        return pa.schema([("id", pa.int32()), ("job", pa.string())])
+    if table == "hired_employees":
+        # tipos nativos (timestamp real, no string) + columnas de partición para predicate pushdown
+        return pa.schema([
+            ("id", pa.int32()),
+            ("name", pa.string()),
+            ("datetime", pa.timestamp("us", tz="UTC")),
+            ("department_id", pa.int32()),
+            ("job_id", pa.int32()),
+            ("hire_year", pa.int16()),
+            ("hire_quarter", pa.int8()),
+        ])
     raise ValueError("tabla no soportada")
 
-def backup_table(table: str) -> Dict[str, Any]:
-    if table not in SUPPORTED_TABLES:
-        return {"status": "error", "error": "tabla no soportada", "supported": sorted(SUPPORTED_TABLES)}
+def _write_parquet(path: Path, table: str, rows: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Export columnar para analítica, en streaming (como máximo BACKUP_FETCH_ROWS filas por row
+    group en memoria). hired_employees llega ordenada por datetime y un row group nunca mezcla
+    trimestres (hire_year, hire_quarter): las estadísticas min/max por row group permiten saltar
+    trimestres enteros y leer solo las columnas pedidas sin escanear el backup completo.
+    """
+    schema = _parquet_schema(table)
+    row_groups: List[Dict[str, Any]] = []
 
-    run_id = str(uuid.uuid4())
-    stamp = _utc_stamp()
-    version = f"{stamp}_{run_id}"
+    with pq.ParquetWriter(
+        str(path), schema, compression=BACKUP_PARQUET_COMPRESSION, write_statistics=True
+    ) as pw:
+
+        def flush(key: Optional[Tuple[int, int]], group: List[Dict[str, Any]]) -> None:
+            columns = {name: [r[name] for r in group] for name in schema.names}
+            pw.write_table(pa.Table.from_pydict(columns, schema=schema), row_group_size=len(group))
+            entry: Dict[str, Any] = {"rows": len(group)}
+            if key is not None:
+                entry.update({"hire_year": key[0], "hire_quarter": key[1]})
+            row_groups.append(entry)
+
+        key: Optional[Tuple[int, int]] = None
+        group: List[Dict[str, Any]] = []
+        for r in rows:
+            k = None
+            if table == "hired_employees":
+                ts = r["datetime"]
+                if ts.tzinfo is None:
+                    ts = ts.replace(tzinfo=timezone.utc)
+                ts = ts.astimezone(timezone.utc)
+                r.update({"datetime": ts, "hire_year": ts.year, "hire_quarter": (ts.month - 1) // 3 + 1})
+                k = (r["hire_year"], r["hire_quarter"])
+            if group and (k != key or len(group) >= BACKUP_FETCH_ROWS):
+                flush(key, group)
+                group = []
+            key = k
+            group.append(r)
+        if group:
+            flush(key, group)
 
+    return {
+        "file": path.name,
+        "compression": BACKUP_PARQUET_COMPRESSION,
+        "size_bytes": path.stat().st_size,
+        "checksum": _file_sha256(path),
+        "checksum_algorithm": "sha256",
+        "row_groups": row_groups,
+    }
+
+def _write_backup(
+    session: Session,
+    table: str,
+    run_id: str,
+    stamp: str,
+    version: str,
+    set_version: Optional[str] = None,
+    parquet: bool = False,
+) -> Dict[str, Any]:
+    """
+    Escribe data.avro (+ data.parquet si parquet) y metadata.json de una tabla leyendo con la
+    sesión dada (y su snapshot), en streaming. El Parquet de hired_employees se escribe con una
+    segunda lectura ordenada por datetime: la sesión debe ser REPEATABLE READ para que ambas
+    vean los mismos datos.
+    """
     out_dir = BACKUP_ROOT / table / version
     # Inmutable: si existe, debe fallar
     out_dir.mkdir(parents=True, exist_ok=False)
 
     schema = _schema_for(table)
-    rows = _fetch_rows(table)
+    row_count = [0]
 
     avro_path = out_dir / "data.avro"
     meta_path = out_dir / "metadata.json"
 
+    checksummer = _Checksummer(BACKUP_CHECKSUM_BLOCK)
     with avro_path.open("wb") as fo:
-        writer(fo, schema, rows)
+        writer(
+            _HashingWriter(fo, checksummer),
+            schema,
+            _avro_records(table, _iter_rows(session, table), row_count),
+            codec=BACKUP_CODEC,
+        )
+    checksum, block_checksums = checksummer.finish()
 
+    min_ts, max_ts = _time_range(session, table)
     metadata = {
         "table": table,
         "version": version,
         "run_id": run_id,
         "created_at_utc": stamp,
-        "row_count": len(rows),
+        "row_count": row_count[0],
         "format": "avro",
+        "codec": BACKUP_CODEC,
+        "size_bytes": checksummer.size,
+        "checksum": checksum,
+        "checksum_algorithm": "sha256",
+        "block_size": BACKUP_CHECKSUM_BLOCK,
+        "block_checksums": block_checksums,   # crc32 por tramo de block_size bytes
+        "min_ts": min_ts,
+        "max_ts": max_ts,
+        "set_version": set_version,
         "files": {"data": "data.avro", "metadata": "metadata.json"},
     }
+    if parquet:
+        order_by = "datetime, id" if table == "hired_employees" else "id"
+        metadata["parquet"] = _write_parquet(out_dir / "data.parquet", table, _iter_rows(session, table, order_by))
+        metadata["files"]["parquet"] = "data.parquet"
     meta_path.write_text(json.dumps(metadata, indent=2, ensure_ascii=False), encoding="utf-8")
+    return metadata
 
-    return {"status": "ok", "table": table, "version": version, "row_count": len(rows)}
+def _parquet_error(parquet: bool) -> Optional[Dict[str, Any]]:
+    if parquet and pq is None:
+        return {"status": "error", "error": "export parquet requiere pyarrow"}
+    return None
 
-def restore_table(table: str, version: str, mode: str = "truncate_insert") -> Dict[str, Any]:
+@profiled
+def backup_table(table: str, parquet: Optional[bool] = None) -> Dict[str, Any]:
     if table not in SUPPORTED_TABLES:
         return {"status": "error", "error": "tabla no soportada", "supported": sorted(SUPPORTED_TABLES)}
+    parquet = BACKUP_PARQUET if parquet is None else parquet
+    error = _parquet_error(parquet)
+    if error:
+        return error
+
+    run_id = str(uuid.uuid4())
+    stamp = _utc_stamp()
+    version = f"{stamp}_{run_id}"
+
+    # la lectura va a la réplica (si está sana); el catálogo se registra en el primario
+    with get_read_engine().connect() as conn:
+        conn = conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        with Session(bind=conn) as session:
+            metadata = _write_backup(session, table, run_id, stamp, version, parquet=parquet)
+    with SessionLocal() as session:
+        _register(session, metadata)
+        session.commit()
+
+    return {
+        "status": "ok",
+        "table": table,
+        "version": version,
+        "row_count": metadata["row_count"],
+        "files": sorted(metadata["files"].values()),
+    }
+
+def _backup_in_snapshot(
+    source: Engine, snapshot_id: str, table: str, run_id: str, stamp: str, version: str, parquet: bool
+) -> Dict[str, Any]:
+    # cada worker abre su conexión (al mismo servidor) e importa el snapshot exportado por el coordinador
+    with source.connect() as conn:
+        conn = conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        conn.execute(text("SET TRANSACTION SNAPSHOT :snapshot_id"), {"snapshot_id": snapshot_id})
+        with Session(bind=conn) as session:
+            metadata = _write_backup(session, table, run_id, stamp, version, set_version=version, parquet=parquet)
+        conn.rollback()
+    return metadata
+
+@profiled
+def backup_all(parquet: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Backup consistente de todas las tablas soportadas: el coordinador abre una transacción
+    REPEATABLE READ, exporta su snapshot (pg_export_snapshot) y un worker por tabla lo importa
+    en su propia conexión. Todas las tablas se leen al mismo instante (FKs coherentes) y
+    quedan con la misma versión; BACKUP_ROOT/_sets/<version>/manifest.json describe el set.
+    """
+    parquet = BACKUP_PARQUET if parquet is None else parquet
+    error = _parquet_error(parquet)
+    if error:
+        return error
+
+    run_id = str(uuid.uuid4())
+    stamp = _utc_stamp()
+    version = f"{stamp}_{run_id}"
+
+    # réplica o primario se elige una vez: el snapshot solo existe en el servidor que lo exportó
+    source = get_read_engine()
+    with source.connect() as coord:
+        coord = coord.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        snapshot_id = coord.execute(text("SELECT pg_export_snapshot()")).scalar_one()
+        # el snapshot solo es importable mientras la transacción del coordinador siga abierta
+        with ThreadPoolExecutor(max_workers=min(BACKUP_WORKERS, len(RESTORE_ORDER))) as pool:
+            futures = [
+                pool.submit(_backup_in_snapshot, source, snapshot_id, table, run_id, stamp, version, parquet)
+                for table in RESTORE_ORDER
+            ]
+            metas = [f.result() for f in futures]
+        coord.rollback()
 
+    manifest = {
+        "version": version,
+        "run_id": run_id,
+        "created_at_utc": stamp,
+        "snapshot_id": snapshot_id,
+        "restore_order": RESTORE_ORDER,
+        "tables": {
+            m["table"]: {"row_count": m["row_count"], "checksum": m["checksum"], "path": f"{m['table']}/{version}"}
+            for m in metas
+        },
+    }
+    set_dir = BACKUP_ROOT / "_sets" / version
+    set_dir.mkdir(parents=True, exist_ok=False)
+    (set_dir / "manifest.json").write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    with SessionLocal() as session:
+        for m in metas:
+            _register(session, m)
+        session.commit()
+
+    return {"status": "ok", "version": version, "tables": {m["table"]: m["row_count"] for m in metas}}
+
+def verify_backup(table: str, version: str) -> Dict[str, Any]:
+    """
+    Verifica un backup en UNA pasada streaming, sin decodificar registros:
+    - estructura AVRO (header, sync markers) y total de registros desde los headers de bloque
+    - sha256 y crc32 por tramo contra metadata.json (si el backup los tiene)
+    - row_count de metadata.json
+    - data.parquet (si el backup lo tiene): tamaño y sha256 contra metadata.json
+    """
+    if table not in SUPPORTED_TABLES:
+        return {"status": "error", "error": "tabla no soportada", "supported": sorted(SUPPORTED_TABLES)}
+    if not _valid_version(version):
+        return {"status": "error", "error": "versión inválida", "table": table, "version": version}
     in_dir = BACKUP_ROOT / table / version
     avro_path = in_dir / "data.avro"
     if not avro_path.exists():
         return {"status": "error", "error": "backup no encontrado", "table": table, "version": version}
 
+    metadata = _read_metadata(in_dir)
+    checksummer = _Checksummer(int(metadata.get("block_size") or BACKUP_CHECKSUM_BLOCK))
+    errors: List[str] = []
+    records = 0
     with avro_path.open("rb") as fo:
-        records = list(reader(fo))
+        stream = _HashingReader(fo, checksummer)
+        try:
+            for block in block_reader(stream):
+                records += block.num_records
+        except Exception as exc:
+            errors.append(f"avro inválido en byte {checksummer.size}: {exc}")
+        # lo que quede tras el último bloque también entra en el checksum
+        while stream.read(1 << 20):
+            pass
+    checksum, blocks = checksummer.finish()
+
+    if metadata.get("row_count") is not None and not errors and records != metadata["row_count"]:
+        errors.append(f"row_count: metadata={metadata['row_count']} archivo={records}")
+    if metadata.get("checksum") and checksum != metadata["checksum"]:
+        errors.append("checksum sha256 no coincide")
+    expected_blocks = metadata.get("block_checksums")
+    bad_blocks: List[int] = []
+    if expected_blocks is not None:
+        if len(expected_blocks) != len(blocks):
+            errors.append(f"cantidad de tramos: metadata={len(expected_blocks)} archivo={len(blocks)}")
+        bad_blocks = [i for i, (a, b) in enumerate(zip(expected_blocks, blocks)) if a != b]
+        if bad_blocks:
+            errors.append(f"tramos corruptos: {bad_blocks[:20]}")
 
+    parquet_meta = metadata.get("parquet")
+    parquet_check: Optional[Dict[str, Any]] = None
+    if parquet_meta:
+        parquet_path = in_dir / "data.parquet"
+        if not parquet_path.exists():
+            errors.append("data.parquet no encontrado")
+        else:
+            parquet_check = {"size_bytes": parquet_path.stat().st_size, "checksum": _file_sha256(parquet_path)}
+            if parquet_meta.get("size_bytes") is not None and parquet_check["size_bytes"] != parquet_meta["size_bytes"]:
+                errors.append(
+                    f"parquet size_bytes: metadata={parquet_meta['size_bytes']} archivo={parquet_check['size_bytes']}"
+                )
+            if parquet_meta.get("checksum") and parquet_check["checksum"] != parquet_meta["checksum"]:
+                errors.append("parquet: checksum sha256 no coincide")
+            parquet_check["checksum_verified"] = bool(parquet_meta.get("checksum"))
+
+    return {
+        "status": "ok" if not errors else "corrupted",
+        "table": table,
+        "version": version,
+        "records": records,
+        "size_bytes": checksummer.size,
+        "checksum": checksum,
+        "checksum_verified": bool(metadata.get("checksum")),
+        "corrupted_byte_ranges": [
+            [i * checksummer.block_size, (i + 1) * checksummer.block_size] for i in bad_blocks[:20]
+        ],
+        "parquet": parquet_check,
+        "errors": errors,
+    }
+
+# =========================
+# Catálogo de backups
+# =========================
+def _time_range(session: Session, table: str) -> Tuple[Optional[str], Optional[str]]:
+    # min/max por índice (idx_hired_datetime), en el mismo snapshot que el export
+    if "datetime" not in _BACKUP_COLUMNS[table]:
+        return None, None
+    lo, hi = session.execute(text(f"SELECT min(datetime), max(datetime) FROM {table}")).one()
+    return (lo.isoformat() if lo else None), (hi.isoformat() if hi else None)
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _register(session: Session, metadata: Dict[str, Any]) -> None:
+    """Upsert de una versión en backup_catalog a partir de su metadata.json."""
+    session.execute(
+        text(
+            "INSERT INTO backup_catalog (table_name, version, run_id, created_at, row_count, size_bytes, "
+            "checksum, format, codec, min_ts, max_ts, path, set_version) "
+            "VALUES (:table_name, :version, :run_id, :created_at, :row_count, :size_bytes, "
+            ":checksum, :format, :codec, :min_ts, :max_ts, :path, :set_version) "
+            "ON CONFLICT (table_name, version) DO UPDATE SET "
+            "row_count = EXCLUDED.row_count, size_bytes = EXCLUDED.size_bytes, checksum = EXCLUDED.checksum, "
+            "codec = EXCLUDED.codec, min_ts = EXCLUDED.min_ts, max_ts = EXCLUDED.max_ts, "
+            "set_version = EXCLUDED.set_version"
+        ),
+        {
+            "table_name": metadata["table"],
+            "version": metadata["version"],
+            "run_id": metadata["run_id"],
+            "created_at": datetime.strptime(metadata["created_at_utc"], STAMP_FORMAT).replace(tzinfo=timezone.utc),
+            "row_count": metadata["row_count"],
+            "size_bytes": metadata["size_bytes"],
+            "checksum": metadata.get("checksum"),
+            "format": metadata.get("format", "avro"),
+            "codec": metadata.get("codec", "null"),
+            "min_ts": metadata.get("min_ts"),
+            "max_ts": metadata.get("max_ts"),
+            "path": f"{metadata['table']}/{metadata['version']}",
+            "set_version": metadata.get("set_version"),
+        },
+    )
+
+def sync_catalog() -> Dict[str, Any]:
+    """
+    Registra en backup_catalog los backups de BACKUP_ROOT que no estén (p.ej. anteriores al
+    catálogo). Es el único recorrido del filesystem; los listados y el restore usan el catálogo.
+    """
+    registered = 0
+    with SessionLocal() as session:
+        known = {
+            (r[0], r[1]) for r in session.execute(text("SELECT table_name, version FROM backup_catalog")).all()
+        }
+        for meta_path in sorted(BACKUP_ROOT.glob("*/*/metadata.json")):
+            metadata = json.loads(meta_path.read_text(encoding="utf-8"))
+            if metadata.get("table") not in SUPPORTED_TABLES or (metadata["table"], metadata["version"]) in known:
+                continue
+            avro_path = meta_path.parent / metadata.get("files", {}).get("data", "data.avro")
+            if not avro_path.exists():
+                continue
+            metadata.setdefault("size_bytes", avro_path.stat().st_size)
+            metadata.setdefault("checksum", _file_sha256(avro_path))
+            if "codec" not in metadata:
+                with avro_path.open("rb") as fo:
+                    metadata["codec"] = reader(fo).codec
+            _register(session, metadata)
+            registered += 1
+        session.commit()
+    return {"status": "ok", "registered": registered}
+
+def list_backups(table: str, limit: int = 100, before: Optional[datetime] = None) -> Dict[str, Any]:
+    """Versiones de una tabla, más recientes primero (keyset por created_at: before = next_before)."""
+    if table not in SUPPORTED_TABLES:
+        return {"status": "error", "error": "tabla no soportada", "supported": sorted(SUPPORTED_TABLES)}
+    params: Dict[str, Any] = {"table": table, "limit": limit}
+    where = "WHERE table_name = :table "
+    if before is not None:
+        where += "AND created_at < :before "
+        params["before"] = before
     with SessionLocal() as session:
-        if mode == "truncate_insert":
-            session.execute(text(f"TRUNCATE TABLE {table} RESTART IDENTITY CASCADE"))
+        rows = session.execute(
+            text(
+                "SELECT version, run_id, created_at, row_count, size_bytes, checksum, format, codec, "
+                f"min_ts, max_ts, path FROM backup_catalog {where}"
+                "ORDER BY created_at DESC, version DESC LIMIT :limit"
+            ),
+            params,
+        ).mappings().all()
+    items = [dict(r) for r in rows]
+    next_before = items[-1]["created_at"] if len(items) == limit else None
+    return {"table": table, "count": len(items), "items": items, "next_before": next_before}
+
+def resolve_version(session: Session, table: str, version: Optional[str], as_of: Optional[datetime]) -> Optional[str]:
+    """
+    version explícita, "latest" o la última versión creada en o antes de as_of.
+    None si el catálogo no tiene una versión que cumpla.
+    """
+    if version not in (None, "latest"):
+        return version
+    params: Dict[str, Any] = {"table": table}
+    where = "WHERE table_name = :table "
+    if as_of is not None:
+        where += "AND created_at <= :as_of "
+        params["as_of"] = as_of
+    return session.execute(
+        text(f"SELECT version FROM backup_catalog {where}ORDER BY created_at DESC, version DESC LIMIT 1"),
+        params,
+    ).scalar()
+
+def resolve_set_version(session: Session, version: Optional[str], as_of: Optional[datetime]) -> Optional[str]:
+    """Como resolve_version, pero sobre sets completos de backup_all."""
+    if version not in (None, "latest"):
+        return version
+    params: Dict[str, Any] = {}
+    where = "WHERE set_version IS NOT NULL "
+    if as_of is not None:
+        where += "AND created_at <= :as_of "
+        params["as_of"] = as_of
+    return session.execute(
+        text(f"SELECT set_version FROM backup_catalog {where}ORDER BY created_at DESC, set_version DESC LIMIT 1"),
+        params,
+    ).scalar()
+
+RESTORE_MODES = ("truncate_insert", "swap", "append", "merge")
+# Filas por COPY / por lote de merge al restaurar
+RESTORE_CHUNK_ROWS = int(os.getenv("RESTORE_CHUNK_ROWS", "50000"))
+
+def _read_metadata(in_dir: Path) -> Dict[str, Any]:
+    meta_path = in_dir / "metadata.json"
+    if not meta_path.exists():
+        return {}
+    return json.loads(meta_path.read_text(encoding="utf-8"))
+
+def _iter_record_chunks(avro_path: Path, size: int) -> Iterator[List[Dict[str, Any]]]:
+    # streaming: nunca se materializa el backup completo en memoria
+    with avro_path.open("rb") as fo:
+        chunk: List[Dict[str, Any]] = []
+        for rec in reader(fo):
+            chunk.append(rec)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
-        if table == "departments":
-            if records:
-                session.execute(text("INSERT INTO departments (id, department) VALUES (:id, :department)"), records)
+def _copy_value(v: Any) -> str:
+    # formato text de COPY: \N es NULL; se escapan backslash, tab y saltos de línea
+    if v is None:
+        return "\\N"
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
 
-        elif table == "jobs":
-            if records:
-                session.execute(text("INSERT INTO jobs (id, job) VALUES (:id, :job)"), records)
+def _copy_records(session: Session, table: str, columns: List[str], records: List[Dict[str, Any]]) -> None:
+    buf = io.StringIO()
+    for rec in records:
+        buf.write("\t".join(_copy_value(rec[c]) for c in columns))
+        buf.write("\n")
+    buf.seek(0)
+    cur = session.connection().connection.cursor()
+    try:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+    finally:
+        cur.close()
 
-        elif table == "hired_employees":
-            if records:
+def _constraints(session: Session, table: str) -> Dict[str, List[Dict[str, Any]]]:
+    """PK/UNIQUE e índices propios, FKs propias (hacia padres) y FKs de tablas hijas hacia table."""
+    own = session.execute(
+        text(
+            "SELECT conname, contype, pg_get_constraintdef(oid) AS def FROM pg_constraint "
+            "WHERE conrelid = CAST(:t AS regclass) AND contype IN ('p', 'u', 'f') ORDER BY contype DESC, conname"
+        ),
+        {"t": table},
+    ).mappings().all()
+    children = session.execute(
+        text(
+            "SELECT conname, conrelid::regclass::text AS child, pg_get_constraintdef(oid) AS def FROM pg_constraint "
+            "WHERE confrelid = CAST(:t AS regclass) AND contype = 'f' AND conrelid <> confrelid ORDER BY conname"
+        ),
+        {"t": table},
+    ).mappings().all()
+    # índices que no respaldan una constraint (las p/u se recrean como constraint)
+    indexes = session.execute(
+        text(
+            "SELECT i.relname AS name, pg_get_indexdef(x.indexrelid) AS def FROM pg_index x "
+            "JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = CAST(:t AS regclass) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid) ORDER BY i.relname"
+        ),
+        {"t": table},
+    ).mappings().all()
+    return {
+        "keys": [dict(r) for r in own if r["contype"] in ("p", "u")],
+        "fks": [dict(r) for r in own if r["contype"] == "f"],
+        "children": [dict(r) for r in children],
+        "indexes": [dict(r) for r in indexes],
+    }
+
+def _restore_swap(session: Session, items: List[Tuple[str, Path, Optional[int]]]) -> Dict[str, Any]:
+    """
+    Restore sin ventana vacía de una o más tablas (en orden de dependencia): cada una se carga
+    en una tabla sombra y todas se intercambian con renames en UNA transacción.
+    1) sombra (LIKE, sin índices) + COPY por bloques
+    2) valida el conteo contra metadata.json
+    3) PK/UNIQUE e índices DESPUÉS de la carga; FKs NOT VALID + VALIDATE sobre las sombras (las FKs
+       entre tablas del set apuntan a la sombra del padre; las de tablas hijas fuera del set, a la
+       sombra restaurada): si hay huérfanos falla acá, sin haber tocado las tablas vivas
+    4) swap en una transacción corta (ACCESS EXCLUSIVE solo durante los renames)
+    """
+    tables = [table for table, _, _ in items]
+    shadows = {table: f"{table}__swap" for table in tables}
+    metas: Dict[str, Dict[str, Any]] = {}
+    for table in tables:
+        metas[table] = _constraints(session, table)
+        metas[table]["seqs"] = [
+            dict(r)
+            for r in session.execute(
+                text(
+                    "SELECT a.attname AS col, pg_get_serial_sequence(:t, a.attname) AS seq FROM pg_attribute a "
+                    "WHERE a.attrelid = CAST(:t AS regclass) AND a.attnum > 0 AND NOT a.attisdropped "
+                    "AND pg_get_serial_sequence(:t, a.attname) IS NOT NULL"
+                ),
+                {"t": table},
+            ).mappings().all()
+        ]
+        # FKs de hijas que no se restauran en este mismo swap
+        metas[table]["children"] = [
+            fk for fk in metas[table]["children"] if fk["child"].split(".")[-1] not in shadows
+        ]
+
+    def _to_shadow(ddl: str) -> str:
+        for parent, shadow in shadows.items():
+            ddl = re.sub(rf"REFERENCES (\S+\.)?{parent}\(", f"REFERENCES {shadow}(", ddl, count=1)
+        return ddl
+
+    for table in tables:
+        session.execute(text(f"DROP TABLE IF EXISTS {shadows[table]} CASCADE"))
+        session.execute(text(f"CREATE TABLE {shadows[table]} (LIKE {table} INCLUDING DEFAULTS)"))
+    session.commit()
+
+    restored: Dict[str, int] = {}
+    try:
+        for table, avro_path, expected_rows in items:
+            shadow, meta = shadows[table], metas[table]
+            loaded = 0
+            for chunk in _iter_record_chunks(avro_path, RESTORE_CHUNK_ROWS):
+                _copy_records(session, shadow, SPECS[table].columns, chunk)
+                loaded += len(chunk)
+            session.commit()
+
+            count = session.execute(text(f"SELECT count(*) FROM {shadow}")).scalar_one()
+            if count != loaded or (expected_rows is not None and count != expected_rows):
+                raise RestoreError(
+                    f"{table}: conteo inválido: metadata={expected_rows} leídas={loaded} cargadas={count}"
+                )
+            restored[table] = loaded
+
+            # row_hash antes de los índices (la sombra todavía no es visible ni tiene índices que mantener)
+            session.execute(text(f"UPDATE {shadow} SET row_hash = {row_hash_sql(SPECS[table], shadow)}"))
+
+            for k in meta["keys"]:
+                session.execute(text(f"ALTER TABLE {shadow} ADD CONSTRAINT {k['conname']}__swap {k['def']}"))
+            for ix in meta["indexes"]:
+                # pg_get_indexdef califica la tabla con el schema: "... ON public.t USING ..."
+                ddl = ix["def"].replace(f"INDEX {ix['name']} ON", f"INDEX {ix['name']}__swap ON", 1)
+                session.execute(text(re.sub(rf" ON (\S+\.)?{table} USING ", f" ON {shadow} USING ", ddl, count=1)))
+            session.execute(text(f"ANALYZE {shadow}"))
+            session.commit()
+
+        # FKs después de que todas las sombras tengan su PK
+        validations: List[Tuple[str, str]] = []
+        for table in tables:
+            shadow, meta = shadows[table], metas[table]
+            for fk in meta["fks"]:
+                session.execute(
+                    text(f"ALTER TABLE {shadow} ADD CONSTRAINT {fk['conname']}__swap {_to_shadow(fk['def'])} NOT VALID")
+                )
+                validations.append((shadow, f"{fk['conname']}__swap"))
+            for fk in meta["children"]:
                 session.execute(
-                    text(
-                        "INSERT INTO hired_employees (id, name, datetime, department_id, job_id) "
-                        "VALUES (:id, :name, CAST(:datetime AS timestamp), :department_id, :job_id)"
-                    ),
-                    records,
+                    text(f"ALTER TABLE {fk['child']} ADD CONSTRAINT {fk['conname']}__swap {_to_shadow(fk['def'])} NOT VALID")
                 )
+                validations.append((fk["child"], f"{fk['conname']}__swap"))
+        session.commit()
 
+        try:
+            for owner, conname in validations:
+                session.execute(text(f"ALTER TABLE {owner} VALIDATE CONSTRAINT {conname}"))
+            session.commit()
+        except IntegrityError as exc:
+            raise RestoreError(f"integridad referencial: {exc.orig}") from exc
+
+        # swap: todo o nada
+        session.execute(text(f"LOCK TABLE {', '.join(tables)} IN ACCESS EXCLUSIVE MODE"))
+        for table in tables:
+            for fk in metas[table]["children"]:
+                session.execute(text(f"ALTER TABLE {fk['child']} DROP CONSTRAINT {fk['conname']}"))
+            for s in metas[table]["seqs"]:
+                session.execute(text(f"ALTER SEQUENCE {s['seq']} OWNED BY {shadows[table]}.{s['col']}"))
+        # hijas primero: las FKs entre tablas viejas del set caen con ellas
+        for table in reversed(tables):
+            session.execute(text(f"DROP TABLE {table}"))
+        for table in tables:
+            meta = metas[table]
+            session.execute(text(f"ALTER TABLE {shadows[table]} RENAME TO {table}"))
+            for k in meta["keys"] + meta["fks"]:
+                session.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {k['conname']}__swap TO {k['conname']}"))
+            for ix in meta["indexes"]:
+                session.execute(text(f"ALTER INDEX {ix['name']}__swap RENAME TO {ix['name']}"))
+            for fk in meta["children"]:
+                session.execute(
+                    text(f"ALTER TABLE {fk['child']} RENAME CONSTRAINT {fk['conname']}__swap TO {fk['conname']}")
+                )
+            for s in meta["seqs"]:
+                session.execute(
+                    text(f"SELECT setval(CAST(:seq AS regclass), COALESCE((SELECT max({s['col']}) FROM {table}), 1))"),
+                    {"seq": s["seq"]},
+                )
         session.commit()
+    except Exception:
+        session.rollback()
+        try:
+            for shadow in shadows.values():
+                session.execute(text(f"DROP TABLE IF EXISTS {shadow} CASCADE"))
+            session.commit()
+        except Exception:
+            pass
+        raise
+
+    return {"restored_rows": sum(restored.values()), "tables": restored}
+
+def _restore_merge(
+    session: Session, table: str, avro_path: Path, conflict: str, allow_invalid: bool = False
+) -> Dict[str, Any]:
+    # set-based por lotes (unnest de arrays), mismo merge que la ingesta; ids existentes según conflict.
+    # No hace commit: el llamador decide la frontera transaccional.
+    # Registros del backup que ya no validan (reglas o FKs huérfanas): RestoreError (rollback de
+    # todo) salvo allow_invalid, en cuyo caso se omiten y se informan en rejected/rejected_reasons.
+    # Las FKs se resuelven en la misma sesión: en un set ya se ven los padres recién cargados.
+    validator = get_validator(table)
+    resolver = ReferenceResolver()
+    counts: Dict[str, Any] = {"restored_rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "rejected": 0}
+    rejected_reasons: Dict[str, int] = {}
+    for chunk in _iter_record_chunks(avro_path, RESTORE_CHUNK_ROWS):
+        parsed, rejects, reasons = validator.validate_rows(chunk)
+        valid_rows = validator.check_references(session, parsed, chunk, rejects, reasons, resolver)
+        counts["restored_rows"] += len(chunk)
+        counts["rejected"] += len(rejects)
+        for k, v in reasons.items():
+            rejected_reasons[k] = rejected_reasons.get(k, 0) + v
+        if rejects and not allow_invalid:
+            raise RestoreError(
+                f"{table}: al menos {counts['rejected']} registros del backup no pasan la validación ({rejected_reasons}); "
+                "allow_invalid=true los omite"
+            )
+        for batch in chunked(valid_rows, BATCH_SIZE):
+            res = validator.merge(session, batch, conflict)
+            counts["inserted"] += res.inserted
+            counts["updated"] += res.updated
+            counts["skipped"] += res.skipped
+    counts["restored_rows"] -= counts["rejected"]
+    counts["rejected_reasons"] = rejected_reasons
+    return counts
+
+def _restore(
+    session: Session, mode: str, items: List[Tuple[str, Path, Optional[int]]], allow_invalid: bool = False
+) -> Dict[str, Any]:
+    """Aplica el modo a una o más tablas (en orden de dependencia) con un único commit final."""
+    if mode == "swap":
+        return _restore_swap(session, items)
+
+    tables = [table for table, _, _ in items]
+    if mode == "truncate_insert":
+        # si se restauran todas las tablas relacionadas el CASCADE no alcanza a nadie más
+        session.execute(text(f"TRUNCATE TABLE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+    conflict = "update_if_changed" if mode == "merge" else "ignore"
+    per_table = {
+        table: _restore_merge(session, table, avro_path, conflict, allow_invalid) for table, avro_path, _ in items
+    }
+    session.commit()
+    if len(per_table) == 1:
+        return next(iter(per_table.values()))
+    return {
+        "restored_rows": sum(r["restored_rows"] for r in per_table.values()),
+        "rejected": sum(r["rejected"] for r in per_table.values()),
+        "tables": per_table,
+    }
+
+@profiled
+def restore_table(
+    table: str,
+    version: Optional[str] = "latest",
+    mode: str = "truncate_insert",
+    as_of: Optional[datetime] = None,
+    allow_invalid: bool = False,
+) -> Dict[str, Any]:
+    """
+    version: nombre exacto, "latest" o None + as_of (última versión creada en o antes de as_of),
+    resueltos contra backup_catalog.
+    Modos:
+    - truncate_insert: TRUNCATE ... CASCADE + carga (la tabla queda vacía durante la carga).
+    - swap: carga en tabla sombra y rename atómico (ver _restore_swap); no toca tablas hijas.
+    - append: agrega solo ids que no existen.
+    - merge: agrega y actualiza filas que cambiaron (row_hash).
+    En truncate_insert/append/merge, un registro que ya no valida aborta el restore sin cambios,
+    salvo allow_invalid=True (se omite y se cuenta en rejected).
+    """
+    if table not in SUPPORTED_TABLES:
+        return {"status": "error", "error": "tabla no soportada", "supported": sorted(SUPPORTED_TABLES)}
+    if mode not in RESTORE_MODES:
+        return {"status": "error", "error": "modo no soportado", "supported": list(RESTORE_MODES)}
+
+    if version in (None, "latest") or as_of is not None:
+        with SessionLocal() as session:
+            version = resolve_version(session, table, version, as_of)
+        if version is None:
+            return {"status": "error", "error": "backup no encontrado", "table": table, "as_of": as_of}
+    if not _valid_version(version):
+        return {"status": "error", "error": "versión inválida", "table": table, "version": version}
+
+    in_dir = BACKUP_ROOT / table / version
+    avro_path = in_dir / "data.avro"
+    if not avro_path.exists():
+        return {"status": "error", "error": "backup no encontrado", "table": table, "version": version}
+
+    # antes de tocar nada: un backup corrupto no se restaura
+    check = verify_backup(table, version)
+    if check["status"] != "ok":
+        return {"status": "error", "error": "backup corrupto", "mode": mode, "verify": check}
+
+    expected_rows = _read_metadata(in_dir).get("row_count")
+
+    with SessionLocal() as session:
+        try:
+            result = _restore(session, mode, [(table, avro_path, expected_rows)], allow_invalid)
+        except RestoreError as exc:
+            return {"status": "error", "error": str(exc), "table": table, "version": version, "mode": mode}
+    if table in DIMENSION_TABLES:
+        invalidate_dimension_cache()
+
+    return {"status": "ok", "table": table, "version": version, "mode": mode, **result}
+
+@profiled
+def restore_set(
+    version: Optional[str] = "latest",
+    mode: str = "truncate_insert",
+    as_of: Optional[datetime] = None,
+    allow_invalid: bool = False,
+) -> Dict[str, Any]:
+    """
+    Restaura un set de backup_all: verifica TODAS las tablas antes de tocar nada y las carga en
+    orden de dependencia (padres primero) con un único commit (swap: un único intercambio).
+    """
+    if mode not in RESTORE_MODES:
+        return {"status": "error", "error": "modo no soportado", "supported": list(RESTORE_MODES)}
+
+    if version in (None, "latest") or as_of is not None:
+        with SessionLocal() as session:
+            version = resolve_set_version(session, version, as_of)
+        if version is None:
+            return {"status": "error", "error": "set de backup no encontrado", "as_of": as_of}
+    if not _valid_version(version):
+        return {"status": "error", "error": "versión inválida", "version": version}
+
+    manifest_path = BACKUP_ROOT / "_sets" / version / "manifest.json"
+    if not manifest_path.exists():
+        return {"status": "error", "error": "set de backup no encontrado", "version": version}
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    # el manifest no decide rutas ni orden: solo tablas conocidas, en RESTORE_ORDER
+    order = manifest.get("restore_order", [])
+    unknown = sorted(set(order) - SUPPORTED_TABLES)
+    if unknown:
+        return {"status": "error", "error": "manifest con tablas no soportadas", "version": version, "tables": unknown}
+
+    items: List[Tuple[str, Path, Optional[int]]] = []
+    for table in [t for t in RESTORE_ORDER if t in order]:
+        check = verify_backup(table, version)
+        if check["status"] != "ok":
+            return {"status": "error", "error": "backup corrupto", "mode": mode, "verify": check}
+        items.append((table, BACKUP_ROOT / table / version / "data.avro", manifest["tables"][table]["row_count"]))
+
+    with SessionLocal() as session:
+        try:
+            result = _restore(session, mode, items, allow_invalid)
+        except RestoreError as exc:
+            return {"status": "error", "error": str(exc), "version": version, "mode": mode}
+    invalidate_dimension_cache()
 
-    return {"status": "ok", "table": table, "version": version, "restored_rows": len(records)}
+    return {"status": "ok", "version": version, "mode": mode, **result}
@@ -1,4 +1,6 @@
-﻿from pydantic_settings import BaseSettings
+﻿from typing import Optional
+
+from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
@@ -8,6 +10,19 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str = "db"
     POSTGRES_PORT: int = 5432
 
+    # Pool del primario (conexiones = DB_POOL_SIZE + DB_MAX_OVERFLOW); los límites de admisión
+    # y los workers de ingesta se acotan contra este total
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+
+    # Réplica de lectura opcional (streaming replication u otra base que haga de réplica).
+    # Sin READ_POSTGRES_HOST todo va al primario.
+    READ_POSTGRES_HOST: Optional[str] = None
+    READ_POSTGRES_PORT: int = 5432
+    READ_POSTGRES_DB: Optional[str] = None
+    READ_MAX_LAG_SECONDS: float = 30.0
+    READ_LAG_CHECK_SECONDS: float = 5.0
+
     @property
     def database_url(self) -> str:
         return (
@@ -15,5 +30,18 @@ class Settings(BaseSettings):
             f"@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
 
+    @property
+    def pool_connections(self) -> int:
+        return self.DB_POOL_SIZE + self.DB_MAX_OVERFLOW
+
+    @property
+    def read_database_url(self) -> Optional[str]:
+        if not self.READ_POSTGRES_HOST:
+            return None
+        return (
+            f"postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
+            f"@{self.READ_POSTGRES_HOST}:{self.READ_POSTGRES_PORT}/{self.READ_POSTGRES_DB or self.POSTGRES_DB}"
+        )
+
 
 settings = Settings()
@@ -0,0 +1,250 @@
+﻿"""
+Lector CSV sobre mmap.
+
+- Dialecto (Sniffer) y header se detectan UNA vez al abrir.
+- Las filas salen como tuplas (sin dict por fila); los campos faltantes se completan con None.
+- Se decodifica por bloque (un decode + split por bloque, no por fila) y solo los bloques
+  con comillas pasan por el módulo csv.
+- Cada bloque informa el offset exacto en bytes tras su última línea (tail / checkpoints).
+- El archivo y el mmap se cierran de forma determinística con el context manager.
+- CsvStream ofrece lo mismo sobre un stream binario (p.ej. un descompresor, ver src/sources.py),
+  leyendo bloques grandes; los offsets son del contenido descomprimido.
+
+Limitación: los bloques se cortan por salto de línea, así que no se soportan campos
+entre comillas que contengan saltos de línea.
+"""
+import csv
+import mmap
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, List, Optional, Sequence, Tuple
+
+Row = Tuple[Optional[str], ...]
+
+_BOM = b"\xef\xbb\xbf"
+
+
+def sniff_dialect(sample: str) -> Any:
+    """Detecta delimitador sobre una muestra; si no puede, asume CSV estándar."""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;|\t")
+    except csv.Error:
+        return csv.excel
+
+
+class _CsvBase(ABC):
+    """Dialecto, header y parseo por bloque compartidos por CsvFile y CsvStream."""
+
+    def __init__(self, expected_headers: Sequence[str]) -> None:
+        self.headers = list(expected_headers)
+        self.dialect: Any = csv.excel
+        self.delimiter = ","
+        self.has_header = False
+        self.data_start = 0      # offset del primer byte de datos (tras BOM/header)
+        self.bytes_read = 0      # bytes (descomprimidos) leídos, para métricas de throughput
+
+    def _detect(self, buf: Any, size: int) -> None:
+        # buf: mmap o bytes con al menos la primera línea completa
+        start = len(_BOM) if buf[: len(_BOM)] == _BOM else 0
+        self.dialect = sniff_dialect(buf[start : start + 4096].decode("utf-8", errors="ignore"))
+        self.delimiter = self.dialect.delimiter
+
+        nl = buf.find(b"\n", start)
+        first_end = size if nl < 0 else nl + 1
+        first_row = next(csv.reader([buf[start:first_end].decode("utf-8")], dialect=self.dialect), [])
+        self.has_header = [c.strip().lower() for c in first_row] == [c.strip().lower() for c in self.headers]
+        self.data_start = first_end if self.has_header else start
+
+    def _fast_path(self, text: str) -> bool:
+        d = self.dialect
+        return (d.quotechar or '"') not in text and not d.skipinitialspace and d.escapechar is None
+
+    def _parse(self, text: str) -> List[Row]:
+        n = len(self.headers)
+        if self._fast_path(text):
+            delim = self.delimiter
+            rows = [tuple(line.rstrip("\r").split(delim)) for line in text.split("\n") if line and line != "\r"]
+        else:
+            rows = [tuple(r) for r in csv.reader(text.split("\n"), dialect=self.dialect) if r]
+        # Igual que DictReader: los campos faltantes quedan en None
+        return [r if len(r) >= n else r + (None,) * (n - len(r)) for r in rows]
+
+    @abstractmethod
+    def iter_chunks(
+        self, start_offset: int = 0, chunk_rows: int = 0, complete_lines_only: bool = False
+    ) -> Iterator[Tuple[List[Row], int, int]]:
+        """Bloques (filas, offset tras la última línea, líneas consumidas) desde start_offset."""
+
+    def rows(self, chunk_rows: int = 8192) -> Iterator[Row]:
+        """Todas las filas; se decodifica por bloques para no tener el texto completo en memoria."""
+        for rows, _, _ in self.iter_chunks(chunk_rows=chunk_rows):
+            yield from rows
+
+    def as_dict(self, row: Row) -> dict:
+        """Fila original como dict (solo para rechazos DQ); campos sobrantes en "_extra"."""
+        n = len(self.headers)
+        out = dict(zip(self.headers, row))
+        if len(row) > n:
+            out["_extra"] = list(row[n:])
+        return out
+
+
+class CsvFile(_CsvBase):
+    def __init__(self, path: Path, expected_headers: Sequence[str]) -> None:
+        super().__init__(expected_headers)
+        self.path = path
+        self.size = 0
+        self._file: Any = None
+        self._mm: Optional[mmap.mmap] = None
+
+    def __enter__(self) -> "CsvFile":
+        self._file = self.path.open("rb")
+        self.size = self.path.stat().st_size
+        if self.size > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._detect(self._mm, self.size)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def iter_chunks(
+        self, start_offset: int = 0, chunk_rows: int = 0, complete_lines_only: bool = False
+    ) -> Iterator[Tuple[List[Row], int, int]]:
+        """
+        Entrega bloques (filas, offset_fin, líneas_consumidas) desde start_offset.
+        - start_offset=0 significa "desde el principio" (se saltan BOM y header).
+        - chunk_rows<=0: un solo bloque con todo el resto del archivo.
+        - complete_lines_only=True (modo tail): una última línea sin salto de línea se
+          considera parcial y no se consume.
+        """
+        mm = self._mm
+        if mm is None:
+            return
+        pos = start_offset
+        header_lines = 0
+        if start_offset == 0:
+            pos = self.data_start
+            header_lines = 1 if self.has_header else 0
+            self.bytes_read += self.data_start
+
+        size = self.size
+        find = mm.find
+        while pos < size:
+            # fin del bloque: chunk_rows saltos de línea más adelante (find en C)
+            end, lines = pos, 0
+            while end < size and (chunk_rows <= 0 or lines < chunk_rows):
+                nl = find(b"\n", end)
+                if nl < 0:
+                    if not complete_lines_only:
+                        end, lines = size, lines + 1
+                    break
+                end, lines = nl + 1, lines + 1
+
+            if end == pos:
+                break
+            self.bytes_read += end - pos
+            yield self._parse(mm[pos:end].decode("utf-8")), end, lines + header_lines
+            header_lines = 0
+            pos = end
+
+        if header_lines:
+            # solo había header: igual se reporta para avanzar el offset
+            yield [], self.data_start, header_lines
+
+
+class CsvStream(_CsvBase):
+    """
+    Lector sobre un stream binario no seekable (descompresor gzip/zstd, objeto remoto):
+    lee bloques de read_size bytes y corta por el último salto de línea de cada bloque.
+    """
+
+    def __init__(self, stream: BinaryIO, expected_headers: Sequence[str], read_size: int = 1 << 22) -> None:
+        super().__init__(expected_headers)
+        self.stream = stream
+        self.read_size = read_size
+        self._head = b""
+
+    def __enter__(self) -> "CsvStream":
+        # primer bloque hasta tener una línea completa (o EOF) para dialecto/header
+        head = self.stream.read(self.read_size)
+        while head and b"\n" not in head:
+            more = self.stream.read(self.read_size)
+            if not more:
+                break
+            head += more
+        self._head = head
+        self.bytes_read = len(head)
+        if head:
+            self._detect(head, len(head))
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stream.close()
+
+    def _blocks(self, skip: int) -> Iterator[bytes]:
+        # bytes de datos desde el offset skip (del contenido descomprimido)
+        head, self._head = self._head, b""
+        pos = len(head)
+        if skip < pos:
+            yield head[skip:]
+        while True:
+            block = self.stream.read(self.read_size)
+            if not block:
+                return
+            self.bytes_read += len(block)
+            if pos + len(block) > skip:
+                yield block[max(0, skip - pos):]
+            pos += len(block)
+
+    def iter_chunks(
+        self, start_offset: int = 0, chunk_rows: int = 0, complete_lines_only: bool = False
+    ) -> Iterator[Tuple[List[Row], int, int]]:
+        """
+        Mismo contrato que CsvFile.iter_chunks. El stream se consume una sola vez; un
+        start_offset > 0 (reanudación) se alcanza descartando bytes ya descomprimidos.
+        """
+        pos = start_offset
+        header_lines = 0
+        if start_offset == 0:
+            pos = self.data_start
+            header_lines = 1 if self.has_header else 0
+
+        pending = b""
+        lines: List[bytes] = []
+        for block in self._blocks(pos):
+            data = pending + block
+            cut = data.rfind(b"\n")
+            if cut < 0:
+                pending = data
+                continue
+            pending = data[cut + 1 :]
+            lines.extend(data[: cut + 1].split(b"\n")[:-1])
+            if chunk_rows <= 0:
+                continue
+            i = 0
+            while len(lines) - i >= chunk_rows:
+                group = lines[i : i + chunk_rows]
+                i += chunk_rows
+                raw = b"\n".join(group) + b"\n"
+                pos += len(raw)
+                yield self._parse(raw.decode("utf-8")), pos, len(group) + header_lines
+                header_lines = 0
+            del lines[:i]
+
+        tail = lines
+        if pending and not complete_lines_only:
+            tail = lines + [pending]
+        if tail:
+            raw = b"\n".join(tail) + (b"\n" if len(tail) == len(lines) else b"")
+            pos += len(raw)
+            yield self._parse(raw.decode("utf-8")), pos, len(tail) + header_lines
+            header_lines = 0
+
+        if header_lines:
+            yield [], self.data_start, header_lines
@@ -1,12 +1,87 @@
-﻿from sqlalchemy import create_engine
+﻿import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 from src.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+engine = create_engine(
+    settings.database_url,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+# Réplica de lectura: backups, lecturas por API y consultas de DQ. Las escrituras siempre al primario.
+replica_engine: Optional[Engine] = (
+    create_engine(settings.read_database_url, pool_pre_ping=True) if settings.read_database_url else None
+)
+
+# Lag en segundos: 0 si la réplica está al día (todo lo recibido ya se aplicó) o si no está en
+# recovery (una segunda base haciendo de réplica); si no, antigüedad de la última transacción aplicada.
+_LAG_SQL = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {"checked_at": 0.0, "lag_seconds": None, "error": None}
+
+
+def _check_replica() -> Dict[str, Any]:
+    # una consulta de lag cada READ_LAG_CHECK_SECONDS como máximo (compartida entre requests)
+    with _lock:
+        now = time.monotonic()
+        if now - _state["checked_at"] >= settings.READ_LAG_CHECK_SECONDS:
+            try:
+                with replica_engine.connect() as conn:
+                    lag = float(conn.execute(_LAG_SQL).scalar_one())
+                _state.update(lag_seconds=lag, error=None)
+            except Exception as exc:
+                if _state["error"] is None:
+                    logger.warning("réplica de lectura no disponible, se usa el primario: %s", exc)
+                _state.update(lag_seconds=None, error=str(exc))
+            _state["checked_at"] = now
+        return dict(_state)
+
+
+def get_read_engine() -> Engine:
+    """
+    Engine para lecturas pesadas: la réplica si está configurada, responde y su lag no supera
+    READ_MAX_LAG_SECONDS; si no, el primario.
+    """
+    if replica_engine is None:
+        return engine
+    state = _check_replica()
+    if state["lag_seconds"] is None or state["lag_seconds"] > settings.READ_MAX_LAG_SECONDS:
+        return engine
+    return replica_engine
+
+
+def read_status() -> Dict[str, Any]:
+    """Estado del ruteo de lecturas (para /health/db)."""
+    if replica_engine is None:
+        return {"configured": False, "target": "primary"}
+    state = _check_replica()
+    healthy = state["lag_seconds"] is not None and state["lag_seconds"] <= settings.READ_MAX_LAG_SECONDS
+    return {
+        "configured": True,
+        "target": "replica" if healthy else "primary",
+        "lag_seconds": state["lag_seconds"],
+        "max_lag_seconds": settings.READ_MAX_LAG_SECONDS,
+        "error": state["error"],
+    }
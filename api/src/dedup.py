@@ -0,0 +1,131 @@
+﻿"""
+Deduplicación en streaming dentro de una corrida (ingesta o /transactions).
+
+Por cada id visto se guarda un digest de 64 bits del contenido (columnas sin la clave):
+- una ventana densa array('Q') sobre el rango de ids vistos [base, base + len) (8 bytes por
+  id); solo crece mientras el rango siga siendo denso (a lo sumo 4 slots por id visto, tope
+  DEDUP_DENSE_MAX_SPAN), así un único id grande no reserva memoria para todos los menores.
+- los ids fuera de la ventana van a un dict exacto.
+- Un id repetido es siempre exacto. Con el mismo digest es una fila repetida (duplicate_row);
+  con otro, duplicate_id. Solo se descarta como duplicate_row con digest idéntico de 64 bits.
+
+Hash no criptográfico: xxh3 si está instalado xxhash, si no blake2b (stdlib).
+"""
+import hashlib
+import json
+import os
+import threading
+from array import array
+from typing import Any, Dict, List, Tuple
+
+from src.validation import ParsedRows, TableSpec, Values
+
+try:  # opcional: hash más rápido
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+# Tope de la ventana densa (slots de 8 bytes: 1 << 22 = 32 MB por corrida); los ids fuera de ella
+# van al dict. Por debajo de DEDUP_DENSE_MIN_SPAN no se exige densidad
+DEDUP_DENSE_MAX_SPAN = int(os.getenv("DEDUP_DENSE_MAX_SPAN", str(1 << 22)))
+DEDUP_DENSE_MIN_SPAN = int(os.getenv("DEDUP_DENSE_MIN_SPAN", str(1 << 16)))
+
+if xxhash is not None:
+    def digest_hex(data: bytes) -> str:
+        return xxhash.xxh3_128_hexdigest(data)
+
+    def _digest64(data: bytes) -> int:
+        return xxhash.xxh3_64_intdigest(data) or 1
+else:
+    def digest_hex(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def _digest64(data: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little") or 1
+
+
+def stable_hash(row_data: Dict[str, Any]) -> str:
+    """Hash estable sobre JSON ordenado (row_hash de rechazos DQ); no criptográfico."""
+    payload = json.dumps(row_data, sort_keys=True, ensure_ascii=False, default=str)
+    return digest_hex(payload.encode("utf-8"))
+
+
+class RunDedup:
+    """Ids (y digest del contenido) vistos en la corrida; compartible entre hilos."""
+
+    def __init__(self, spec: TableSpec) -> None:
+        self.key = spec.columns.index(spec.key)
+        self.base = 0
+        self.dense = array("Q")
+        self.sparse: Dict[Any, int] = {}
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _widen(self, ids: List[Any]) -> None:
+        # extiende la ventana para cubrir los ids enteros del lote si el rango resultante sigue denso
+        ints = [i for i in ids if type(i) is int]
+        if not ints:
+            return
+        lo, hi = min(ints), max(ints)
+        if self.dense:
+            lo, hi = min(lo, self.base), max(hi, self.base + len(self.dense) - 1)
+        span = hi - lo + 1
+        limit = min(DEDUP_DENSE_MAX_SPAN, max(DEDUP_DENSE_MIN_SPAN, 4 * (self.count + len(ints))))
+        if span > limit or span == len(self.dense):
+            return
+        grown = array("Q", bytes(8 * (self.base - lo))) if self.dense else array("Q")
+        grown.extend(self.dense)
+        grown.frombytes(bytes(8 * (span - len(grown))))
+        self.base, self.dense = lo, grown
+        # ids que estaban en el dict y ahora caen en la ventana pasan a ella (un solo lugar por id)
+        for k in [k for k in self.sparse if type(k) is int and lo <= k <= hi]:
+            grown[k - lo] = self.sparse.pop(k)
+
+    def filter(self, parsed: ParsedRows, conflict: str = "ignore") -> List[Tuple[str, Values]]:
+        """
+        Saca de parsed (in place) las filas repetidas en la corrida y las devuelve como
+        (motivo, valores). duplicate_row (mismo digest de 64 bits que la versión vigente del id)
+        se descarta siempre; duplicate_id solo con ignore (gana la primera): con update/replace
+        pasa al merge, que aplica la última, y su digest pasa a ser el vigente.
+        """
+        key = self.key
+        values_list = parsed.values
+        positions = parsed.positions
+        keep_values: List[Values] = []
+        keep_positions = array("I") if positions is not None else None
+        duplicates: List[Tuple[str, Values]] = []
+
+        with self._lock:
+            ids = [v[key] for v in values_list]
+            self._widen(ids)
+            dense, sparse, base = self.dense, self.sparse, self.base
+            top = base + len(dense)
+
+            for n, values in enumerate(values_list):
+                k = ids[n]
+                digest = _digest64(
+                    "\x1f".join([str(x) for i, x in enumerate(values) if i != key]).encode("utf-8")
+                )
+                in_dense = type(k) is int and base <= k < top
+                seen = dense[k - base] if in_dense else sparse.get(k, 0)
+
+                if not seen:
+                    self.count += 1
+                elif seen == digest:
+                    duplicates.append(("duplicate_row", values))
+                    continue
+                elif conflict == "ignore":
+                    duplicates.append(("duplicate_id", values))
+                    continue
+                if in_dense:
+                    dense[k - base] = digest
+                else:
+                    sparse[k] = digest
+                keep_values.append(values)
+                if keep_positions is not None:
+                    keep_positions.append(positions[n])
+
+        if duplicates:
+            parsed.values = keep_values
+            parsed.positions = keep_positions
+        return duplicates
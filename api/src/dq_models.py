@@ -1,17 +1,42 @@
-﻿from sqlalchemy import Column, Integer, String, DateTime, JSON, func, Index
+﻿from sqlalchemy import BigInteger, Column, String, DateTime, func, Index, PrimaryKeyConstraint, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from src.db import Base
 
 class DQRejection(Base):
     __tablename__ = "dq_rejections"
+    # Particionada por mes sobre created_at (ver src/dq_service.py para creación/retención).
+    # La clave de partición debe estar en PK y UNIQUE.
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "created_at", name="dq_rejections_pkey"),
+        UniqueConstraint("run_id", "row_hash", "reason", "created_at", name="uq_dq_rejections_run_hash_reason"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True)
+    id = Column(BigInteger, autoincrement=True)
     source = Column(String, nullable=False)      # p.ej. hired_employees.csv
     table_name = Column(String, nullable=False)  # p.ej. hired_employees
     reason = Column(String, nullable=False)      # motivo del rechazo
-    row_data = Column(JSON, nullable=False)      # fila original
+    row_data = Column(JSONB, nullable=False)     # fila original
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     run_id = Column(String, nullable=False)
     row_hash = Column(String, nullable=False)
 
 
 Index("idx_dq_rejections_created_at", DQRejection.created_at)
+Index("idx_dq_rejections_run_id_id", DQRejection.run_id, DQRejection.id)
+Index("idx_dq_rejections_table_reason_id", DQRejection.table_name, DQRejection.reason, DQRejection.id)
+
+
+class DQRejectionSummary(Base):
+    """Conteo de rechazos por (run_id, tabla, motivo), escrito al cierre de cada corrida."""
+
+    __tablename__ = "dq_rejection_summary"
+
+    run_id = Column(String, primary_key=True)
+    table_name = Column(String, primary_key=True)
+    reason = Column(String, primary_key=True)
+    count = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+Index("idx_dq_rejection_summary_table_reason", DQRejectionSummary.table_name, DQRejectionSummary.reason)
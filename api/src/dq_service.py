@@ -0,0 +1,241 @@
+﻿import json
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from src.db import SessionLocal, get_read_engine
+
+# Retención de rechazos crudos: se eliminan particiones completas (DROP, sin DELETE masivo)
+DQ_RETENTION_DAYS = int(os.getenv("DQ_RETENTION_DAYS", "90"))
+# Particiones mensuales creadas por adelantado (la DEFAULT solo debería recibir lo imprevisto)
+DQ_PARTITIONS_AHEAD = int(os.getenv("DQ_PARTITIONS_AHEAD", "2"))
+
+_PARTITION_RE = re.compile(r"^dq_rejections_p(\d{4})(\d{2})$")
+
+# SQLSTATE esperables al crear una partición
+_DUPLICATE_TABLE = "42P07"      # otra instancia la creó primero
+_CHECK_VIOLATION = "23514"      # la DEFAULT ya tiene filas de ese rango
+
+# Alta de un rechazo. Con la tabla particionada la clave única incluye created_at, así que
+# ON CONFLICT solo deduplica dentro de una transacción: el NOT EXISTS descarta un rechazo ya
+# registrado para (run_id, row_hash, reason) en cualquier partición (p.ej. una reanudación
+# que vuelve a procesar el último lote).
+INSERT_REJECTION_SQL = (
+    "INSERT INTO dq_rejections (run_id, row_hash, source, table_name, reason, row_data) "
+    "SELECT :run_id, :row_hash, :source, :table_name, :reason, CAST(:row_data AS jsonb) "
+    "WHERE NOT EXISTS (SELECT 1 FROM dq_rejections "
+    "WHERE run_id = :run_id AND row_hash = :row_hash AND reason = :reason) "
+    "ON CONFLICT ON CONSTRAINT uq_dq_rejections_run_hash_reason DO NOTHING"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def _list_partitions(session: Session) -> List[str]:
+    rows = session.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'dq_rejections'"
+        )
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def ensure_partitions(session: Session, months_ahead: int = DQ_PARTITIONS_AHEAD) -> List[str]:
+    """Crea las particiones mensuales faltantes desde el mes actual hasta months_ahead. Devuelve las creadas."""
+    existing = set(_list_partitions(session))
+    month = datetime.now(timezone.utc).date().replace(day=1)
+    created: List[str] = []
+
+    for _ in range(months_ahead + 1):
+        nxt = _add_months(month, 1)
+        name = f"dq_rejections_p{month:%Y%m}"
+        if name not in existing:
+            # Savepoint: solo se toleran "ya existe" (carrera con otra instancia) y filas del rango
+            # ya en la DEFAULT (se avisa: ese mes queda en la DEFAULT y la retención usa DELETE);
+            # cualquier otro error (permisos, lock_timeout, ...) se propaga
+            try:
+                with session.begin_nested():
+                    session.execute(
+                        text(
+                            f"CREATE TABLE {name} PARTITION OF dq_rejections "
+                            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{nxt.isoformat()}')"
+                        )
+                    )
+                created.append(name)
+            except DBAPIError as exc:
+                code = getattr(exc.orig, "pgcode", None)
+                if code == _DUPLICATE_TABLE:
+                    pass
+                elif code == _CHECK_VIOLATION:
+                    logger.warning("no se creó %s: dq_rejections_default ya tiene filas de ese mes", name)
+                else:
+                    raise
+        month = nxt
+
+    return created
+
+
+def apply_retention(session: Session, retention_days: int = DQ_RETENTION_DAYS) -> Dict[str, Any]:
+    """
+    Elimina rechazos más antiguos que retention_days.
+    - Particiones mensuales completamente vencidas: DETACH + DROP (costo constante).
+    - Partición DEFAULT: DELETE acotado (normalmente vacía).
+    El resumen (dq_rejection_summary) se conserva: es chico y mantiene el histórico de conteos.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    dropped: List[str] = []
+
+    for name in sorted(_list_partitions(session)):
+        m = _PARTITION_RE.match(name)
+        if not m:
+            continue
+        upper = _add_months(date(int(m.group(1)), int(m.group(2)), 1), 1)
+        if upper <= cutoff.date():
+            session.execute(text(f"ALTER TABLE dq_rejections DETACH PARTITION {name}"))
+            session.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+
+    deleted_default = session.execute(
+        text("DELETE FROM dq_rejections_default WHERE created_at < :cutoff"),
+        {"cutoff": cutoff},
+    ).rowcount
+
+    return {"cutoff": cutoff.isoformat(), "dropped_partitions": dropped, "deleted_from_default": deleted_default}
+
+
+def run_maintenance(retention_days: int = DQ_RETENTION_DAYS) -> Dict[str, Any]:
+    """Crea particiones futuras y aplica la retención en una sola transacción."""
+    with SessionLocal() as session:
+        created = ensure_partitions(session)
+        retention = apply_retention(session, retention_days)
+        session.commit()
+    return {"status": "ok", "created_partitions": created, **retention}
+
+
+def write_summary(session: Session, run_id: str, table_name: str, reasons: Dict[str, int]) -> None:
+    """
+    Persiste el conteo final por motivo de la corrida (idempotente: reemplaza el valor).
+    Se llama al cierre de la corrida, dentro de la misma transacción que los últimos rechazos.
+    """
+    if not reasons:
+        return
+    session.execute(
+        text(
+            "INSERT INTO dq_rejection_summary (run_id, table_name, reason, count) "
+            "VALUES (:run_id, :table_name, :reason, :count) "
+            "ON CONFLICT (run_id, table_name, reason) DO UPDATE SET count = EXCLUDED.count, updated_at = now()"
+        ),
+        [
+            {"run_id": run_id, "table_name": table_name, "reason": reason, "count": count}
+            for reason, count in reasons.items()
+        ],
+    )
+
+
+# =========================
+# Lectura de rechazos
+# =========================
+def _rejection_filters(
+    run_id: Optional[str],
+    table_name: Optional[str],
+    reason: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> Tuple[List[str], Dict[str, Any]]:
+    clauses: List[str] = []
+    params: Dict[str, Any] = {}
+    for col, value in (("run_id", run_id), ("table_name", table_name), ("reason", reason)):
+        if value is not None:
+            clauses.append(f"{col} = :{col}")
+            params[col] = value
+    # El rango sobre created_at además habilita el pruning de particiones
+    if since is not None:
+        clauses.append("created_at >= :since")
+        params["since"] = since
+    if until is not None:
+        clauses.append("created_at < :until")
+        params["until"] = until
+    return clauses, params
+
+
+def iter_rejections(
+    run_id: Optional[str] = None,
+    table_name: Optional[str] = None,
+    reason: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: int = 0,
+    limit: int = 1000,
+) -> Iterator[str]:
+    """
+    Genera una página de rechazos como JSON por partes (para StreamingResponse).
+    - Paginación keyset: WHERE id > :after_id ORDER BY id (sin OFFSET); la siguiente
+      página se pide con after_id = next_after_id.
+    - Cursor del lado del servidor: las filas se leen y emiten de a bloques, nunca
+      se materializa la página completa en memoria.
+    """
+    clauses, params = _rejection_filters(run_id, table_name, reason, since, until)
+    clauses.append("id > :after_id")
+    params.update({"after_id": after_id, "limit": limit})
+
+    sql = text(
+        "SELECT id, run_id, source, table_name, reason, row_data, row_hash, created_at "
+        f"FROM dq_rejections WHERE {' AND '.join(clauses)} "
+        "ORDER BY id LIMIT :limit"
+    )
+
+    yield '{"items":['
+    count = 0
+    last_id: Optional[int] = None
+    with get_read_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=1000).execute(sql, params)
+        for row in result.mappings():
+            item = dict(row)
+            item["created_at"] = item["created_at"].isoformat()
+            yield ("," if count else "") + json.dumps(item, ensure_ascii=False, default=str)
+            count += 1
+            last_id = item["id"]
+
+    # Página completa => puede haber más; next_after_id es el cursor para la siguiente
+    next_after_id = last_id if count == limit else None
+    yield f'],"count":{count},"next_after_id":{json.dumps(next_after_id)}}}'
+
+
+def get_summary(run_id: Optional[str] = None, table_name: Optional[str] = None) -> Dict[str, Any]:
+    """Desglose de rechazos por tabla y motivo desde dq_rejection_summary (sin escanear rechazos crudos)."""
+    clauses: List[str] = []
+    params: Dict[str, Any] = {}
+    if run_id is not None:
+        clauses.append("run_id = :run_id")
+        params["run_id"] = run_id
+    if table_name is not None:
+        clauses.append("table_name = :table_name")
+        params["table_name"] = table_name
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+
+    with get_read_engine().connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT table_name, reason, SUM(count)::bigint AS count, COUNT(DISTINCT run_id) AS runs "
+                f"FROM dq_rejection_summary {where}"
+                "GROUP BY table_name, reason ORDER BY table_name, count DESC"
+            ),
+            params,
+        ).mappings().all()
+
+    items = [dict(r) for r in rows]
+    return {"run_id": run_id, "table_name": table_name, "total": sum(i["count"] for i in items), "items": items}
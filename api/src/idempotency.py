@@ -0,0 +1,165 @@
+﻿import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from src.db import SessionLocal
+
+# Entradas en memoria (LRU); la tabla idempotency_keys es la fuente durable
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# Una key expirada se puede reutilizar con otro body
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# Máximo que espera un duplicado concurrente al request en curso
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+
+# (request_hash, status_code, body)
+Entry = Tuple[str, int, Dict[str, Any]]
+
+
+class IdempotencyConflict(Exception):
+    """La key ya se usó con un body distinto."""
+
+
+class IdempotencyInProgress(Exception):
+    """Otro request con la misma key sigue en curso pasado IDEMPOTENCY_WAIT_SECONDS."""
+
+    def __init__(self, key: str, retry_after: int) -> None:
+        super().__init__(f"request con Idempotency-Key {key!r} todavía en curso")
+        self.retry_after = retry_after
+
+
+def request_hash(payload: Dict[str, Any]) -> str:
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Resultado por key: LRU acotado en memoria + tabla durable. El primer request ejecuta;
+    los duplicados concurrentes del mismo proceso esperan su Future y los de otros procesos
+    el advisory lock de la key, así nunca se ejecuta dos veces.
+    """
+
+    def __init__(self, endpoint: str, max_entries: int = IDEMPOTENCY_CACHE_SIZE) -> None:
+        self.endpoint = endpoint
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Entry]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _remember(self, key: str, entry: Entry) -> None:
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _execute_once(self, key: str, req_hash: str, fn: Callable[[Session], Tuple[int, Dict[str, Any]]]) -> Entry:
+        # una sola sesión/transacción: lock de la key, escrituras de fn y fila de idempotency_keys
+        # se confirman juntas (un crash antes del commit no deja la transacción aplicada sin su key)
+        with SessionLocal() as session:
+            # serializa la key entre procesos/réplicas de la API hasta el commit
+            session.execute(
+                text("SELECT set_config('lock_timeout', :timeout, true)"),
+                {"timeout": f"{int(IDEMPOTENCY_WAIT_SECONDS * 1000)}ms"},
+            )
+            try:
+                session.execute(text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))"), {"key": key})
+            except OperationalError as exc:
+                if getattr(exc.orig, "pgcode", None) == "55P03":  # lock_not_available
+                    raise IdempotencyInProgress(key, max(1, int(IDEMPOTENCY_WAIT_SECONDS))) from exc
+                raise
+            # el timeout es solo para esperar la key, no para las escrituras de fn
+            session.execute(text("SELECT set_config('lock_timeout', '0', true)"))
+            row = session.execute(
+                text(
+                    "SELECT request_hash, status_code, response FROM idempotency_keys "
+                    "WHERE key = :key AND created_at > now() - make_interval(secs => :ttl)"
+                ),
+                {"key": key, "ttl": IDEMPOTENCY_TTL_SECONDS},
+            ).first()
+            if row is not None:
+                return row[0], row[1], row[2]
+
+            status_code, body = fn(session)
+            session.execute(
+                text(
+                    "INSERT INTO idempotency_keys (key, endpoint, request_hash, status_code, response) "
+                    "VALUES (:key, :endpoint, :request_hash, :status_code, CAST(:response AS jsonb)) "
+                    "ON CONFLICT (key) DO UPDATE SET endpoint = EXCLUDED.endpoint, "
+                    "request_hash = EXCLUDED.request_hash, status_code = EXCLUDED.status_code, "
+                    "response = EXCLUDED.response, created_at = now()"
+                ),
+                {
+                    "key": key,
+                    "endpoint": self.endpoint,
+                    "request_hash": req_hash,
+                    "status_code": status_code,
+                    "response": json.dumps(body, ensure_ascii=False, default=str),
+                },
+            )
+            session.commit()
+            return req_hash, status_code, body
+
+    def run(
+        self, key: str, req_hash: str, fn: Callable[[Session], Tuple[int, Dict[str, Any]]]
+    ) -> Tuple[int, Dict[str, Any], bool]:
+        """
+        Devuelve (status_code, body, replayed). fn(session) solo se ejecuta si la key no tiene
+        resultado y debe escribir en esa sesión sin hacer commit. IdempotencyConflict si la key ya
+        se usó con otro body; IdempotencyInProgress si otro request con la key no terminó a tiempo.
+        Las excepciones de fn no se guardan (el cliente puede reintentar con la misma key).
+        """
+        entry = self._cached(key)
+        replayed = entry is not None
+        if entry is None:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+
+            if leader:
+                executed = []
+
+                def _fn(session: Session) -> Tuple[int, Dict[str, Any]]:
+                    executed.append(True)
+                    return fn(session)
+
+                try:
+                    entry = self._execute_once(key, req_hash, _fn)
+                except BaseException as exc:
+                    future.set_exception(exc)
+                    raise
+                else:
+                    self._remember(key, entry)
+                    future.set_result(entry)
+                finally:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+                replayed = not executed
+            else:
+                try:
+                    entry = future.result(timeout=IDEMPOTENCY_WAIT_SECONDS)
+                except FutureTimeout:
+                    raise IdempotencyInProgress(key, max(1, int(IDEMPOTENCY_WAIT_SECONDS))) from None
+                replayed = True
+
+        stored_hash, status_code, body = entry
+        if stored_hash != req_hash:
+            raise IdempotencyConflict(key)
+        return status_code, body, replayed
@@ -0,0 +1,17 @@
+﻿from sqlalchemy import Column, DateTime, Integer, String, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from src.db import Base
+
+
+class IdempotencyKey(Base):
+    """Respuesta original de un request con Idempotency-Key, para devolverla en los reintentos."""
+
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    endpoint = Column(String, nullable=False)        # p.ej. /transactions
+    request_hash = Column(String, nullable=False)    # sha256 del body canónico
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1,16 +1,22 @@
-﻿import csv
-import json
+﻿import json
 import os
 import uuid
-import hashlib
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple, TypeVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-from src.db import SessionLocal
+from src.admission import ADMISSION_ROUTE_LIMITS
+from src.config import settings
+from src.db import SessionLocal, engine
+from src.dedup import RunDedup, stable_hash
+from src.dq_service import INSERT_REJECTION_SQL, write_summary
+from src.profiling import profiled
+from src.read_service import invalidate_dimension_cache
+from src.sources import CsvSource, find_table_file
+from src.validation import SPECS, ParsedRows, ReferenceResolver, Validator, Values, get_validator
 
 
 # =========================
@@ -18,6 +24,17 @@ from src.db import SessionLocal
 # =========================
 DATA_DIR = Path(os.getenv("DATA_DIR", "/app/data"))
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1000"))
+if BATCH_SIZE < 1:
+    raise ValueError(f"BATCH_SIZE debe ser >= 1 (recibido {BATCH_SIZE})")
+# Cada cuántos lotes se confirma un checkpoint (0 = un solo commit al final)
+CHECKPOINT_EVERY = int(os.getenv("CHECKPOINT_EVERY_BATCHES", "10"))
+# true: registra todos los motivos de cada fila rechazada (no solo el primero)
+DQ_COLLECT_ALL_REASONS = os.getenv("DQ_COLLECT_ALL_REASONS", "false").lower() == "true"
+# Archivos procesados en paralelo en la ingesta multi-archivo. Cada worker ocupa una conexión:
+# con ADMISSION_ROUTE_LIMITS["ingest"] corridas en paralelo, workers * corridas no debe superar
+# el pool del primario
+MAX_FILE_WORKERS = max(1, settings.pool_connections // max(1, ADMISSION_ROUTE_LIMITS["ingest"]))
+INGEST_FILE_WORKERS = min(int(os.getenv("INGEST_FILE_WORKERS", "4")), MAX_FILE_WORKERS)
 
 T = TypeVar("T")
 
@@ -31,83 +48,134 @@ def chunked(items: List[T], size: int) -> Iterable[List[T]]:
         yield items[i : i + size]
 
 
-def _open_csv_dictreader(csv_path: Path, expected_headers: List[str]) -> csv.DictReader:
+def _advisory_lock(session: Session, key: str, wait: bool) -> bool:
     """
-    Soporta CSV con o sin headers.
-    - utf-8-sig elimina BOM
-    - Sniffer detecta delimitador
-    - Si la primera fila NO parece header, asigna expected_headers y trata la primera fila como data.
+    Lock de sesión Postgres (sobrevive a los commits intermedios de los checkpoints).
+    La sesión debe estar atada a una conexión fija; se libera con _advisory_unlock.
     """
-    f = csv_path.open("r", encoding="utf-8-sig", newline="")
-    sample = f.read(4096)
-    f.seek(0)
+    fn = "pg_advisory_lock" if wait else "pg_try_advisory_lock"
+    row = session.execute(text(f"SELECT {fn}(hashtext(:key))"), {"key": key}).one()
+    return wait or bool(row[0])
 
-    try:
-        dialect = csv.Sniffer().sniff(sample, delimiters=",;|\t")
-    except csv.Error:
-        dialect = csv.excel
 
-    # Lee primera fila para detectar si hay header
-    pos = f.tell()
-    first_line = f.readline()
-    f.seek(pos)
+def _advisory_unlock(session: Session, key: str) -> None:
+    session.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": key})
 
-    # Parse de primera fila para comparar con expected headers
-    first_row = next(csv.reader([first_line], dialect=dialect), [])
-    first_row_norm = [c.strip().lower() for c in first_row]
-    expected_norm = [c.strip().lower() for c in expected_headers]
 
-    has_header = first_row_norm == expected_norm
+def _file_id(path: Path) -> str:
+    """Identidad del archivo (dispositivo:inodo): cambia si se rota aunque el nuevo sea más grande."""
+    st = path.stat()
+    return f"{st.st_dev}:{st.st_ino}"
 
-    if has_header:
-        return csv.DictReader(f, dialect=dialect)
 
-    # No tiene header: DictReader con fieldnames fijos + saltar “header” manualmente
-    reader = csv.DictReader(f, fieldnames=expected_headers, dialect=dialect)
-    return reader
+def _load_offset(
+    session: Session, source_key: str, table_name: str, run_id: str
+) -> Tuple[int, int, Optional[str]]:
+    """
+    Obtiene (byte_offset, line_number, file_id) confirmados para la fuente, creando la fila si
+    no existe. file_id es None en offsets guardados antes de registrarlo.
+    """
+    session.execute(
+        text(
+            "INSERT INTO ingestion_offsets (source, table_name, byte_offset, line_number, run_id) "
+            "VALUES (:source, :table_name, 0, 0, :run_id) "
+            "ON CONFLICT (source) DO NOTHING"
+        ),
+        {"source": source_key, "table_name": table_name, "run_id": run_id},
+    )
+    row = session.execute(
+        text("SELECT byte_offset, line_number, file_id FROM ingestion_offsets WHERE source = :source"),
+        {"source": source_key},
+    ).one()
+    return int(row[0]), int(row[1]), row[2]
+
+
+def _save_offset(
+    session: Session, source_key: str, byte_offset: int, line_number: int, file_id: str, run_id: str
+) -> None:
+    session.execute(
+        text(
+            "UPDATE ingestion_offsets "
+            "SET byte_offset = :byte_offset, line_number = :line_number, file_id = :file_id, run_id = :run_id, "
+            "updated_at = now() "
+            "WHERE source = :source"
+        ),
+        {
+            "source": source_key,
+            "byte_offset": byte_offset,
+            "line_number": line_number,
+            "file_id": file_id,
+            "run_id": run_id,
+        },
+    )
 
 
+def _load_checkpoints(session: Session, run_id: str, table_name: str) -> List[Dict[str, Any]]:
+    """Checkpoints de la corrida (uno por archivo fuente)."""
+    rows = session.execute(
+        text(
+            "SELECT run_id, table_name, source, mode, conflict, byte_offset, line_number, batches, "
+            "inserted, updated, skipped, rejected, reasons, status, error "
+            "FROM ingestion_checkpoints WHERE run_id = :run_id AND table_name = :table_name ORDER BY source"
+        ),
+        {"run_id": run_id, "table_name": table_name},
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def processed_sources(session: Session, table_name: str, sources: Iterable[str]) -> set:
+    """Fuentes (rutas absolutas) que ya tienen una corrida completa para la tabla."""
+    rows = session.execute(
+        text(
+            "SELECT DISTINCT source FROM ingestion_checkpoints "
+            "WHERE table_name = :table_name AND status = 'completed' AND source = ANY(:sources)"
+        ),
+        {"table_name": table_name, "sources": list(sources)},
+    ).fetchall()
+    return {r[0] for r in rows}
+
+
+def _save_checkpoint(session: Session, state: Dict[str, Any]) -> None:
+    """Upsert del estado de la corrida; se confirma junto con los inserts del mismo tramo."""
+    session.execute(
+        text(
+            "INSERT INTO ingestion_checkpoints "
+            "(run_id, table_name, source, mode, conflict, byte_offset, line_number, batches, inserted, updated, "
+            "skipped, rejected, reasons, status, error) "
+            "VALUES (:run_id, :table_name, :source, :mode, :conflict, :byte_offset, :line_number, :batches, "
+            ":inserted, :updated, :skipped, :rejected, "
+            "CAST(:reasons AS json), :status, :error) "
+            "ON CONFLICT (run_id, table_name, source) DO UPDATE SET "
+            "byte_offset = EXCLUDED.byte_offset, line_number = EXCLUDED.line_number, batches = EXCLUDED.batches, "
+            "inserted = EXCLUDED.inserted, updated = EXCLUDED.updated, skipped = EXCLUDED.skipped, "
+            "rejected = EXCLUDED.rejected, reasons = EXCLUDED.reasons, "
+            "status = EXCLUDED.status, error = EXCLUDED.error, updated_at = now()"
+        ),
+        {**state, "reasons": json.dumps(state["reasons"], ensure_ascii=False), "error": state.get("error")},
+    )
+
+
+def _register_pending(session: Session, run_id: str, table_name: str, sources: Sequence[str], conflict: str) -> None:
+    """
+    Fila 'pending' por archivo de una corrida multi-archivo antes de arrancar el pool: si el
+    proceso cae, resume_ingestion también encuentra los archivos que nunca llegaron a empezar.
+    """
+    session.execute(
+        text(
+            "INSERT INTO ingestion_checkpoints "
+            "(run_id, table_name, source, mode, conflict, byte_offset, line_number, batches, inserted, updated, "
+            "skipped, rejected, reasons, status) "
+            "SELECT :run_id, :table_name, s, 'full', :conflict, 0, 0, 0, 0, 0, 0, 0, CAST('{}' AS json), 'pending' "
+            "FROM unnest(CAST(:sources AS text[])) AS s "
+            "ON CONFLICT (run_id, table_name, source) DO NOTHING"
+        ),
+        {"run_id": run_id, "table_name": table_name, "conflict": conflict, "sources": list(sources)},
+    )
+
 
 # =========================
 # Helpers DQ
 # =========================
-def _bump(reasons: Dict[str, int], key: str) -> None:
-    reasons[key] = reasons.get(key, 0) + 1
-
-
-def _parse_int(v: Any) -> Optional[int]:
-    if v is None:
-        return None
-    s = str(v).strip()
-    if s == "":
-        return None
-    try:
-        return int(s)
-    except ValueError:
-        return None
-
-
-def _parse_datetime(v: Any) -> Optional[datetime]:
-    """Parse ISO-8601 con tolerancia a sufijo Z."""
-    if v is None:
-        return None
-    s = str(v).strip()
-    if s == "":
-        return None
-    try:
-        if s.endswith("Z"):
-            s = s[:-1]
-        return datetime.fromisoformat(s)
-    except ValueError:
-        return None
-
-
-def _stable_hash(row_data: Dict[str, Any]) -> str:
-    """Hash estable (sha256) sobre JSON ordenado para deduplicación por corrida."""
-    payload = json.dumps(row_data, sort_keys=True, ensure_ascii=False)
-    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
-
-
 def _reject(
     session: Session,
     run_id: str,
@@ -119,18 +187,14 @@ def _reject(
     """
     Registra rechazo DQ.
     - row_data se envía como string JSON para evitar "can't adapt type 'dict'"
-    - CAST(:row_data AS json) evita problemas con :row_data::json en algunos parsers
-    - ON CONFLICT evita duplicados por (run_id,row_hash,reason)
+    - CAST(:row_data AS jsonb) evita problemas con :row_data::json en algunos parsers
+    - no duplica (run_id,row_hash,reason) ya registrado en la corrida (ver INSERT_REJECTION_SQL)
     """
-    row_hash = _stable_hash(row_data)
+    row_hash = stable_hash(row_data)
     row_data_json = json.dumps(row_data, ensure_ascii=False)
 
     session.execute(
-        text(
-            "INSERT INTO dq_rejections (run_id, row_hash, source, table_name, reason, row_data) "
-            "VALUES (:run_id, :row_hash, :source, :table_name, :reason, CAST(:row_data AS json)) "
-            "ON CONFLICT ON CONSTRAINT uq_dq_rejections_run_hash_reason DO NOTHING"
-        ),
+        text(INSERT_REJECTION_SQL),
         {
             "run_id": run_id,
             "row_hash": row_hash,
@@ -142,272 +206,468 @@ def _reject(
     )
 
 
+def _merge_rows(
+    session: Session,
+    validator: Validator,
+    rows: List[Values],
+    conflict: str,
+    run_id: str,
+    source: str,
+    reasons: Dict[str, int],
+) -> Dict[str, int]:
+    """
+    Merge por lotes con conteos reales (un statement por lote, ver Validator.insert_sql).
+    Los ids duplicados en el lote se registran como rechazo DQ (los ya existentes solo suman a skipped)
+    y se suman a reasons. Devuelve {"inserted", "updated", "skipped"}.
+    """
+    table_name = validator.spec.table
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    for batch in chunked(rows, BATCH_SIZE):
+        res = validator.merge(session, batch, conflict)
+        counts["inserted"] += res.inserted
+        counts["updated"] += res.updated
+        counts["skipped"] += res.skipped
+        for reason, values in res.duplicates:
+            reasons[reason] = reasons.get(reason, 0) + 1
+            _reject(session, run_id, source, table_name, reason, validator.as_dict(values))
+    return counts
+
+
+def _drop_duplicates(
+    session: Session,
+    validator: Validator,
+    dedup: RunDedup,
+    parsed: ParsedRows,
+    conflict: str,
+    run_id: str,
+    source: str,
+    reasons: Dict[str, int],
+) -> int:
+    """Saca de parsed las filas repetidas en la corrida (ver RunDedup) y las registra como rechazo DQ."""
+    duplicates = dedup.filter(parsed, conflict)
+    for reason, values in duplicates:
+        reasons[reason] = reasons.get(reason, 0) + 1
+        _reject(session, run_id, source, validator.spec.table, reason, validator.as_dict(values))
+    return len(duplicates)
+
+
 # =========================
 # Ingest CSV -> DB
 # =========================
-def ingest_departments(csv_path: Path, run_id: str) -> Dict[str, Any]:
-    reasons: Dict[str, int] = {}
-    inserted = 0
-    rejected = 0
-    payload: List[Dict[str, Any]] = []
+def _ingest_dimension(
+    csv_path: Path, run_id: str, table: str, name_field: str, conflict: str = "ignore"
+) -> Dict[str, Any]:
+    """
+    Ingesta de tablas dimensión (id + nombre) con el validador compilado de la tabla.
+    conflict: política ante ids existentes (ver Validator.insert_sql).
+    """
     source = csv_path.name
+    validator = get_validator(table, DQ_COLLECT_ALL_REASONS, positional=True)
 
-    reader = _open_csv_dictreader(csv_path, expected_headers=["id", "department"])
-    f = reader._fieldnames  # type: ignore[attr-defined]
-    if not f or "id" not in (f or []) or "department" not in (f or []):
-        # headers inesperados => rechazar todo con motivo claro
-        return {
-            "source": source,
-            "table": "departments",
-            "inserted": 0,
-            "rejected": 0,
-            "reasons": {"invalid_headers": 1, "headers_seen": 1},
-            "headers_seen": f,
-        }
-
-    for row in reader:
-        raw = dict(row)
-        rid = _parse_int(raw.get("id"))
-        department = (raw.get("department") or "").strip()
-
-        if rid is None:
-            rejected += 1
-            _bump(reasons, "invalid_id")
-            continue
-        if not department:
-            rejected += 1
-            _bump(reasons, "empty_department")
-            continue
-
-        payload.append({"id": rid, "department": department})
-
-    # cerrar file handle interno del reader
-    try:
-        reader.reader.f.close()  # type: ignore
-    except Exception:
-        pass
+    reader = CsvSource(csv_path, ["id", name_field])
+    with reader as csv_file:
+        parsed, rejects, reasons = validator.validate_rows(csv_file.rows())
 
     with SessionLocal() as session:
-        if payload:
-            sql = text(
-                "INSERT INTO departments (id, department) "
-                "VALUES (:id, :department) "
-                "ON CONFLICT (id) DO NOTHING"
-            )
-            for batch in chunked(payload, BATCH_SIZE):
-                session.execute(sql, batch)
-                inserted += len(batch)
-
+        # ids repetidos en el archivo (con cualquier separación, no solo dentro de un lote)
+        duplicates = _drop_duplicates(
+            session, validator, RunDedup(validator.spec), parsed, conflict, run_id, source, reasons
+        )
+        counts = _merge_rows(session, validator, parsed.values, conflict, run_id, source, reasons)
+        counts["skipped"] += duplicates
+        # cierre de la corrida: duplicate_id/duplicate_row también llegan a dq_rejection_summary
+        write_summary(session, run_id, table, reasons)
         session.commit()
+    invalidate_dimension_cache()
 
     return {
         "source": source,
-        "table": "departments",
-        "inserted": inserted,
-        "rejected": rejected,
+        "table": table,
+        "conflict": conflict,
+        **counts,
+        "rejected": len(rejects),
         "reasons": reasons,
+        "io": reader.stats(),
     }
 
 
-def ingest_jobs(csv_path: Path, run_id: str) -> Dict[str, Any]:
-    reasons: Dict[str, int] = {}
-    inserted = 0
-    rejected = 0
-    payload: List[Dict[str, Any]] = []
-    source = csv_path.name
+@profiled
+def ingest_departments(csv_path: Path, run_id: str, conflict: str = "ignore") -> Dict[str, Any]:
+    return _ingest_dimension(csv_path, run_id, "departments", "department", conflict)
 
-    reader = _open_csv_dictreader(csv_path, expected_headers=["id", "job"])
-    f = reader._fieldnames  # type: ignore[attr-defined]
-    if not f or "id" not in (f or []) or "job" not in (f or []):
-        return {
-            "source": source,
-            "table": "jobs",
-            "inserted": 0,
-            "rejected": 0,
-            "reasons": {"invalid_headers": 1, "headers_seen": 1},
-            "headers_seen": f,
-        }
 
-    for row in reader:
-        raw = dict(row)
-        rid = _parse_int(raw.get("id"))
-        job = (raw.get("job") or "").strip()
+@profiled
+def ingest_jobs(csv_path: Path, run_id: str, conflict: str = "ignore") -> Dict[str, Any]:
+    return _ingest_dimension(csv_path, run_id, "jobs", "job", conflict)
 
-        if rid is None:
-            rejected += 1
-            _bump(reasons, "invalid_id")
-            continue
-        if not job:
-            rejected += 1
-            _bump(reasons, "empty_job")
-            continue
 
-        payload.append({"id": rid, "job": job})
+HIRED_HEADERS = ["id", "name", "datetime", "department_id", "job_id"]
 
-    try:
-        reader.reader.f.close()  # type: ignore
-    except Exception:
-        pass
 
-    with SessionLocal() as session:
-        if payload:
-            sql = text(
-                "INSERT INTO jobs (id, job) "
-                "VALUES (:id, :job) "
-                "ON CONFLICT (id) DO NOTHING"
-            )
-            for batch in chunked(payload, BATCH_SIZE):
-                session.execute(sql, batch)
-                inserted += len(batch)
+def _load_hired_employees(
+    session: Session,
+    rows: Sequence[Any],
+    run_id: str,
+    source: str,
+    resolver: Optional[ReferenceResolver] = None,
+    as_dict: Callable[[Any], Dict[str, Any]] = dict,
+    conflict: str = "ignore",
+    dedup: Optional[RunDedup] = None,
+) -> Dict[str, Any]:
+    """
+    Valida (tipos + FK), inserta por lotes y registra rechazos DQ sobre la sesión dada.
+    rows son tuplas en el orden de HIRED_HEADERS (CsvFile/CsvStream); as_dict solo se usa para
+    armar el row_data de los rechazos.
+    No hace commit: el llamador decide la frontera transaccional.
+    Devuelve {"inserted", "updated", "skipped", "rejected", "reasons"} con conteos reales.
+    """
+    table_name = "hired_employees"
+    validator = get_validator(table_name, DQ_COLLECT_ALL_REASONS, positional=True)
 
-        session.commit()
+    # 1) Validación de tipos + obligatoriedad (DD)
+    parsed, rejects, reasons = validator.validate_rows(rows)
 
-    return {
-        "source": source,
-        "table": "jobs",
-        "inserted": inserted,
-        "rejected": rejected,
-        "reasons": reasons,
-    }
+    # 2) Repetidas en la corrida (antes de gastar lookups de FK en ellas)
+    duplicates = 0
+    if dedup is not None:
+        duplicates = _drop_duplicates(session, validator, dedup, parsed, conflict, run_id, source, reasons)
 
+    # 3) Integridad referencial (solo IDs involucrados y aún no resueltos en la corrida)
+    valid_rows = validator.check_references(session, parsed, rows, rejects, reasons, resolver)
 
-def ingest_hired_employees(csv_path: Path, run_id: str) -> Dict[str, Any]:
-    reasons: Dict[str, int] = {}
-    inserted = 0
-    rejected = 0
+    # 4) Merge por lotes (Batch Loading), por columnas y con conteos reales
+    counts = _merge_rows(session, validator, valid_rows, conflict, run_id, source, reasons)
+    counts["skipped"] += duplicates
 
-    source = csv_path.name
-    table_name = "hired_employees"
+    # 5) Registrar rechazos DQ (uno por motivo)
+    for why, raw in rejects:
+        for reason in why:
+            _reject(session, run_id, source, table_name, reason, as_dict(raw))
 
-    valid_rows: List[Dict[str, Any]] = []
-    rejects: List[Tuple[str, Dict[str, Any]]] = []
+    return {**counts, "rejected": len(rejects), "reasons": reasons}
 
-    dept_ids_needed = set()
-    job_ids_needed = set()
-    parsed_rows: List[Tuple[Dict[str, Any], int, str, datetime, int, int]] = []
 
-    reader = _open_csv_dictreader(csv_path, expected_headers=["id", "name", "datetime", "department_id", "job_id"])
-    f = reader._fieldnames  # type: ignore[attr-defined]
-    expected = {"id", "name", "datetime", "department_id", "job_id"}
-    if not f or not expected.issubset(set(f or [])):
-        return {
-            "source": source,
-            "table": "hired_employees",
-            "inserted": 0,
-            "rejected": 0,
-            "reasons": {"invalid_headers": 1, "headers_seen": 1},
-            "headers_seen": f,
-        }
+@profiled
+def ingest_hired_employees(
+    csv_path: Path, run_id: str, incremental: bool = False, conflict: str = "ignore"
+) -> Dict[str, Any]:
+    """
+    Ingesta de hired_employees en streaming, con checkpoint cada CHECKPOINT_EVERY lotes.
+    - incremental=False: procesa el archivo completo.
+    - incremental=True: retoma desde el último offset confirmado para este archivo y
+      solo procesa las líneas completas agregadas desde entonces (solo CSV sin comprimir).
+    - conflict: política ante ids existentes (ver Validator.insert_sql); queda en el
+      checkpoint para que la reanudación use la misma.
+    Si la corrida falla, resume_ingestion(run_id) la continúa desde su último checkpoint.
+    """
+    return _run_hired_employees(csv_path, run_id, incremental=incremental, conflict=conflict)
 
-    # 1) Validación de tipos + obligatoriedad (DD)
-    for row in reader:
-        raw = dict(row)
-
-        emp_id = _parse_int(raw.get("id"))
-        name = (raw.get("name") or "").strip()
-        dt = _parse_datetime(raw.get("datetime"))
-        dept_id = _parse_int(raw.get("department_id"))
-        job_id = _parse_int(raw.get("job_id"))
-
-        if emp_id is None:
-            rejects.append(("invalid_id", raw))
-            _bump(reasons, "invalid_id")
-            continue
-        if not name:
-            rejects.append(("empty_name", raw))
-            _bump(reasons, "empty_name")
-            continue
-        if dt is None:
-            rejects.append(("invalid_datetime", raw))
-            _bump(reasons, "invalid_datetime")
-            continue
-        if dept_id is None:
-            rejects.append(("missing_department_id", raw))
-            _bump(reasons, "missing_department_id")
-            continue
-        if job_id is None:
-            rejects.append(("missing_job_id", raw))
-            _bump(reasons, "missing_job_id")
-            continue
 
-        dept_ids_needed.add(dept_id)
-        job_ids_needed.add(job_id)
-        parsed_rows.append((raw, emp_id, name, dt, dept_id, job_id))
+@profiled
+def resume_ingestion(run_id: str) -> Dict[str, Any]:
+    """
+    Continúa una corrida de hired_employees interrumpida desde su último checkpoint.
+    En una corrida multi-archivo reanuda (en paralelo) todos los archivos no completados,
+    incluidos los que quedaron 'pending' sin llegar a empezar.
+    """
+    with SessionLocal() as session:
+        checkpoints = _load_checkpoints(session, run_id, "hired_employees")
+
+    if not checkpoints:
+        return {"status": "error", "error": "checkpoint no encontrado", "run_id": run_id}
+    pending = [c for c in checkpoints if c["status"] != "completed"]
+
+    if len(checkpoints) == 1:
+        checkpoint = checkpoints[0]
+        if not pending:
+            return {"status": "completed", "run_id": run_id, "checkpoint": checkpoint}
+        return _run_hired_employees(
+            Path(checkpoint["source"]),
+            run_id,
+            incremental=checkpoint["mode"] == "incremental",
+            conflict=checkpoint["conflict"],
+            checkpoint=checkpoint,
+        )
+
+    if not pending:
+        return {"status": "completed", "run_id": run_id, "files": len(checkpoints)}
+    return _ingest_files(
+        [Path(c["source"]) for c in pending], run_id, pending[0]["conflict"], checkpoints=pending
+    )
+
+
+def _ingest_files(
+    paths: Sequence[Path],
+    run_id: str,
+    conflict: str,
+    workers: int = INGEST_FILE_WORKERS,
+    checkpoints: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Antes de arrancar se registra cada archivo como checkpoint 'pending' (la lista completa de la
+    corrida queda en la DB). Un archivo por worker (cada uno con su conexión y su checkpoint), mismo run_id y un único
+    ReferenceResolver (cada department_id/job_id se consulta a la DB una sola vez por corrida) y un
+    único RunDedup (un id repetido entre archivos distintos también se detecta).
+    El resumen DQ de la corrida se escribe al final, sumando los motivos de todos los archivos.
+    """
+    resolver = ReferenceResolver()
+    dedup = RunDedup(SPECS["hired_employees"])
+    by_source = {c["source"]: c for c in checkpoints or []}
+    with SessionLocal() as session:
+        _register_pending(session, run_id, "hired_employees", [str(p.resolve()) for p in paths], conflict)
+        session.commit()
 
-    try:
-        reader.reader.f.close()  # type: ignore
-    except Exception:
-        pass
+    def _one(path: Path) -> Dict[str, Any]:
+        # path: ruta resuelta, la clave del checkpoint (source es solo el nombre del archivo)
+        key = str(path.resolve())
+        try:
+            return {**_run_hired_employees(
+                path,
+                run_id,
+                incremental=False,
+                conflict=conflict,
+                checkpoint=by_source.get(str(path.resolve())),
+                resolver=resolver,
+                dedup=dedup,
+                write_dq_summary=False,
+            ), "path": key}
+        except Exception as exc:
+            # un archivo fallido no corta al resto; se reanuda con resume_ingestion(run_id)
+            return {"status": "error", "source": path.name, "path": key, "error": str(exc)[:1000]}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, MAX_FILE_WORKERS, len(paths)))) as pool:
+        files = list(pool.map(_one, paths))
+
+    totals = {"inserted": 0, "updated": 0, "skipped": 0, "rejected": 0}
+    reasons: Dict[str, int] = {}
+    for f in files:
+        if f.get("status") == "error":
+            continue
+        for key in totals:
+            totals[key] += f[key]
+        for k, v in f["reasons"].items():
+            reasons[k] = reasons.get(k, 0) + v
 
-    # 2) Integridad referencial (solo IDs involucrados)
+    # motivos de toda la corrida (incluye archivos completados antes de una reanudación)
     with SessionLocal() as session:
-        existing_depts = set()
-        existing_jobs = set()
-
-        if dept_ids_needed:
-            rows_dept = session.execute(
-                text("SELECT id FROM departments WHERE id = ANY(:ids)"),
-                {"ids": list(dept_ids_needed)},
-            ).fetchall()
-            existing_depts = {x[0] for x in rows_dept}
-
-        if job_ids_needed:
-            rows_job = session.execute(
-                text("SELECT id FROM jobs WHERE id = ANY(:ids)"),
-                {"ids": list(job_ids_needed)},
-            ).fetchall()
-            existing_jobs = {x[0] for x in rows_job}
-
-        for raw, emp_id, name, dt, dept_id, job_id in parsed_rows:
-            if dept_id not in existing_depts:
-                rejects.append(("department_fk_not_found", raw))
-                _bump(reasons, "department_fk_not_found")
-                continue
-            if job_id not in existing_jobs:
-                rejects.append(("job_fk_not_found", raw))
-                _bump(reasons, "job_fk_not_found")
-                continue
-
-            valid_rows.append(
-                {
-                    "id": emp_id,
-                    "name": name,
-                    "datetime": dt,
-                    "department_id": dept_id,
-                    "job_id": job_id,
-                }
-            )
-
-        # 3) Insert por lotes (Batch Loading)
-        if valid_rows:
-            sql = text(
-                "INSERT INTO hired_employees (id, name, datetime, department_id, job_id) "
-                "VALUES (:id, :name, :datetime, :department_id, :job_id) "
-                "ON CONFLICT (id) DO NOTHING"
-            )
-            for batch in chunked(valid_rows, BATCH_SIZE):
-                session.execute(sql, batch)
-                inserted += len(batch)
-
-        # 4) Registrar rechazos DQ
-        for reason, raw in rejects:
-            _reject(session, run_id, source, table_name, reason, raw)
-
-        rejected = len(rejects)
+        run_reasons: Dict[str, int] = {}
+        for c in _load_checkpoints(session, run_id, "hired_employees"):
+            for k, v in (c["reasons"] or {}).items():
+                run_reasons[k] = run_reasons.get(k, 0) + v
+        write_summary(session, run_id, "hired_employees", run_reasons)
         session.commit()
 
+    failed = [f for f in files if f.get("status") == "error"]
     return {
-        "source": source,
+        "status": "partial" if failed else "completed",
+        "run_id": run_id,
         "table": "hired_employees",
-        "inserted": inserted,
-        "rejected": rejected,
+        "files": len(files),
+        "failed": len(failed),
+        **totals,
         "reasons": reasons,
+        "io": {
+            "compressed_bytes": sum(f["io"]["compressed_bytes"] for f in files if "io" in f),
+            "uncompressed_bytes": sum(f["io"]["uncompressed_bytes"] for f in files if "io" in f),
+        },
+        "results": files,
     }
 
 
-def ingest_all(data_dir: Path = DATA_DIR) -> Dict[str, Any]:
+@profiled
+def ingest_hired_employees_files(
+    paths: Sequence[Path],
+    run_id: str,
+    conflict: str = "ignore",
+    workers: int = INGEST_FILE_WORKERS,
+    skip_processed: bool = True,
+) -> Dict[str, Any]:
+    """
+    Ingesta multi-archivo de hired_employees (p.ej. part files diarios) con un pool acotado.
+    skip_processed: omite archivos que ya tienen una corrida completa (no se re-procesan).
     """
-    Ingesta histórica desde CSV:
+    paths = list(paths)
+    skipped_files: List[str] = []
+    if skip_processed and paths:
+        with SessionLocal() as session:
+            done = processed_sources(session, "hired_employees", [str(p.resolve()) for p in paths])
+        skipped_files = [p.name for p in paths if str(p.resolve()) in done]
+        paths = [p for p in paths if str(p.resolve()) not in done]
+    if not paths:
+        return {"status": "completed", "run_id": run_id, "files": 0, "skipped_files": skipped_files}
+    return {**_ingest_files(paths, run_id, conflict, workers), "skipped_files": skipped_files}
+
+
+def _run_hired_employees(
+    csv_path: Path,
+    run_id: str,
+    incremental: bool,
+    conflict: str = "ignore",
+    checkpoint: Optional[Dict[str, Any]] = None,
+    resolver: Optional[ReferenceResolver] = None,
+    dedup: Optional[RunDedup] = None,
+    write_dq_summary: bool = True,
+) -> Dict[str, Any]:
+    """
+    Motor de la ingesta de hired_employees (un archivo).
+    - Lee bloques de BATCH_SIZE líneas desde el offset de partida (0, offset tail o checkpoint).
+    - Cada CHECKPOINT_EVERY bloques hace commit de inserts + rechazos + checkpoint (y offset
+      tail) en la misma transacción: tras un fallo no se pierde ni se duplica lo confirmado.
+    - Usa una conexión fija para sostener los advisory locks (corrida y, en tail, fuente)
+      a través de los commits intermedios.
+    - Los ids repetidos en la corrida se detectan en streaming (RunDedup); tras una reanudación
+      los ya confirmados cuentan como existentes en la tabla.
+    - resolver/dedup/write_dq_summary: la ingesta multi-archivo comparte resolver y dedup y escribe
+      el resumen DQ una sola vez con los motivos de todos los archivos.
+    """
+    source = csv_path.name
+    source_key = str(csv_path.resolve())
+    table_name = "hired_employees"
+    run_lock = f"ingest:{run_id}:{table_name}:{source_key}"
+    source_lock = f"tail:{source_key}"
+    reader = CsvSource(csv_path, HIRED_HEADERS)
+    file_id = _file_id(csv_path)
+    if incremental and not reader.seekable:
+        return {"status": "error", "error": "el modo incremental requiere un CSV sin comprimir", "run_id": run_id}
+
+    with engine.connect() as conn, Session(bind=conn) as session:
+        if not _advisory_lock(session, run_lock, wait=False):
+            return {"status": "error", "error": "la corrida ya está en ejecución", "run_id": run_id}
+        if incremental:
+            _advisory_lock(session, source_lock, wait=True)
+
+        try:
+            state: Dict[str, Any] = {
+                "run_id": run_id,
+                "table_name": table_name,
+                "source": source_key,
+                "mode": "incremental" if incremental else "full",
+                "conflict": conflict,
+                "byte_offset": 0,
+                "line_number": 0,
+                "batches": 0,
+                "inserted": 0,
+                "updated": 0,
+                "skipped": 0,
+                "rejected": 0,
+                "reasons": {},
+                "status": "running",
+                "error": None,
+            }
+            reset = False
+            if checkpoint is not None and checkpoint["status"] != "pending":
+                for key in ("byte_offset", "line_number", "batches", "inserted", "updated", "skipped", "rejected"):
+                    state[key] = int(checkpoint[key])
+                state["reasons"] = dict(checkpoint["reasons"] or {})
+                # en comprimidos el offset es del contenido descomprimido: se valida al leer
+                if reader.seekable and reader.size < state["byte_offset"]:
+                    return {"status": "error", "error": "el archivo es más chico que el checkpoint", "run_id": run_id}
+            elif incremental:
+                state["byte_offset"], state["line_number"], saved_file_id = _load_offset(
+                    session, source_key, table_name, run_id
+                )
+                # Archivo rotado (otro inodo, aunque ya sea más grande) o truncado: se reinicia desde el principio
+                reset = reader.size < state["byte_offset"] or (saved_file_id is not None and saved_file_id != file_id)
+                if reset:
+                    state["byte_offset"], state["line_number"] = 0, 0
+
+            start_offset, start_line = state["byte_offset"], state["line_number"]
+            _save_checkpoint(session, state)
+            session.commit()
+
+            resolver = resolver or ReferenceResolver()
+            dedup = dedup or RunDedup(SPECS[table_name])
+            pending = 0
+            with reader as csv_file:
+                chunks = csv_file.iter_chunks(start_offset, BATCH_SIZE, complete_lines_only=incremental)
+                for rows, end_offset, consumed in chunks:
+                    if rows:
+                        out = _load_hired_employees(
+                            session, rows, run_id, source, resolver, csv_file.as_dict, conflict, dedup
+                        )
+                        for key in ("inserted", "updated", "skipped", "rejected"):
+                            state[key] += out[key]
+                        for k, v in out["reasons"].items():
+                            state["reasons"][k] = state["reasons"].get(k, 0) + v
+
+                    state["byte_offset"] = end_offset
+                    state["line_number"] += consumed
+                    state["batches"] += 1
+                    pending += 1
+
+                    if CHECKPOINT_EVERY > 0 and pending >= CHECKPOINT_EVERY:
+                        _commit_checkpoint(session, state, (source_key, file_id) if incremental else None)
+                        pending = 0
+
+            state["status"] = "completed"
+            if write_dq_summary:
+                write_summary(session, run_id, table_name, state["reasons"])
+            _commit_checkpoint(session, state, (source_key, file_id) if incremental else None)
+        except Exception as exc:
+            # Se conserva el último checkpoint confirmado; solo se marca la corrida como fallida.
+            # Best-effort: si la conexión se cayó, el estado queda en "running" y los locks se liberan solos.
+            try:
+                session.rollback()
+                session.execute(
+                    text(
+                        "UPDATE ingestion_checkpoints SET status = 'failed', error = :error, updated_at = now() "
+                        "WHERE run_id = :run_id AND table_name = :table_name AND source = :source"
+                    ),
+                    {"run_id": run_id, "table_name": table_name, "source": source_key, "error": str(exc)[:1000]},
+                )
+                session.commit()
+            except Exception:
+                pass
+            raise
+        finally:
+            try:
+                if incremental:
+                    _advisory_unlock(session, source_lock)
+                _advisory_unlock(session, run_lock)
+                session.commit()
+            except Exception:
+                pass
+
+    result: Dict[str, Any] = {
+        "source": source,
+        "table": table_name,
+        "inserted": state["inserted"],
+        "updated": state["updated"],
+        "skipped": state["skipped"],
+        "rejected": state["rejected"],
+        "reasons": state["reasons"],
+        "checkpoint": {
+            "byte_offset": state["byte_offset"],
+            "line_number": state["line_number"],
+            "batches": state["batches"],
+            "resumed": checkpoint is not None and checkpoint["status"] != "pending",
+        },
+        "io": reader.stats(),
+    }
+    if incremental:
+        result["incremental"] = {
+            "from_offset": start_offset,
+            "to_offset": state["byte_offset"],
+            "from_line": start_line,
+            "to_line": state["line_number"],
+            "reset": reset,
+        }
+    return result
+
+
+def _commit_checkpoint(session: Session, state: Dict[str, Any], tail_source: Optional[Tuple[str, str]]) -> None:
+    # tail_source: (source_key, file_id) en modo incremental
+    _save_checkpoint(session, state)
+    if tail_source is not None:
+        source_key, file_id = tail_source
+        _save_offset(session, source_key, state["byte_offset"], state["line_number"], file_id, state["run_id"])
+    session.commit()
+
+
+@profiled
+def ingest_all(data_dir: Path = DATA_DIR, conflict: str = "ignore") -> Dict[str, Any]:
+    """
+    Ingesta histórica desde CSV (cada uno puede venir como .csv, .csv.gz o .csv.zst):
     - departments.csv
     - jobs.csv
     - hired_employees.csv
@@ -415,8 +675,10 @@ def ingest_all(data_dir: Path = DATA_DIR) -> Dict[str, Any]:
     run_id = str(uuid.uuid4())
 
     results = []
-    results.append(ingest_departments(data_dir / "departments.csv", run_id=run_id))
-    results.append(ingest_jobs(data_dir / "jobs.csv", run_id=run_id))
-    results.append(ingest_hired_employees(data_dir / "hired_employees.csv", run_id=run_id))
+    results.append(ingest_departments(find_table_file(data_dir, "departments"), run_id=run_id, conflict=conflict))
+    results.append(ingest_jobs(find_table_file(data_dir, "jobs"), run_id=run_id, conflict=conflict))
+    results.append(
+        ingest_hired_employees(find_table_file(data_dir, "hired_employees"), run_id=run_id, conflict=conflict)
+    )
 
     return {"run_id": run_id, "results": results}
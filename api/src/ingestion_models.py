@@ -0,0 +1,41 @@
+﻿from sqlalchemy import JSON, BigInteger, Column, DateTime, String, func
+
+from src.db import Base
+
+
+class IngestionOffset(Base):
+    """Último byte/línea confirmado por fuente, para ingesta incremental (tail)."""
+
+    __tablename__ = "ingestion_offsets"
+
+    source = Column(String, primary_key=True)        # ruta absoluta del archivo
+    table_name = Column(String, nullable=False)
+    byte_offset = Column(BigInteger, nullable=False, server_default="0")
+    line_number = Column(BigInteger, nullable=False, server_default="0")
+    file_id = Column(String, nullable=True)          # dispositivo:inodo del archivo al confirmar el offset
+    run_id = Column(String, nullable=False)          # última corrida que avanzó el offset
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class IngestionCheckpoint(Base):
+    """Estado confirmado de una corrida de ingesta, para reanudarla tras un fallo."""
+
+    __tablename__ = "ingestion_checkpoints"
+
+    run_id = Column(String, primary_key=True)
+    table_name = Column(String, primary_key=True)
+    source = Column(String, primary_key=True)        # ruta absoluta del archivo (uno por archivo en multi-archivo)
+    mode = Column(String, nullable=False)            # full | incremental
+    conflict = Column(String, nullable=False, server_default="ignore")  # ignore | update_if_changed | replace
+    byte_offset = Column(BigInteger, nullable=False, server_default="0")
+    line_number = Column(BigInteger, nullable=False, server_default="0")
+    batches = Column(BigInteger, nullable=False, server_default="0")
+    inserted = Column(BigInteger, nullable=False, server_default="0")
+    updated = Column(BigInteger, nullable=False, server_default="0")
+    skipped = Column(BigInteger, nullable=False, server_default="0")
+    rejected = Column(BigInteger, nullable=False, server_default="0")
+    reasons = Column(JSON, nullable=False)
+    status = Column(String, nullable=False)          # pending | running | completed | failed
+    error = Column(String, nullable=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -1,16 +1,119 @@
-﻿from fastapi import FastAPI
+﻿import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from fastapi import Depends, FastAPI, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool
 from sqlalchemy import text
 from pathlib import Path
-from src.ingestion import ingest_all, ingest_departments, ingest_jobs, ingest_hired_employees
-from pathlib import Path
-from src.schemas import TransactionRequest
+from src.ingestion import (
+    DATA_DIR,
+    INGEST_FILE_WORKERS,
+    MAX_FILE_WORKERS,
+    ingest_all,
+    ingest_departments,
+    ingest_hired_employees,
+    ingest_hired_employees_files,
+    ingest_jobs,
+    resume_ingestion,
+)
+from src.sources import ensure_supported, expand as expand_source, find_table_file, resolve as resolve_source
+from src.profiling import (
+    PROFILE_DIR,
+    PROFILER,
+    PROFILING_ENABLED,
+    arm as arm_profiling,
+    armed,
+    profile_middleware,
+)
+from src.watcher import start_watch, stop_all as stop_watchers, stop_watch, watch_status
+from src.schemas import ConflictName, TransactionRequest
 from src.transaction_service import process_transaction
+from src.idempotency import IdempotencyConflict, IdempotencyInProgress, IdempotencyStore, request_hash
+from src.read_service import decode_cursor, iter_hired_employees
+from src.admission import ADMISSION_GLOBAL_LIMIT, BULK, INTERACTIVE, Rejected, controller as admission
+from src.config import settings
 from fastapi import HTTPException
-from src.db import engine
-from src.backup_service import backup_table, restore_table
+from src.db import SessionLocal, engine, read_status
+from src.dq_service import DQ_RETENTION_DAYS, ensure_partitions, get_summary, iter_rejections, run_maintenance
+from src.backup_service import (
+    backup_all,
+    backup_table,
+    list_backups,
+    restore_set,
+    restore_table,
+    sync_catalog,
+    verify_backup,
+)
 from fastapi import Query
 
-app = FastAPI(title="Reto Chapter Lead Data Engineer")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ADMISSION_GLOBAL_LIMIT > settings.pool_connections:
+        logger.warning(
+            "ADMISSION_GLOBAL_LIMIT=%d supera el pool de conexiones (%d); subir DB_POOL_SIZE/DB_MAX_OVERFLOW",
+            ADMISSION_GLOBAL_LIMIT,
+            settings.pool_connections,
+        )
+    # Particiones futuras de dq_rejections; si la DB aún no está migrada, no bloquea el arranque
+    try:
+        with SessionLocal() as session:
+            ensure_partitions(session)
+            session.commit()
+    except Exception:
+        logger.warning("no se pudieron crear particiones de dq_rejections", exc_info=True)
+    yield
+    stop_watchers()
+
+
+app = FastAPI(title="Reto Chapter Lead Data Engineer", lifespan=lifespan)
+transaction_keys = IdempotencyStore("/transactions")
+if PROFILING_ENABLED:
+    # X-Profile: 1 perfila el request; sin PROFILING_ENABLED no hay middleware (costo cero)
+    app.middleware("http")(profile_middleware)
+
+
+def _admit(route: str, priority: int):
+    # control de admisión: ocupa un slot del grupo y del global mientras dura el request.
+    # Dependencia async: la espera en cola corre en el event loop, no ocupa hilos del threadpool
+    async def dependency():
+        try:
+            async with admission.admit_async(route, priority):
+                yield
+        except Rejected as exc:
+            raise HTTPException(
+                status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)}
+            ) from exc
+
+    return Depends(dependency)
+
+
+async def _admitted_stream(route: str, priority: int, body: Iterator[str], media_type: str) -> StreamingResponse:
+    # respuestas en streaming: una dependencia con yield suelta el slot antes de enviar el cuerpo,
+    # así que el slot se toma acá y se libera cuando el cuerpo terminó (o el envío se cortó)
+    try:
+        release = await admission.enter_async(route, priority)
+    except Rejected as exc:
+        raise HTTPException(
+            status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)}
+        ) from exc
+
+    async def admitted():
+        try:
+            async for chunk in iterate_in_threadpool(body):
+                yield chunk
+        finally:
+            release()
+
+    # background: también libera si el cuerpo nunca llegó a iterarse (release es idempotente)
+    return StreamingResponse(admitted(), media_type=media_type, background=BackgroundTask(release))
 
 
 @app.get("/health")
@@ -22,38 +125,248 @@ def health():
 def health_db():
     with engine.connect() as conn:
         conn.execute(text("SELECT 1"))
-    return {"status": "ok", "db": "reachable"}
+    return {"status": "ok", "db": "reachable", "read": read_status()}
+
+def _source_path(source: Optional[str], table_file: str) -> Path:
+    # source: ruta relativa a DATA_DIR, absoluta dentro de DATA_DIR/OBJECT_STORE_ROOT o store://bucket/key
+    try:
+        path = resolve_source(source) if source else find_table_file(DATA_DIR, table_file)
+        ensure_supported(path)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"fuente no encontrada: {source or path.name}")
+    return path
+
+@app.post("/ingest/departments", dependencies=[_admit("ingest", BULK)])
+def ingest_departments_endpoint(conflict: ConflictName = Query("ignore"), source: Optional[str] = None):
+    run_id = str(uuid.uuid4())
+    path = _source_path(source, "departments")
+    return {"run_id": run_id, **ingest_departments(path, run_id=run_id, conflict=conflict)}
+
+@app.post("/ingest/jobs", dependencies=[_admit("ingest", BULK)])
+def ingest_jobs_endpoint(conflict: ConflictName = Query("ignore"), source: Optional[str] = None):
+    run_id = str(uuid.uuid4())
+    path = _source_path(source, "jobs")
+    return {"run_id": run_id, **ingest_jobs(path, run_id=run_id, conflict=conflict)}
 
-@app.post("/ingest/departments")
-def ingest_departments_endpoint():
-    return ingest_departments(Path("/app/data/departments.csv"))
+@app.post("/ingest/hired-employees", dependencies=[_admit("ingest", BULK)])
+def ingest_hired_employees_endpoint(
+    incremental: bool = Query(False), conflict: ConflictName = Query("ignore"), source: Optional[str] = None
+):
+    # incremental=true: solo procesa lo agregado desde el último offset confirmado
+    # conflict=update_if_changed: aplica correcciones sin recargar la tabla
+    run_id = str(uuid.uuid4())
+    path = _source_path(source, "hired_employees")
+    return {
+        "run_id": run_id,
+        **ingest_hired_employees(path, run_id=run_id, incremental=incremental, conflict=conflict),
+    }
 
-@app.post("/ingest/jobs")
-def ingest_jobs_endpoint():
-    return ingest_jobs(Path("/app/data/jobs.csv"))
+@app.post("/ingest/hired-employees/files", dependencies=[_admit("ingest", BULK)])
+def ingest_hired_employees_files_endpoint(
+    source: str = Query(..., description="directorio o glob, p.ej. store://drops/hired/*.csv.gz"),
+    conflict: ConflictName = Query("ignore"),
+    workers: int = Query(INGEST_FILE_WORKERS, ge=1, le=MAX_FILE_WORKERS),
+    skip_processed: bool = True,
+):
+    # un run_id y un resolver de FKs para todos los archivos; motivos DQ agregados
+    try:
+        paths = expand_source(source)
+        for path in paths:
+            ensure_supported(path)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not paths:
+        raise HTTPException(status_code=404, detail=f"sin archivos para {source}")
+    run_id = str(uuid.uuid4())
+    return ingest_hired_employees_files(
+        paths, run_id, conflict=conflict, workers=workers, skip_processed=skip_processed
+    )
 
-@app.post("/ingest/hired-employees")
-def ingest_hired_employees_endpoint():
-    return ingest_hired_employees(Path("/app/data/hired_employees.csv"))
+@app.post("/ingest/watch")
+def ingest_watch_start_endpoint(
+    source: str = Query(...),
+    interval: float = Query(30, ge=1),
+    conflict: ConflictName = Query("ignore"),
+):
+    # polling: ingesta los archivos nuevos de source cuando terminan de llegar
+    try:
+        return start_watch(source, interval, conflict)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-@app.post("/ingest/all")
-def ingest_all_endpoint():
-    return ingest_all()
+@app.get("/ingest/watch")
+def ingest_watch_status_endpoint():
+    return watch_status()
 
-@app.post("/transactions")
-def transactions(req: TransactionRequest):
-    result = process_transaction(table=req.table, rows=req.rows, mode=req.mode)
+@app.delete("/ingest/watch")
+def ingest_watch_stop_endpoint(source: str = Query(...)):
+    result = stop_watch(source)
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result)
+    return result
 
-    # modo strict: si hay error, devolvemos 400 (transacción rechazada)
-    if req.mode == "strict" and "error" in result:
-        raise HTTPException(status_code=400, detail=result)
+@app.post("/ingest/all", dependencies=[_admit("ingest", BULK)])
+def ingest_all_endpoint(conflict: ConflictName = Query("ignore"), source: Optional[str] = None):
+    # source: directorio con departments/jobs/hired_employees (.csv, .csv.gz o .csv.zst)
+    try:
+        data_dir = resolve_source(source) if source else DATA_DIR
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return ingest_all(data_dir, conflict=conflict)
 
+@app.post("/ingest/resume/{run_id}", dependencies=[_admit("ingest", BULK)])
+def ingest_resume_endpoint(run_id: str):
+    # continúa una ingesta interrumpida desde su último checkpoint
+    result = resume_ingestion(run_id)
+    if result.get("status") == "error":
+        raise HTTPException(status_code=404 if "no encontrado" in result["error"] else 409, detail=result)
     return result
 
-@app.post("/backup/{table}")
-def backup_endpoint(table: str):
-    return backup_table(table)
+@app.post("/transactions", dependencies=[_admit("transactions", INTERACTIVE)])
+def transactions(req: TransactionRequest, idempotency_key: Optional[str] = Header(None, max_length=255)):
+    def _run(session=None):
+        result = process_transaction(
+            table=req.table,
+            rows=req.rows,
+            mode=req.mode,
+            collect_all=req.collect_all_reasons,
+            conflict=req.conflict,
+            session=session,
+        )
+        # modo strict: si hay error, devolvemos 400 (transacción rechazada)
+        if req.mode == "strict" and "error" in result:
+            return 400, {"detail": result}
+        return 200, result
+
+    if idempotency_key is None:
+        status_code, body = _run()
+        if status_code != 200:
+            raise HTTPException(status_code=status_code, detail=body["detail"])
+        return body
+
+    # reintento con la misma key: respuesta original sin volver a tocar las tablas
+    try:
+        status_code, body, replayed = transaction_keys.run(idempotency_key, request_hash(req.model_dump()), _run)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key ya usada con otro request")
+    except IdempotencyInProgress as exc:
+        raise HTTPException(status_code=409, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+    return JSONResponse(
+        status_code=status_code, content=body, headers={"Idempotent-Replayed": "true" if replayed else "false"}
+    )
+
+@app.get("/hired-employees")
+async def hired_employees_endpoint(
+    department_id: Optional[int] = None,
+    job_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=100_000),
+    with_names: bool = False,
+):
+    # NDJSON; keyset (datetime, id): la siguiente página se pide con cursor = next_cursor (última línea)
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return await _admitted_stream(
+        "reads",
+        BULK,
+        iter_hired_employees(department_id, job_id, since, until, after=after, limit=limit, with_names=with_names),
+        "application/x-ndjson",
+    )
+
+@app.post("/backup", dependencies=[_admit("backup", BULK)])
+def backup_all_endpoint(parquet: Optional[bool] = None):
+    # todas las tablas en un mismo snapshot (FKs coherentes), misma versión para el set
+    return backup_all(parquet=parquet)
+
+@app.post("/restore", dependencies=[_admit("restore", BULK)])
+def restore_set_endpoint(
+    version: str = Query("latest"),
+    as_of: Optional[datetime] = None,
+    mode: str = Query("truncate_insert"),
+    allow_invalid: bool = False,
+):
+    # restaura un set de POST /backup en orden de dependencia
+    return restore_set(version, mode=mode, as_of=as_of, allow_invalid=allow_invalid)
+
+@app.post("/backup/{table}", dependencies=[_admit("backup", BULK)])
+def backup_endpoint(table: str, parquet: Optional[bool] = None):
+    # parquet=true agrega data.parquet (row groups por año/trimestre); default BACKUP_PARQUET
+    return backup_table(table, parquet=parquet)
+
+@app.post("/backup/{table}/{version}/verify", dependencies=[_admit("backup", BULK)])
+def verify_backup_endpoint(table: str, version: str):
+    # una pasada streaming: estructura AVRO, row_count y checksums (sha256 + crc32 por tramo)
+    return verify_backup(table, version)
+
+@app.get("/backups/{table}")
+def list_backups_endpoint(
+    table: str, limit: int = Query(100, ge=1, le=1000), before: Optional[datetime] = None
+):
+    # desde backup_catalog; siguiente página con before = next_before
+    return list_backups(table, limit=limit, before=before)
+
+@app.post("/backups/sync", dependencies=[_admit("backup", BULK)])
+def sync_backups_endpoint():
+    # registra en el catálogo backups existentes en disco que aún no estén
+    return sync_catalog()
+
+@app.post("/restore/{table}", dependencies=[_admit("restore", BULK)])
+def restore_endpoint(
+    table: str,
+    version: str = Query("latest"),
+    as_of: Optional[datetime] = None,
+    mode: str = Query("truncate_insert"),
+    allow_invalid: bool = False,
+):
+    # version: exacta o "latest"; as_of: última versión creada en o antes de ese instante.
+    # allow_invalid: omite (y cuenta) registros que ya no validan en vez de abortar
+    return restore_table(table, version, mode=mode, as_of=as_of, allow_invalid=allow_invalid)
+
+@app.get("/admin/admission")
+def admission_endpoint():
+    # en curso, profundidad de cola, rechazos y tiempos por grupo de rutas y global
+    return admission.stats()
+
+@app.get("/admin/profiling")
+def profiling_status_endpoint():
+    return {"enabled": PROFILING_ENABLED, "profiler": PROFILER, "dir": str(PROFILE_DIR), "armed": armed()}
+
+@app.post("/admin/profiling")
+def profiling_arm_endpoint(target: str = Query("*"), count: int = Query(1, ge=1, le=100)):
+    # perfila las próximas count corridas de target (p.ej. ingest_all, process_transaction), también en background
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=409, detail="profiling deshabilitado (PROFILING_ENABLED)")
+    return {"armed": arm_profiling(target, count)}
+
+@app.post("/dq/maintenance")
+def dq_maintenance_endpoint(retention_days: int = Query(DQ_RETENTION_DAYS, ge=1)):
+    # crea particiones futuras y elimina particiones vencidas de dq_rejections
+    return run_maintenance(retention_days)
+
+@app.get("/dq/rejections")
+async def dq_rejections_endpoint(
+    run_id: Optional[str] = None,
+    table_name: Optional[str] = None,
+    reason: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=100_000),
+):
+    # keyset: la siguiente página se pide con after_id = next_after_id
+    return await _admitted_stream(
+        "reads",
+        BULK,
+        iter_rejections(run_id, table_name, reason, since, until, after_id=after_id, limit=limit),
+        "application/json",
+    )
 
-@app.post("/restore/{table}")
-def restore_endpoint(table: str, version: str = Query(...), mode: str = Query("truncate_insert")):
-    return restore_table(table, version, mode=mode)
+@app.get("/dq/summary", dependencies=[_admit("reads", BULK)])
+def dq_summary_endpoint(run_id: Optional[str] = None, table_name: Optional[str] = None):
+    return get_summary(run_id=run_id, table_name=table_name)
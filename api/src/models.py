@@ -1,4 +1,5 @@
 ﻿from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
+from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
 from src.db import Base
@@ -9,6 +10,7 @@ class Department(Base):
 
     id = Column(Integer, primary_key=True)
     department = Column(String, nullable=False)
+    row_hash = Column(UUID(as_uuid=False), nullable=True)  # ver validation.row_hash_sql
 
 
 class Job(Base):
@@ -16,6 +18,7 @@ class Job(Base):
 
     id = Column(Integer, primary_key=True)
     job = Column(String, nullable=False)
+    row_hash = Column(UUID(as_uuid=False), nullable=True)  # ver validation.row_hash_sql
 
 
 class HiredEmployee(Base):
@@ -28,10 +31,19 @@ class HiredEmployee(Base):
     # Nullable para soportar CSV con vacíos; DQ/rechazos se implementa en el siguiente hito
     department_id = Column(Integer, ForeignKey("departments.id"), nullable=True)
     job_id = Column(Integer, ForeignKey("jobs.id"), nullable=True)
+    # md5 del contenido (sin id); permite reescribir solo filas que cambiaron (conflict=update_if_changed)
+    row_hash = Column(UUID(as_uuid=False), nullable=True)
 
     department = relationship("Department")
     job = relationship("Job")
 
 
-Index("idx_hired_datetime", HiredEmployee.datetime)
-Index("idx_hired_dept_job_datetime", HiredEmployee.department_id, HiredEmployee.job_id, HiredEmployee.datetime)
+# id al final: keyset (datetime, id) de GET /hired-employees
+Index("idx_hired_datetime", HiredEmployee.datetime, HiredEmployee.id)
+Index(
+    "idx_hired_dept_job_datetime",
+    HiredEmployee.department_id,
+    HiredEmployee.job_id,
+    HiredEmployee.datetime,
+    HiredEmployee.id,
+)
@@ -0,0 +1,122 @@
+﻿"""
+Parsers de celdas para validación/ingesta.
+
+Camino rápido para la forma dominante de cada tipo (str bien formado) y camino lento
+con la semántica tolerante de siempre (trim, sufijo Z, tipos no-str).
+"""
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+UTC = timezone.utc
+
+# Memo de timestamps repetidos (0 = desactivado). Conviene en feeds con pocos valores
+# distintos; con timestamps casi únicos (hired_employees.csv) el memo solo agrega costo.
+DATETIME_MEMO_SIZE = int(os.getenv("DATETIME_MEMO_SIZE", "0"))
+
+_fromisoformat = datetime.fromisoformat
+
+
+def parse_int(v: Any) -> Optional[int]:
+    if v.__class__ is str:
+        # int() ya tolera espacios alrededor: equivale a str(v).strip() sin copiar
+        try:
+            return int(v)
+        except ValueError:
+            return None
+    if v.__class__ is int:
+        return v
+    if v is None:
+        return None
+    s = str(v).strip()
+    if s == "":
+        return None
+    try:
+        return int(s)
+    except ValueError:
+        return None
+
+
+def _to_utc(dt: datetime) -> datetime:
+    tz = dt.tzinfo
+    if tz is UTC:
+        return dt
+    if tz is None:
+        # Sin zona explícita se asume UTC (misma interpretación que hacía timestamptz)
+        return dt.replace(tzinfo=UTC)
+    return dt.astimezone(UTC)
+
+
+def _parse_datetime_slow(v: Any) -> Optional[datetime]:
+    """Camino tolerante: trim, sufijo z/Z en cualquier versión de Python, tipos no-str."""
+    if v is None:
+        return None
+    if isinstance(v, datetime):
+        return _to_utc(v)
+    s = str(v).strip()
+    if s == "":
+        return None
+    aware = s[-1] in "zZ"
+    if aware:
+        s = s[:-1]
+    try:
+        dt = _fromisoformat(s)
+    except ValueError:
+        return None
+    if aware and dt.tzinfo is None:
+        return dt.replace(tzinfo=UTC)
+    return _to_utc(dt)
+
+
+def parse_datetime(v: Any) -> Optional[datetime]:
+    """
+    ISO-8601 -> datetime con zona UTC (aware).
+    Camino rápido: str sin espacios como "YYYY-MM-DDTHH:MM:SSZ" va directo al parser C
+    de fromisoformat (3.11+ entiende la Z y devuelve timezone.utc). Es ~10x más rápido
+    que armar el datetime con slicing + int() en Python.
+    """
+    if v.__class__ is str:
+        try:
+            dt = _fromisoformat(v)
+        except ValueError:
+            return _parse_datetime_slow(v)
+        return dt if dt.tzinfo is UTC else _to_utc(dt)
+    return _parse_datetime_slow(v)
+
+
+def memoized(parser: Callable[[Any], Any], size: int) -> Callable[[Any], Any]:
+    """
+    Envuelve un parser con un memo acotado por valor de entrada (solo str).
+    Al llenarse deja de insertar: sin desalojo, el costo por búsqueda es un dict.get.
+    """
+    memo: Dict[str, Any] = {}
+    get = memo.get
+
+    def _parse(v: Any) -> Any:
+        if v.__class__ is not str:
+            return parser(v)
+        out = get(v)
+        if out is None:
+            out = parser(v)
+            if out is not None and len(memo) < size:
+                memo[v] = out
+        return out
+
+    return _parse
+
+
+parse_datetime_memo = memoized(parse_datetime, DATETIME_MEMO_SIZE) if DATETIME_MEMO_SIZE > 0 else parse_datetime
+
+
+def parse_str(v: Any) -> str:
+    """Texto con trim; None se normaliza a vacío (la obligatoriedad la decide la regla)."""
+    if v is None:
+        return ""
+    return (v if v.__class__ is str else str(v)).strip()
+
+
+def parse_str_raw(v: Any) -> str:
+    """Como parse_str pero sin trim."""
+    if v is None:
+        return ""
+    return v if v.__class__ is str else str(v)
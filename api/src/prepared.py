@@ -0,0 +1,65 @@
+﻿"""
+Sentencias preparadas del lado del servidor para el SQL caliente (merge por lotes y
+lookups de FK), que /transactions e ingesta ejecutan una y otra vez con el mismo texto.
+
+Cada statement se prepara (PREPARE) la primera vez que se usa en una conexión del pool y
+después solo se ejecuta (EXECUTE): el servidor no vuelve a parsear ni analizar el SQL y,
+tras unas ejecuciones, puede reutilizar un plan genérico. Los nombres preparados viven en
+connection.info, que SQLAlchemy descarta junto con la conexión DBAPI (invalidate/reconexión).
+Las sentencias preparadas no son transaccionales: sobreviven a un rollback.
+
+PREPARED_STATEMENTS=0 vuelve a text() plano (p.ej. detrás de PgBouncer en modo transaction,
+donde la conexión de servidor cambia entre transacciones).
+"""
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.orm import Session
+
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "1") == "1"
+
+# :nombre fuera de literales ('...') y de casts (::tipo)
+_TOKEN = re.compile(r"'(?:[^']|'')*'|(?<!:):(\w+)")
+
+
+@lru_cache(maxsize=256)
+def _compile(sql: str) -> Tuple[str, str, Tuple[str, ...]]:
+    """(nombre, cuerpo con $n, nombres de parámetros en orden) para un SQL con :nombre."""
+    names: list = []
+
+    def sub(m: "re.Match[str]") -> str:
+        if m.group(1) is None:
+            return m.group(0)
+        if m.group(1) not in names:
+            names.append(m.group(1))
+        return f"${names.index(m.group(1)) + 1}"
+
+    body = _TOKEN.sub(sub, sql)
+    # nombre estable derivado del texto: mismo SQL => mismo statement en todos los workers
+    name = "ps_" + hashlib.blake2b(body.encode("utf-8"), digest_size=8).hexdigest()
+    return name, body, tuple(names)
+
+
+def execute(session: Session, sql: str, params: Dict[str, Any]) -> CursorResult:
+    """
+    Ejecuta sql (estilo text(), con :nombre) como sentencia preparada en la conexión de la
+    sesión, dentro de su transacción. El PREPARE va en un round-trip propio solo la primera vez
+    por conexión, así un error del EXECUTE nunca deja la caché desalineada con el servidor.
+    """
+    if not PREPARED_STATEMENTS:
+        return session.execute(text(sql), params)
+
+    name, body, names = _compile(sql)
+    conn = session.connection()
+    prepared = conn.connection.info.setdefault("prepared_statements", set())
+    if name not in prepared:
+        # sin parámetros el driver no interpreta '%', el cuerpo va tal cual
+        conn.exec_driver_sql(f"PREPARE {name} AS {body}")
+        prepared.add(name)
+    args = ", ".join(f"%({n})s" for n in names)
+    return conn.exec_driver_sql(f"EXECUTE {name} ({args})" if names else f"EXECUTE {name}", {n: params[n] for n in names})
@@ -0,0 +1,157 @@
+﻿"""
+Profiling bajo demanda de requests y corridas en background.
+
+- Desactivado (PROFILING_ENABLED=false, default) @profiled devuelve la función original y el
+  middleware no se registra: costo cero.
+- Activado, se perfila:
+  * un request con el header X-Profile: 1 (el middleware marca el request en un contextvar), o
+  * las próximas N corridas armadas con arm() (POST /admin/profiling), incluidas las del watcher.
+- Se perfila la corrida más externa (ingest_all, no cada ingest_* interno) en el hilo que la
+  ejecuta; los hilos de un pool (ingesta multi-archivo, backup_all) no quedan incluidos.
+- Artefactos en PROFILE_DIR/<run_id>/<función>-<timestamp>.{prof,txt} (cProfile, determinístico) o .html
+  con PROFILER=pyinstrument (sampling, si está instalado).
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+try:  # opcional: profiler por sampling
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # pragma: no cover
+    SamplingProfiler = None
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "/app/profiles"))
+# cprofile | pyinstrument
+PROFILER = os.getenv("PROFILER", "cprofile")
+PROFILE_HEADER = "x-profile"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class ProfileRequest:
+    """Pedido de profiling de un request; acumula los artefactos generados durante el mismo."""
+
+    __slots__ = ("artifacts",)
+
+    def __init__(self) -> None:
+        self.artifacts: List[str] = []
+
+
+_request: ContextVar[Optional[ProfileRequest]] = ContextVar("profile_request", default=None)
+_active = threading.local()
+_armed_lock = threading.Lock()
+_armed: Dict[str, int] = {}   # función ("*" = cualquiera) -> corridas restantes a perfilar
+
+
+def arm(target: str = "*", count: int = 1) -> Dict[str, Any]:
+    """Perfila las próximas count corridas de target (nombre de función decorada o "*")."""
+    with _armed_lock:
+        _armed[target] = _armed.get(target, 0) + count
+        return dict(_armed)
+
+
+def armed() -> Dict[str, int]:
+    with _armed_lock:
+        return dict(_armed)
+
+
+def _take_armed(name: str) -> bool:
+    with _armed_lock:
+        for key in (name, "*"):
+            if _armed.get(key, 0) > 0:
+                _armed[key] -= 1
+                if not _armed[key]:
+                    del _armed[key]
+                return True
+    return False
+
+
+def _run_id_of(result: Any, kwargs: Dict[str, Any]) -> str:
+    if isinstance(result, dict) and result.get("run_id"):
+        return str(result["run_id"])
+    if kwargs.get("run_id"):
+        return str(kwargs["run_id"])
+    return str(uuid.uuid4())
+
+
+def _save(name: str, run_id: str, profiler: Any, elapsed: float) -> str:
+    out_dir = PROFILE_DIR / run_id
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # varias corridas con el mismo run_id (p.ej. una reanudación) no se pisan
+    stem = f"{name}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:6]}"
+    if SamplingProfiler is not None and isinstance(profiler, SamplingProfiler):
+        path = out_dir / f"{stem}.html"
+        path.write_text(profiler.output_html(), encoding="utf-8")
+        return str(path)
+
+    path = out_dir / f"{stem}.prof"
+    profiler.dump_stats(str(path))
+    text = io.StringIO()
+    text.write(f"{name} run_id={run_id} wall={elapsed:.3f}s\n")
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+    (out_dir / f"{stem}.txt").write_text(text.getvalue(), encoding="utf-8")
+    return str(path)
+
+
+def profiled(fn: F) -> F:
+    """Perfila fn si el request lo pidió o hay corridas armadas; sin PROFILING_ENABLED no la envuelve."""
+    if not PROFILING_ENABLED:
+        return fn
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        request = _request.get()
+        if getattr(_active, "on", False) or (request is None and not _take_armed(name)):
+            return fn(*args, **kwargs)
+
+        profiler: Any
+        if PROFILER == "pyinstrument" and SamplingProfiler is not None:
+            profiler = SamplingProfiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        _active.on = True
+        start = time.perf_counter()
+        result: Any = None
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            _active.on = False
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+            else:
+                profiler.stop()
+            path = _save(name, _run_id_of(result, kwargs), profiler, elapsed)
+            if request is not None:
+                request.artifacts.append(path)
+
+    return wrapper  # type: ignore[return-value]
+
+
+async def profile_middleware(request: Any, call_next: Callable[[Any], Any]) -> Any:
+    """Solo se registra con PROFILING_ENABLED; X-Profile: 1 perfila las corridas del request."""
+    if request.headers.get(PROFILE_HEADER) not in ("1", "true"):
+        return await call_next(request)
+    marker = ProfileRequest()
+    token = _request.set(marker)
+    try:
+        response = await call_next(request)
+    finally:
+        _request.reset(token)
+    # los endpoints sync corren en el threadpool con una copia del contexto: el objeto es compartido
+    if marker.artifacts:
+        response.headers["X-Profile-Artifacts"] = ",".join(marker.artifacts)
+    return response
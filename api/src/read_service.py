@@ -0,0 +1,124 @@
+﻿import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from src.db import get_read_engine
+
+# Vigencia del mapa id -> nombre de departments/jobs (tablas chicas, cambian poco)
+DIMENSION_CACHE_TTL_SECONDS = float(os.getenv("DIMENSION_CACHE_TTL_SECONDS", "300"))
+
+# Tablas cacheadas: quien las escribe llama a invalidate_dimension_cache después del commit
+DIMENSION_TABLES = ("departments", "jobs")
+
+_dimension_lock = threading.Lock()
+_dimension_cache: Optional[Tuple[float, Dict[str, Dict[int, str]]]] = None
+
+
+def invalidate_dimension_cache() -> None:
+    global _dimension_cache
+    with _dimension_lock:
+        _dimension_cache = None
+
+
+def _dimension_names(conn: Connection) -> Dict[str, Dict[int, str]]:
+    """Mapa {departments, jobs} id -> nombre, cacheado DIMENSION_CACHE_TTL_SECONDS (sin JOIN por fila)."""
+    global _dimension_cache
+    with _dimension_lock:
+        cached = _dimension_cache
+        if cached is not None and time.monotonic() - cached[0] < DIMENSION_CACHE_TTL_SECONDS:
+            return cached[1]
+        names = {
+            "departments": dict(conn.execute(text("SELECT id, department FROM departments")).all()),
+            "jobs": dict(conn.execute(text("SELECT id, job FROM jobs")).all()),
+        }
+        _dimension_cache = (time.monotonic(), names)
+        return names
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = json.dumps([ts.isoformat(), row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """ValueError si el cursor no es uno emitido por encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception as exc:
+        raise ValueError("cursor inválido") from exc
+
+
+def iter_hired_employees(
+    department_id: Optional[int] = None,
+    job_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: int = 1000,
+    with_names: bool = False,
+) -> Iterator[str]:
+    """
+    Genera una página de hired_employees como NDJSON (una fila por línea, para StreamingResponse).
+    - Keyset sobre (datetime, id), el orden de idx_hired_datetime / idx_hired_dept_job_datetime
+      (ambos terminan en id): sin filtros o con department_id + job_id la página es un rango del
+      índice, sin OFFSET ni sort.
+    - Cursor del lado del servidor: memoria constante sin importar el tamaño de la exportación.
+    - with_names: agrega department/job desde un mapa cacheado en memoria.
+    - La última línea es {"count": n, "next_cursor": ...}; next_cursor es null en la última página.
+    """
+    clauses: List[str] = []
+    params: Dict[str, Any] = {"limit": limit}
+    if department_id is not None:
+        clauses.append("department_id = :department_id")
+        params["department_id"] = department_id
+    if job_id is not None:
+        clauses.append("job_id = :job_id")
+        params["job_id"] = job_id
+    if since is not None:
+        clauses.append("datetime >= :since")
+        params["since"] = since
+    if until is not None:
+        clauses.append("datetime < :until")
+        params["until"] = until
+    if after is not None:
+        clauses.append("(datetime, id) > (:after_ts, :after_id)")
+        params["after_ts"], params["after_id"] = after
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+
+    sql = text(
+        "SELECT id, name, datetime, department_id, job_id "
+        f"FROM hired_employees {where}"
+        "ORDER BY datetime, id LIMIT :limit"
+    )
+
+    count = 0
+    last: Optional[Tuple[datetime, int]] = None
+    with get_read_engine().connect() as conn:
+        names = _dimension_names(conn) if with_names else None
+        result = conn.execution_options(stream_results=True, max_row_buffer=1000).execute(sql, params)
+        for row in result:
+            item = {
+                "id": row.id,
+                "name": row.name,
+                "datetime": row.datetime.isoformat(),
+                "department_id": row.department_id,
+                "job_id": row.job_id,
+            }
+            if names is not None:
+                item["department"] = names["departments"].get(row.department_id)
+                item["job"] = names["jobs"].get(row.job_id)
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+            count += 1
+            last = (row.datetime, row.id)
+
+    next_cursor = encode_cursor(*last) if last is not None and count == limit else None
+    yield json.dumps({"count": count, "next_cursor": next_cursor}) + "\n"
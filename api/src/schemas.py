@@ -4,12 +4,17 @@ from pydantic import BaseModel, Field
 
 TableName = Literal["departments", "jobs", "hired_employees"]
 ModeName = Literal["strict", "partial"]
+ConflictName = Literal["ignore", "update_if_changed", "replace"]
 
 
 class TransactionRequest(BaseModel):
     table: TableName
     mode: ModeName = "strict"
     rows: List[Dict[str, Any]] = Field(..., min_length=1, max_length=1000)
+    # true: reporta todos los motivos de cada fila rechazada (no solo el primero)
+    collect_all_reasons: bool = False
+    # política ante ids existentes: ignore | update_if_changed | replace
+    conflict: ConflictName = "ignore"
 
 
 class TransactionResponse(BaseModel):
@@ -18,5 +23,7 @@ class TransactionResponse(BaseModel):
     mode: str
     received: int
     inserted: int
+    updated: int = 0
+    skipped: int = 0                # duplicados en el lote, ids existentes (ignore) o sin cambios
     rejected: int
     reasons: Dict[str, int]
@@ -0,0 +1,180 @@
+﻿"""
+Fuentes de ingesta: archivos locales o un directorio que imita un object store, planos
+o comprimidos (.gz siempre; .zst si está instalado zstandard).
+
+- Se descomprime en streaming (sin archivo intermedio) con lecturas de SOURCE_READ_BYTES.
+- Cada fuente mide bytes comprimidos, bytes descomprimidos y tiempo de lectura.
+- Los CSV planos locales siguen yendo por mmap (CsvFile); el resto por CsvStream.
+"""
+import gzip
+import os
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence, Union
+
+from src.csv_reader import CsvFile, CsvStream
+
+try:  # opcional: .zst
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "/app/data"))
+# Raíz del "object store" local: store://<bucket>/<key> -> OBJECT_STORE_ROOT/<bucket>/<key>
+OBJECT_STORE_ROOT = Path(os.getenv("OBJECT_STORE_ROOT", "/app/objects"))
+# Tamaño de cada lectura del archivo (y del descompresor)
+SOURCE_READ_BYTES = int(os.getenv("SOURCE_READ_BYTES", str(4 << 20)))
+
+STORE_SCHEME = "store://"
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+# Extensiones buscadas para un nombre de tabla dentro de un directorio de fuentes
+TABLE_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+
+
+class _CountingReader:
+    """Envuelve un stream binario y cuenta los bytes leídos."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self.raw = raw
+        self.bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.bytes += len(data)
+        return data
+
+    def readinto(self, buf: Any) -> int:
+        n = self.raw.readinto(buf)
+        self.bytes += n or 0
+        return n
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+def resolve(uri: Union[str, Path]) -> Path:
+    """
+    store://bucket/key -> OBJECT_STORE_ROOT/bucket/key; una ruta relativa -> DATA_DIR/ruta;
+    una absoluta solo si cae dentro de DATA_DIR u OBJECT_STORE_ROOT. ValueError si la ruta
+    (ya resuelta: sin '..' ni symlinks) escapa de esas raíces; uri llega del cliente.
+    """
+    if isinstance(uri, Path):
+        return uri
+    if uri.startswith(STORE_SCHEME):
+        roots, path = [OBJECT_STORE_ROOT], OBJECT_STORE_ROOT / uri[len(STORE_SCHEME):]
+    elif os.path.isabs(uri):
+        roots, path = [DATA_DIR, OBJECT_STORE_ROOT], Path(uri)
+    else:
+        roots, path = [DATA_DIR], DATA_DIR / uri
+    path = path.resolve()
+    if not any(path.is_relative_to(root.resolve()) for root in roots):
+        raise ValueError(f"fuente fuera de {' / '.join(str(r) for r in roots)}: {uri}")
+    return path
+
+
+def expand(uri: str) -> List[Path]:
+    """
+    Archivos de una fuente multi-archivo, ordenados: un directorio (todos sus .csv, .csv.gz
+    y .csv.zst) o un glob (p.ej. store://drops/hired/*.csv.gz). ValueError si escapa de la raíz.
+    """
+    parts = uri.split("/")
+    first_glob = next((i for i, part in enumerate(parts) if any(c in part for c in "*?[")), None)
+    if first_glob is None:
+        base, pattern = resolve(uri), None
+    else:
+        base, pattern = resolve("/".join(parts[:first_glob]) or "."), "/".join(parts[first_glob:])
+
+    if pattern is None:
+        if not base.is_dir():
+            return [base]
+        files = [p for suffix in TABLE_SUFFIXES for p in base.glob(f"*{suffix}")]
+    else:
+        files = list(base.glob(pattern))
+        root = base.resolve()
+        if any(not p.resolve().is_relative_to(root) for p in files):
+            raise ValueError(f"fuente fuera de {base}: {uri}")
+    return sorted(p for p in set(files) if p.is_file())
+
+
+def compression_of(path: Path) -> Optional[str]:
+    return COMPRESSIONS.get(path.suffix.lower())
+
+
+def ensure_supported(path: Path) -> None:
+    """ValueError si la compresión de la fuente necesita un paquete no instalado."""
+    if compression_of(path) == "zstd" and zstandard is None:
+        raise ValueError("lectura .zst requiere el paquete zstandard")
+
+
+def find_table_file(directory: Path, table_file: str) -> Path:
+    """departments -> directory/departments.csv | .csv.gz | .csv.zst (el primero que exista)."""
+    for suffix in TABLE_SUFFIXES:
+        candidate = directory / f"{table_file}{suffix}"
+        if candidate.exists():
+            return candidate
+    # sin candidatos: la ruta plana, para que el error de lectura nombre el archivo esperado
+    return directory / f"{table_file}.csv"
+
+
+class CsvSource:
+    """
+    Context manager que abre la fuente y entrega un lector CSV (CsvFile o CsvStream) con el
+    mismo contrato de iter_chunks/rows/as_dict. Al cerrar queda stats() con bytes y throughput.
+    """
+
+    def __init__(self, path: Path, expected_headers: Sequence[str]) -> None:
+        self.path = path
+        self.headers = expected_headers
+        self.compression = compression_of(path)
+        self.size = path.stat().st_size
+        self._counter: Optional[_CountingReader] = None
+        self._reader: Any = None
+        self._started = 0.0
+        self._elapsed = 0.0
+
+    @property
+    def seekable(self) -> bool:
+        # solo el CSV plano se lee por mmap (offsets de bytes reales, modo tail)
+        return self.compression is None
+
+    def __enter__(self) -> Union[CsvFile, CsvStream]:
+        self._started = time.perf_counter()
+        if self.compression is None:
+            self._reader = CsvFile(self.path, self.headers).__enter__()
+            return self._reader
+
+        self._counter = _CountingReader(self.path.open("rb", buffering=SOURCE_READ_BYTES))
+        if self.compression == "gzip":
+            stream: Any = gzip.GzipFile(fileobj=self._counter, mode="rb")
+        else:
+            try:
+                ensure_supported(self.path)
+            except ValueError:
+                self._counter.close()
+                raise
+            stream = zstandard.ZstdDecompressor().stream_reader(self._counter, read_size=SOURCE_READ_BYTES)
+        self._reader = CsvStream(stream, self.headers, read_size=SOURCE_READ_BYTES).__enter__()
+        return self._reader
+
+    def __exit__(self, *exc: Any) -> None:
+        try:
+            self._reader.__exit__(*exc)
+        finally:
+            self._elapsed = time.perf_counter() - self._started
+
+    def stats(self) -> Dict[str, Any]:
+        """Bytes leídos de disco vs. descomprimidos y throughput (descomprimido) de la corrida completa."""
+        uncompressed = self._reader.bytes_read if self._reader is not None else 0
+        compressed = self._counter.bytes if self._counter is not None else uncompressed
+        seconds = max(self._elapsed, 1e-9)
+        return {
+            "compression": self.compression or "none",
+            "compressed_bytes": compressed,
+            "uncompressed_bytes": uncompressed,
+            "ratio": round(uncompressed / compressed, 2) if compressed else None,
+            "seconds": round(self._elapsed, 3),
+            "mb_per_s": round(uncompressed / seconds / 1e6, 2),
+        }
@@ -0,0 +1,453 @@
+﻿"""
+Motor de validación declarativo.
+
+Cada tabla se describe con un TableSpec (campos tipados, obligatoriedad, trim, FKs,
+predicados custom y códigos de motivo). El spec se compila UNA vez a una función Python
+de código lineal (sin loops ni lookups de reglas por fila), compartida por la ingesta CSV
+y por /transactions.
+
+Representación compacta: una fila válida es una tupla de valores en el orden de
+spec.columns (sin dict por fila) y se inserta por columnas (unnest de arrays). La fila
+original solo se conserva para las rechazadas.
+"""
+import threading
+from array import array
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from src import prepared
+from src.parsers import parse_datetime_memo, parse_int, parse_str, parse_str_raw
+
+# Valores tipados de una fila válida, en el orden de spec.columns
+Values = Tuple[Any, ...]
+# (valores | None, motivos); motivos == () si la fila es válida
+RowResult = Tuple[Optional[Values], Tuple[str, ...]]
+# Fila original: dict por columna (/transactions) o tupla posicional (lector CSV)
+RawRow = Any
+
+_PARSERS: Dict[Tuple[str, bool], Callable[[Any], Any]] = {
+    ("int", True): parse_int,
+    ("int", False): parse_int,
+    ("datetime", True): parse_datetime_memo,
+    ("datetime", False): parse_datetime_memo,
+    ("str", True): parse_str,
+    ("str", False): parse_str_raw,
+}
+
+# Políticas ante un id ya existente (ver Validator.insert_sql)
+CONFLICT_POLICIES = ("ignore", "update_if_changed", "replace")
+
+# Tipo Postgres de cada array en el insert por columnas
+_PG_ARRAY_TYPES: Dict[str, str] = {"int": "integer[]", "str": "text[]", "datetime": "timestamptz[]"}
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    type: str                 # int | str | datetime
+    reason: str               # motivo si falta o no parsea
+    required: bool = True
+    strip: bool = True        # solo aplica a str
+
+
+@dataclass(frozen=True)
+class Reference:
+    field: str
+    table: str                # tabla referenciada (por id)
+    reason: str
+
+
+@dataclass(frozen=True)
+class Check:
+    reason: str
+    predicate: Callable[[Dict[str, Any]], bool]   # recibe los valores ya tipados (por nombre)
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    table: str
+    fields: Tuple[Field, ...]
+    references: Tuple[Reference, ...] = ()
+    checks: Tuple[Check, ...] = ()
+    key: str = "id"
+
+    @property
+    def columns(self) -> List[str]:
+        return [f.name for f in self.fields]
+
+
+SPECS: Dict[str, TableSpec] = {
+    "departments": TableSpec(
+        table="departments",
+        fields=(
+            Field("id", "int", "invalid_id"),
+            Field("department", "str", "empty_department"),
+        ),
+    ),
+    "jobs": TableSpec(
+        table="jobs",
+        fields=(
+            Field("id", "int", "invalid_id"),
+            Field("job", "str", "empty_job"),
+        ),
+    ),
+    "hired_employees": TableSpec(
+        table="hired_employees",
+        fields=(
+            Field("id", "int", "invalid_id"),
+            Field("name", "str", "empty_name"),
+            Field("datetime", "datetime", "invalid_datetime"),
+            Field("department_id", "int", "missing_department_id"),
+            Field("job_id", "int", "missing_job_id"),
+        ),
+        references=(
+            Reference("department_id", "departments", "department_fk_not_found"),
+            Reference("job_id", "jobs", "job_fk_not_found"),
+        ),
+    ),
+}
+
+
+# =========================
+# Compilación
+# =========================
+def _parse_lines(i: int, f: Field, positional: bool) -> List[str]:
+    """
+    Código de parseo del campo i. Para el caso común (str que llega como str) se
+    inlinea el parseo y se evita una llamada a función por celda; cualquier otro
+    tipo de entrada cae en el parser genérico _p{i} (misma semántica).
+    """
+    get = f"raw[{i}]" if positional else f"get({f.name!r})"
+    if f.type == "int":
+        # int() ya tolera espacios alrededor, equivalente a str(v).strip()
+        return [
+            f"    v{i} = {get}",
+            f"    if v{i}.__class__ is str:",
+            f"        try: v{i} = int(v{i})",
+            f"        except ValueError: v{i} = None",
+            f"    elif v{i}.__class__ is not int: v{i} = _p{i}(v{i})",
+        ]
+    if f.type == "str":
+        method = ".strip()" if f.strip else ""
+        return [
+            f"    v{i} = {get}",
+            f"    v{i} = v{i}{method} if v{i}.__class__ is str else _p{i}(v{i})",
+        ]
+    return [f"    v{i} = _p{i}({get})"]
+
+
+def _compile_row_validator(spec: TableSpec, collect_all: bool, positional: bool) -> Callable[[Any], RowResult]:
+    """
+    Genera el código fuente de la función de validación y lo compila.
+    - collect_all=False: corta en el primer motivo (los tuples de motivo son constantes).
+    - collect_all=True: acumula todos los motivos de campos; los checks custom solo se
+      evalúan si todos los campos parsean.
+    - positional=True: la fila es una tupla en el orden de spec.fields (lector CSV);
+      si no, un mapping por nombre de columna (/transactions).
+    """
+    ns: Dict[str, Any] = {"_OK": ()}
+    body: List[str] = ["def _validate(raw):"] if positional else ["def _validate(raw):", "    get = raw.get"]
+    if collect_all:
+        body.append("    reasons = []")
+
+    for i, f in enumerate(spec.fields):
+        parser = _PARSERS.get((f.type, f.strip))
+        if parser is None:
+            raise ValueError(f"tipo no soportado: {f.type}")
+        ns[f"_p{i}"] = parser
+        ns[f"_r{i}"] = (f.reason,)
+        body.extend(_parse_lines(i, f, positional))
+
+        if f.type == "str":
+            missing = f"not v{i}"
+            if not f.required:
+                body.append(f"    v{i} = v{i} or None")
+        else:
+            missing = f"v{i} is None"
+
+        if f.required:
+            if collect_all:
+                body.append(f"    if {missing}: reasons.append({f.reason!r})")
+            else:
+                body.append(f"    if {missing}: return None, _r{i}")
+
+    if collect_all:
+        body.append("    if reasons: return None, tuple(reasons)")
+
+    body.append(f"    values = ({''.join(f'v{i}, ' for i in range(len(spec.fields)))})")
+
+    if spec.checks:
+        # los predicados reciben los valores por nombre; el dict solo existe si hay checks
+        named = ", ".join(f"{f.name!r}: v{i}" for i, f in enumerate(spec.fields))
+        body.append(f"    named = {{{named}}}")
+    for i, c in enumerate(spec.checks):
+        ns[f"_c{i}"] = c.predicate
+        ns[f"_cr{i}"] = (c.reason,)
+        if collect_all:
+            body.append(f"    if not _c{i}(named): reasons.append({c.reason!r})")
+        else:
+            body.append(f"    if not _c{i}(named): return None, _cr{i}")
+
+    if collect_all and spec.checks:
+        body.append("    if reasons: return None, tuple(reasons)")
+    body.append("    return values, _OK")
+
+    source = "\n".join(body)
+    exec(compile(source, f"<validator:{spec.table}>", "exec"), ns)
+    fn = ns["_validate"]
+    fn.__source__ = source  # útil para depurar reglas
+    return fn
+
+
+def row_hash_sql(spec: TableSpec, alias: str) -> str:
+    """
+    Expresión SQL del row_hash (md5 como uuid) sobre las columnas no clave.
+    Los datetime se normalizan a texto UTC para no depender del TimeZone de la sesión.
+    La misma expresión se usa en el backfill de la migración que agrega row_hash.
+    """
+    parts = []
+    for f in spec.fields:
+        if f.name == spec.key:
+            continue
+        col = f"{alias}.{f.name}"
+        if f.type == "datetime":
+            col = f"to_char({col} AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US')"
+        parts.append(col)
+    return f"md5(json_build_array({', '.join(parts)})::text)::uuid"
+
+
+@lru_cache(maxsize=None)
+def _lookup_sql(tables: Tuple[str, ...]) -> str:
+    # bigint[]: un id fuera de rango de integer simplemente no se encuentra (no rompe el cast)
+    return " UNION ALL ".join(
+        f"SELECT {n} AS t, id FROM {table} WHERE id = ANY(CAST(:ids{n} AS bigint[]))"
+        for n, table in enumerate(tables)
+    )
+
+
+class ReferenceResolver:
+    """IDs referenciados ya resueltos (existentes/faltantes): solo se consulta a la DB por IDs nuevos."""
+
+    def __init__(self) -> None:
+        self.found: Dict[str, set] = {}
+        self.missing: Dict[str, set] = {}
+        # compartible entre hilos (ingesta multi-archivo); la consulta va fuera del lock
+        self._lock = threading.Lock()
+
+    def existing(self, session: Session, table: str, ids: Iterable[int]) -> set:
+        return self.existing_many(session, {table: ids})[table]
+
+    def existing_many(self, session: Session, wanted: Dict[str, Iterable[int]]) -> Dict[str, set]:
+        """
+        Igual que existing para varias tablas a la vez: los IDs nuevos de todas van en un
+        único statement (UNION ALL de un lookup por tabla), un solo round-trip por lote.
+        """
+        tables = tuple(wanted)
+        with self._lock:
+            found = {t: self.found.setdefault(t, set()) for t in tables}
+            missing = {t: self.missing.setdefault(t, set()) for t in tables}
+            unknown = {
+                t: [i for i in set(wanted[t]) if i not in found[t] and i not in missing[t]] for t in tables
+            }
+        if any(unknown.values()):
+            # todas las tablas siempre (array vacío si no hay nada que buscar): mismo SQL, mismo prepared
+            rows = prepared.execute(
+                session, _lookup_sql(tables), {f"ids{n}": unknown[t] for n, t in enumerate(tables)}
+            ).fetchall()
+            hit: Dict[str, set] = {t: set() for t in tables}
+            for n, i in rows:
+                hit[tables[n]].add(i)
+            with self._lock:
+                for t in tables:
+                    found[t] |= hit[t]
+                    missing[t].update(i for i in unknown[t] if i not in hit[t])
+        return found
+
+
+class ParsedRows:
+    """
+    Filas que pasaron la fase 1: tuplas de valores (orden spec.columns) y, si la tabla
+    tiene FKs, la posición de cada una en la entrada (array de enteros de 4 bytes) para
+    recuperar la fila original solo si después se rechaza.
+    """
+
+    __slots__ = ("values", "positions")
+
+    def __init__(self, track_positions: bool) -> None:
+        self.values: List[Values] = []
+        self.positions: Optional[array] = array("I") if track_positions else None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+@dataclass
+class Validator:
+    spec: TableSpec
+    collect_all: bool
+    row: Callable[[Any], RowResult] = field(repr=False)
+
+    def validate_rows(
+        self, rows: Iterable[RawRow]
+    ) -> Tuple[ParsedRows, List[Tuple[Tuple[str, ...], RawRow]], Dict[str, int]]:
+        """
+        Fase 1 (sin DB): tipos, obligatoriedad y checks. Devuelve (parseadas, rechazos, motivos).
+        Si la tabla tiene FKs, rows debe ser una secuencia (check_references vuelve a ella).
+        """
+        check = self.row
+        parsed = ParsedRows(track_positions=bool(self.spec.references))
+        append = parsed.values.append
+        track = parsed.positions.append if parsed.positions is not None else None
+        rejects: List[Tuple[Tuple[str, ...], RawRow]] = []
+        reasons: Dict[str, int] = {}
+        for pos, raw in enumerate(rows):
+            values, why = check(raw)
+            if why:
+                rejects.append((why, raw))
+                for r in why:
+                    reasons[r] = reasons.get(r, 0) + 1
+            else:
+                append(values)
+                if track is not None:
+                    track(pos)
+        return parsed, rejects, reasons
+
+    def check_references(
+        self,
+        session: Session,
+        parsed: ParsedRows,
+        rows: Sequence[RawRow],
+        rejects: List[Tuple[Tuple[str, ...], RawRow]],
+        reasons: Dict[str, int],
+        resolver: Optional[ReferenceResolver] = None,
+    ) -> List[Values]:
+        """
+        Fase 2: integridad referencial (solo IDs involucrados). rows es la misma entrada
+        de validate_rows. Agrega a rejects/reasons y devuelve las tuplas válidas.
+        """
+        refs = self.spec.references
+        if not refs:
+            return parsed.values
+
+        resolver = resolver or ReferenceResolver()
+        columns = self.spec.columns
+        index = [columns.index(ref.field) for ref in refs]
+        wanted = {ref.table: {values[i] for values in parsed.values} for ref, i in zip(refs, index)}
+        # todas las FKs del lote en un round-trip
+        existing = resolver.existing_many(session, wanted) if parsed.values else {}
+        checks = [(i, ref.reason, existing.get(ref.table, set())) for ref, i in zip(refs, index)]
+
+        valid: List[Values] = []
+        for values, pos in zip(parsed.values, parsed.positions):
+            failed: List[str] = []
+            for i, reason, ok_ids in checks:
+                if values[i] not in ok_ids:
+                    failed.append(reason)
+                    if not self.collect_all:
+                        break
+            if failed:
+                rejects.append((tuple(failed), rows[pos]))
+                for r in failed:
+                    reasons[r] = reasons.get(r, 0) + 1
+            else:
+                valid.append(values)
+        return valid
+
+    def insert_sql(self, conflict: str = "ignore") -> str:
+        """
+        Merge por columnas: un array por columna y unnest en el servidor, así un lote es
+        un solo statement y no hace falta un dict de parámetros por fila.
+        Política ante un id existente (conflict):
+        - ignore: se conserva la fila existente (ON CONFLICT DO NOTHING).
+        - update_if_changed: se reescribe solo si cambió el contenido (row_hash distinto),
+          así una carga de correcciones solo toca las páginas de las filas corregidas.
+        - replace: se reescribe siempre.
+        El mismo statement devuelve una sola fila con los conteos reales (RETURNING agregado
+        en el servidor): inserted y updated (xmax = 0 distingue insert de update); el resto
+        del lote son ids existentes sin cambios (o ignorados).
+        """
+        if conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"política de conflicto no soportada: {conflict}")
+        spec = self.spec
+        key = spec.key
+        cols = ", ".join(spec.columns)
+        arrays = ", ".join(f"CAST(:c{i} AS {_PG_ARRAY_TYPES[f.type]})" for i, f in enumerate(spec.fields))
+        sql = (
+            f"WITH v AS (SELECT * FROM unnest({arrays}) AS v({cols})), "
+            f"merged AS (INSERT INTO {spec.table} AS t ({cols}, row_hash) "
+            f"SELECT v.*, {row_hash_sql(spec, 'v')} FROM v "
+            f"ON CONFLICT ({key}) "
+        )
+        if conflict == "ignore":
+            sql += "DO NOTHING"
+        else:
+            sets = ", ".join(f"{c} = EXCLUDED.{c}" for c in spec.columns if c != key)
+            sql += f"DO UPDATE SET {sets}, row_hash = EXCLUDED.row_hash"
+            if conflict == "update_if_changed":
+                sql += " WHERE t.row_hash IS DISTINCT FROM EXCLUDED.row_hash"
+        sql += (
+            f" RETURNING t.{key}, (t.xmax = 0) AS ins) "
+            "SELECT count(*) FILTER (WHERE ins) AS inserted, count(*) FILTER (WHERE NOT ins) AS updated"
+        )
+        return sql + " FROM merged"
+
+    def merge(self, session: Session, batch: Sequence[Values], conflict: str = "ignore") -> "MergeResult":
+        """
+        Ejecuta insert_sql para un lote (un round-trip, como sentencia preparada) y devuelve
+        los conteos reales.
+        Un id repetido dentro del lote se descarta antes de enviarlo. Con ignore gana la primera
+        aparición y las demás se informan como duplicate_id; con update/replace gana la última y
+        las versiones reemplazadas no son rechazo DQ (misma regla que RunDedup entre lotes), solo
+        suman a skipped.
+        Los ids que ya existían en la tabla no son un problema de calidad (re-ingesta idempotente):
+        solo suman a unchanged/skipped, sin rechazo DQ.
+        Un lote vacío no va a la DB (sin filas no hay arrays c0..cn para el statement).
+        """
+        if not batch:
+            return MergeResult(0, 0, 0, [])
+        key = self.spec.columns.index(self.spec.key)
+        unique: Dict[Any, Values] = {}
+        duplicates: List[Tuple[str, Values]] = []
+        superseded = 0
+        for values in batch:
+            k = values[key]
+            if k in unique:
+                if conflict == "ignore":
+                    duplicates.append(("duplicate_id", values))
+                    continue
+                superseded += 1
+            unique[k] = values
+
+        rows = list(unique.values())
+        params = {f"c{i}": list(col) for i, col in enumerate(zip(*rows))}
+        out = prepared.execute(session, self.insert_sql(conflict), params).mappings().one()
+
+        unchanged = len(rows) - out["inserted"] - out["updated"]
+        return MergeResult(out["inserted"], out["updated"], unchanged, duplicates, superseded)
+
+    def as_dict(self, values: Values) -> Dict[str, Any]:
+        """Valores tipados como dict serializable (row_data de rechazos posteriores a la validación)."""
+        return {c: (v.isoformat() if hasattr(v, "isoformat") else v) for c, v in zip(self.spec.columns, values)}
+
+
+@dataclass
+class MergeResult:
+    inserted: int
+    updated: int
+    unchanged: int                              # id existente sin cambios (o ignorado)
+    duplicates: List[Tuple[str, Values]]        # (motivo DQ, valores) de las filas no escritas
+    superseded: int = 0                         # versiones reemplazadas en el lote (update/replace)
+
+    @property
+    def skipped(self) -> int:
+        return self.unchanged + self.superseded + sum(1 for reason, _ in self.duplicates if reason == "duplicate_id")
+
+
+@lru_cache(maxsize=None)
+def get_validator(table: str, collect_all: bool = False, positional: bool = False) -> Validator:
+    """Validador compilado (y cacheado) para la tabla. KeyError si la tabla no tiene spec."""
+    spec = SPECS[table]
+    return Validator(spec=spec, collect_all=collect_all, row=_compile_row_validator(spec, collect_all, positional))
@@ -0,0 +1,164 @@
+﻿import logging
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.admission import BULK, Rejected, controller as admission
+from src.db import SessionLocal
+from src.ingestion import INGEST_FILE_WORKERS, ingest_hired_employees_files, processed_sources
+from src.sources import expand
+
+logger = logging.getLogger(__name__)
+
+# Resultados recientes que guarda cada watcher para GET /ingest/watch
+WATCH_HISTORY = 20
+
+
+class FileWatcher:
+    """
+    Polling de una fuente multi-archivo (directorio o glob) de hired_employees.
+    - Un archivo se ingesta cuando su tamaño no cambió entre dos polls (terminó de llegar).
+    - Los ya vistos se recuerdan en memoria; al arrancar, los que ya tienen una corrida
+      completa en ingestion_checkpoints se marcan como vistos sin re-procesarlos.
+    - Cada poll con archivos nuevos es una corrida (run_id) y pasa por el control de admisión.
+    """
+
+    def __init__(self, source: str, interval: float, conflict: str, workers: int = INGEST_FILE_WORKERS) -> None:
+        self.source = source
+        self.interval = interval
+        self.conflict = conflict
+        self.workers = workers
+        self.seen: set = set()
+        self.polls = 0
+        self.last_error: Optional[str] = None
+        self.history: List[Dict[str, Any]] = []
+        self._sizes: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"watch:{source}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 5)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                self.last_error = None
+            except Exception as exc:
+                logger.exception("watcher %s: poll fallido", self.source)
+                self.last_error = str(exc)[:1000]
+            self._stop.wait(self.interval)
+
+    def _ready(self, paths: List[Path]) -> List[Path]:
+        ready = []
+        sizes = {}
+        for p in paths:
+            key = str(p.resolve())
+            if key in self.seen:
+                continue
+            sizes[key] = p.stat().st_size
+            if self._sizes.get(key) == sizes[key]:
+                ready.append(p)
+        self._sizes = sizes
+        return ready
+
+    def poll(self) -> Optional[Dict[str, Any]]:
+        self.polls += 1
+        ready = self._ready(expand(self.source))
+        if not ready:
+            return None
+
+        with SessionLocal() as session:
+            done = processed_sources(session, "hired_employees", [str(p.resolve()) for p in ready])
+        self.seen |= done
+        new = [p for p in ready if str(p.resolve()) not in done]
+        if not new:
+            return None
+
+        run_id = str(uuid.uuid4())
+        try:
+            with admission.admit("ingest", BULK):
+                result = ingest_hired_employees_files(
+                    new, run_id, conflict=self.conflict, workers=self.workers, skip_processed=False
+                )
+        except Rejected:
+            # sin capacidad: los archivos quedan para el próximo poll
+            return None
+
+        # los fallidos no se marcan: se reintentan en el próximo poll. Un error sin ruta (o de la
+        # corrida entera) no dice qué archivo falló: se reintentan todos
+        errors = [r for r in result.get("results", []) if r.get("status") == "error"]
+        if result.get("status") == "error" or any(not r.get("path") for r in errors):
+            failed = {str(p.resolve()) for p in new}
+        else:
+            failed = {r["path"] for r in errors}
+        self.seen |= {str(p.resolve()) for p in new} - failed
+        self.history = (self.history + [{
+            "run_id": run_id,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "files": [p.name for p in new],
+            "inserted": result.get("inserted", 0),
+            "rejected": result.get("rejected", 0),
+            "failed": len(failed),
+        }])[-WATCH_HISTORY:]
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "running": self.running,
+            "interval": self.interval,
+            "conflict": self.conflict,
+            "polls": self.polls,
+            "seen_files": len(self.seen),
+            "last_error": self.last_error,
+            "recent_runs": self.history,
+        }
+
+
+_watchers: Dict[str, FileWatcher] = {}
+_lock = threading.Lock()
+
+
+def start_watch(source: str, interval: float, conflict: str = "ignore") -> Dict[str, Any]:
+    expand(source)  # valida la fuente antes de arrancar el hilo
+    with _lock:
+        current = _watchers.get(source)
+        if current is not None and current.running:
+            return {"status": "already_running", **current.status()}
+        watcher = _watchers[source] = FileWatcher(source, interval, conflict)
+        watcher.start()
+    return {"status": "started", **watcher.status()}
+
+
+def stop_watch(source: str) -> Dict[str, Any]:
+    with _lock:
+        watcher = _watchers.pop(source, None)
+    if watcher is None:
+        return {"status": "error", "error": "watcher no encontrado", "source": source}
+    watcher.stop()
+    return {"status": "stopped", **watcher.status()}
+
+
+def watch_status() -> Dict[str, Any]:
+    with _lock:
+        watchers = list(_watchers.values())
+    return {"watchers": [w.status() for w in watchers]}
+
+
+def stop_all() -> None:
+    with _lock:
+        watchers = list(_watchers.values())
+        _watchers.clear()
+    for watcher in watchers:
+        watcher.stop()
@@ -0,0 +1,96 @@
+import tracemalloc
+
+import src.dedup as dedup
+import src.prepared as prepared
+from src.dedup import RunDedup
+from src.validation import SPECS, get_validator
+
+
+def _row(i, name="a", dept="1"):
+    return {"id": str(i), "name": name, "datetime": "2021-01-01T00:00:00Z", "department_id": dept, "job_id": "1"}
+
+
+def _filter(d, rows, conflict="ignore"):
+    parsed, _, _ = get_validator("hired_employees").validate_rows(rows)
+    return [reason for reason, _ in d.filter(parsed, conflict)], parsed
+
+
+def test_single_large_id_stays_small():
+    tracemalloc.start()
+    d = RunDedup(SPECS["hired_employees"])
+    _filter(d, [_row(60_000_000)])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 1_000_000
+    assert len(d.dense) <= 1
+
+
+def test_duplicate_row_and_id_with_ignore():
+    d = RunDedup(SPECS["hired_employees"])
+    reasons, parsed = _filter(d, [_row(1), _row(1), _row(1, "b"), _row(2)])
+    assert reasons == ["duplicate_row", "duplicate_id"]
+    assert [v[0] for v in parsed.values] == [1, 2]
+    assert list(parsed.positions) == [0, 3]
+
+
+def test_changed_row_passes_with_update():
+    d = RunDedup(SPECS["hired_employees"])
+    reasons, parsed = _filter(d, [_row(1), _row(1, "b"), _row(1, "b")], "update_if_changed")
+    assert reasons == ["duplicate_row"]
+    assert [v[1] for v in parsed.values] == ["a", "b"]
+
+
+def test_digest_collision_on_low_bits_is_not_a_duplicate_row(monkeypatch):
+    # mismos 16 bits bajos, distinto digest de 64 bits: no se descarta
+    digests = iter([0x10001, 0x20001])
+    monkeypatch.setattr(dedup, "_digest64", lambda data: next(digests))
+    d = RunDedup(SPECS["hired_employees"])
+    reasons, parsed = _filter(d, [_row(1), _row(1, "b")], "replace")
+    assert reasons == []
+    assert len(parsed.values) == 2
+
+
+def test_sparse_ids_move_into_window_and_cross_batches():
+    d = RunDedup(SPECS["hired_employees"])
+    _filter(d, [_row(5), _row(10_000_000)])
+    _filter(d, [_row(i) for i in range(1, 100)])
+    reasons, _ = _filter(d, [_row(5), _row(10_000_000, "x")])
+    assert reasons == ["duplicate_row", "duplicate_id"]
+
+
+def test_superseded_versions_are_not_rejections_in_batch_or_across_batches(monkeypatch):
+    sent = []
+
+    class _Result:
+        def mappings(self):
+            return self
+
+        def one(self):
+            return {"inserted": len(sent[-1]["c0"]), "updated": 0}
+
+    def _execute(session, sql, params):
+        sent.append(params)
+        return _Result()
+
+    monkeypatch.setattr(prepared, "execute", _execute)
+    validator = get_validator("hired_employees")
+    d = RunDedup(SPECS["hired_employees"])
+
+    # entre lotes: la nueva versión pasa sin rechazo
+    _filter(d, [_row(1)], "replace")
+    reasons, _ = _filter(d, [_row(1, "b")], "replace")
+    assert reasons == []
+
+    # dentro del lote: gana la última, tampoco hay rechazo
+    reasons, parsed = _filter(d, [_row(2), _row(2, "c")], "replace")
+    assert reasons == []
+    res = validator.merge(None, parsed.values, "replace")
+    assert res.duplicates == []
+    assert res.superseded == 1 and res.skipped == 1
+    assert sent[-1]["c1"] == ["c"]
+
+
+def test_merge_of_empty_batch_does_not_hit_the_db(monkeypatch):
+    monkeypatch.setattr(prepared, "execute", lambda *a: (_ for _ in ()).throw(AssertionError("execute")))
+    res = get_validator("jobs").merge(None, [], "update_if_changed")
+    assert (res.inserted, res.updated, res.skipped, res.duplicates) == (0, 0, 0, [])
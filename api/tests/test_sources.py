@@ -0,0 +1,43 @@
+import pytest
+
+import src.sources as sources
+
+
+@pytest.fixture
+def roots(tmp_path, monkeypatch):
+    data, store = tmp_path / "data", tmp_path / "objects"
+    (data / "drops").mkdir(parents=True)
+    (store / "bucket").mkdir(parents=True)
+    (data / "drops" / "a.csv").write_text("x\n")
+    (store / "bucket" / "b.csv.gz").write_bytes(b"")
+    (tmp_path / "secret.csv").write_text("x\n")
+    monkeypatch.setattr(sources, "DATA_DIR", data)
+    monkeypatch.setattr(sources, "OBJECT_STORE_ROOT", store)
+    return tmp_path
+
+
+def test_relative_and_store_paths(roots):
+    assert sources.resolve("drops/a.csv") == (roots / "data" / "drops" / "a.csv").resolve()
+    assert sources.resolve("store://bucket/b.csv.gz") == (roots / "objects" / "bucket" / "b.csv.gz").resolve()
+
+
+@pytest.mark.parametrize("uri", ["../secret.csv", "drops/../../secret.csv", "store://../secret.csv"])
+def test_parent_traversal_is_rejected(roots, uri):
+    with pytest.raises(ValueError):
+        sources.resolve(uri)
+
+
+def test_absolute_paths_only_inside_roots(roots):
+    inside = roots / "data" / "drops" / "a.csv"
+    assert sources.resolve(str(inside)) == inside.resolve()
+    for uri in ["/etc/passwd", str(roots / "secret.csv"), str(roots / "data" / ".." / "secret.csv")]:
+        with pytest.raises(ValueError):
+            sources.resolve(uri)
+
+
+def test_expand_rejects_outside_roots(roots):
+    with pytest.raises(ValueError):
+        sources.expand("/etc/*.conf")
+    with pytest.raises(ValueError):
+        sources.expand("../*.csv")
+    assert sources.expand("drops/*.csv") == [(roots / "data" / "drops" / "a.csv").resolve()]